@@ -0,0 +1,34 @@
+"""Add exchange_rates table
+
+Revision ID: 012
+Revises: 011
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '012'
+down_revision = '011'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Daily exchange rate snapshots, quoted against a base currency (USD)
+    op.create_table(
+        'exchange_rates',
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('base', sa.String(3), nullable=False),
+        sa.Column('quote', sa.String(3), nullable=False),
+        sa.Column('rate', sa.Numeric(24, 10), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        # (base, quote, date) serves the "latest rate on or before a date" lookup
+        sa.PrimaryKeyConstraint('base', 'quote', 'date', name='pk_exchange_rates'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('exchange_rates')
@@ -0,0 +1,47 @@
+"""Add materialized amount_idr to expenses
+
+Revision ID: 013
+Revises: 012
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '013'
+down_revision = '012'
+branch_labels = None
+depends_on = None
+
+
+def _usd_rate_as_of(quote_sql: str) -> str:
+    # Latest stored USD-based rate on or before the expense date
+    return (
+        "(SELECT r.rate FROM exchange_rates r "
+        f"WHERE r.base = 'USD' AND r.quote = {quote_sql} AND r.date <= expenses.date "
+        "ORDER BY r.date DESC LIMIT 1)"
+    )
+
+
+def upgrade() -> None:
+    op.add_column('expenses', sa.Column('amount_idr', sa.Numeric(18, 2), nullable=True))
+    op.create_index('ix_expenses_amount_idr', 'expenses', ['amount_idr'])
+
+    # Backfill IDR expenses as-is, and others from the stored rate history.
+    # Rows without a covering rate stay NULL until the rate refresher or
+    # scripts/rerate_expenses.py fills them in.
+    op.execute("UPDATE expenses SET amount_idr = amount WHERE UPPER(currency) = 'IDR'")
+    idr_rate = _usd_rate_as_of("'IDR'")
+    currency_rate = _usd_rate_as_of("UPPER(expenses.currency)")
+    # * 1.0 so SQLite doesn't do integer division on whole-number rates
+    op.execute(
+        f"UPDATE expenses SET amount_idr = ROUND(amount * {idr_rate} / ({currency_rate} * 1.0), 2) "
+        "WHERE amount_idr IS NULL"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_expenses_amount_idr', table_name='expenses')
+    op.drop_column('expenses', 'amount_idr')
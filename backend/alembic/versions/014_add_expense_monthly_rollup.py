@@ -0,0 +1,76 @@
+"""Add expense_monthly_rollup table
+
+Revision ID: 014
+Revises: 013
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+import uuid
+
+
+# revision identifiers, used by Alembic.
+revision = '014'
+down_revision = '013'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    rollup = op.create_table(
+        'expense_monthly_rollup',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('year', sa.Integer(), nullable=False),
+        sa.Column('month', sa.Integer(), nullable=False),
+        sa.Column('category_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('currency', sa.String(3), nullable=False),
+        sa.Column('total', sa.Numeric(18, 2), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.Column('total_idr', sa.Numeric(18, 2), nullable=False),
+        sa.Column('unrated_total', sa.Numeric(18, 2), nullable=False),
+        sa.ForeignKeyConstraint(['category_id'], ['categories.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_expense_monthly_rollup_period', 'expense_monthly_rollup', ['year', 'month'])
+
+    # Backfill from existing expenses
+    expenses = sa.table(
+        'expenses',
+        sa.column('date', sa.Date),
+        sa.column('category_id', postgresql.UUID(as_uuid=True)),
+        sa.column('currency', sa.String),
+        sa.column('amount', sa.Numeric),
+        sa.column('amount_idr', sa.Numeric),
+    )
+    year = sa.extract('year', expenses.c.date)
+    month = sa.extract('month', expenses.c.date)
+    unrated = sa.case((expenses.c.amount_idr.is_(None), expenses.c.amount), else_=0)
+    groups = op.get_bind().execute(
+        sa.select(
+            year, month, expenses.c.category_id, expenses.c.currency,
+            sa.func.sum(expenses.c.amount), sa.func.count(),
+            sa.func.coalesce(sa.func.sum(expenses.c.amount_idr), 0), sa.func.sum(unrated)
+        ).group_by(year, month, expenses.c.category_id, expenses.c.currency)
+    ).fetchall()
+    if groups:
+        op.bulk_insert(rollup, [
+            {
+                'id': uuid.uuid4(),
+                'year': int(g[0]),
+                'month': int(g[1]),
+                'category_id': g[2],
+                'currency': g[3],
+                'total': g[4],
+                'count': g[5],
+                'total_idr': g[6],
+                'unrated_total': g[7],
+            }
+            for g in groups
+        ])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_expense_monthly_rollup_period', table_name='expense_monthly_rollup')
+    op.drop_table('expense_monthly_rollup')
@@ -0,0 +1,37 @@
+"""Add composite index for keyset pagination of expenses
+
+Revision ID: 015
+Revises: 014
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '015'
+down_revision = '014'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    existing_indexes = {idx.get('name') for idx in inspector.get_indexes('expenses')}
+
+    # Matches GET /expenses ordering (date desc, created_at desc nulls last, id desc),
+    # so cursor pages are read straight off the index
+    if 'ix_expenses_date_created_id' not in existing_indexes:
+        if bind.dialect.name == 'postgresql':
+            op.execute(
+                'CREATE INDEX ix_expenses_date_created_id '
+                'ON expenses (date DESC, created_at DESC NULLS LAST, id DESC)'
+            )
+        else:
+            # SQLite sorts NULLs first ascending, i.e. last when scanned descending
+            op.create_index('ix_expenses_date_created_id', 'expenses', ['date', 'created_at', 'id'])
+
+
+def downgrade() -> None:
+    op.execute('DROP INDEX IF EXISTS ix_expenses_date_created_id')
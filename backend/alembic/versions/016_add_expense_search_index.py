@@ -0,0 +1,66 @@
+"""Add full-text search indexes on expense descriptions
+
+Revision ID: 016
+Revises: 015
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '016'
+down_revision = '015'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        # Word and prefix matches (must match app.services.search.description_tsvector)
+        op.execute(
+            "CREATE INDEX IF NOT EXISTS ix_expenses_description_fts "
+            "ON expenses USING gin (to_tsvector('simple', description))"
+        )
+        # Substring matches: pg_trgm lets GIN serve ILIKE '%term%'
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.execute(
+            'CREATE INDEX IF NOT EXISTS ix_expenses_description_trgm '
+            'ON expenses USING gin (description gin_trgm_ops)'
+        )
+    elif bind.dialect.name == 'sqlite':
+        # Trigram tokens make MATCH a case-insensitive substring search (SQLite 3.34+)
+        op.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS expenses_fts "
+            "USING fts5(expense_id UNINDEXED, description, tokenize='trigram')"
+        )
+        op.execute('DELETE FROM expenses_fts')
+        op.execute('INSERT INTO expenses_fts (expense_id, description) SELECT id, description FROM expenses')
+        op.execute(
+            'CREATE TRIGGER IF NOT EXISTS expenses_fts_insert AFTER INSERT ON expenses BEGIN '
+            'INSERT INTO expenses_fts (expense_id, description) VALUES (new.id, new.description); '
+            'END'
+        )
+        op.execute(
+            'CREATE TRIGGER IF NOT EXISTS expenses_fts_update AFTER UPDATE OF id, description ON expenses BEGIN '
+            'UPDATE expenses_fts SET expense_id = new.id, description = new.description WHERE expense_id = old.id; '
+            'END'
+        )
+        op.execute(
+            'CREATE TRIGGER IF NOT EXISTS expenses_fts_delete AFTER DELETE ON expenses BEGIN '
+            'DELETE FROM expenses_fts WHERE expense_id = old.id; '
+            'END'
+        )
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_expenses_description_trgm')
+        op.execute('DROP INDEX IF EXISTS ix_expenses_description_fts')
+    elif bind.dialect.name == 'sqlite':
+        op.execute('DROP TRIGGER IF EXISTS expenses_fts_delete')
+        op.execute('DROP TRIGGER IF EXISTS expenses_fts_update')
+        op.execute('DROP TRIGGER IF EXISTS expenses_fts_insert')
+        op.execute('DROP TABLE IF EXISTS expenses_fts')
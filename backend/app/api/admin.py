@@ -6,6 +6,9 @@ import os
 from app.database import get_db
 from app.models.expense import Expense
 from app.models.category import Category
+from app.models.expense_rollup import ExpenseMonthlyRollup
+from app.services.analytics import analytics_snapshot
+from app.services.cache import cache
 from app.core.auth import get_current_user
 from app.models.user import User
 
@@ -19,8 +22,9 @@ async def delete_all_data(
 ):
     """Delete all expenses and custom categories (keeps default categories)"""
     try:
-        # Delete all expenses
+        # Delete all expenses and their monthly rollups
         db.query(Expense).delete()
+        db.query(ExpenseMonthlyRollup).delete()
 
         # Delete custom categories (keep default ones)
         db.query(Category).filter(Category.is_default == False).delete()
@@ -37,6 +41,8 @@ async def delete_all_data(
                         pass
         
         db.commit()
+        analytics_snapshot.invalidate()
+        cache.invalidate_tags("dashboard")
         
         return {
             "message": "All data deleted successfully",
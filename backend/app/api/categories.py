@@ -5,9 +5,13 @@ from uuid import UUID
 
 from app.database import get_db
 from app.models.category import Category
+from app.models.expense import Expense
+from app.models.expense_rollup import ExpenseMonthlyRollup
 from app.models.user import User
 from app.schemas.category import CategoryCreate, CategoryUpdate, CategoryResponse
 from app.core.auth import get_current_user
+from app.services.analytics import analytics_snapshot
+from app.services.cache import cache
 
 router = APIRouter()
 
@@ -65,6 +69,10 @@ async def update_category(
     
     db.commit()
     db.refresh(category)
+
+    # Cached dashboards embed category names
+    cache.invalidate_tags("dashboard")
+
     return category
 
 
@@ -82,6 +90,19 @@ async def delete_category(
     if category.is_default:
         raise HTTPException(status_code=400, detail="Cannot delete default category")
     
+    # Its expenses become uncategorized, and their rollup rows move to the
+    # uncategorized group in the same transaction (readers sum duplicate rows of a group)
+    db.query(Expense).filter(Expense.category_id == category_id).update(
+        {Expense.category_id: None}, synchronize_session=False
+    )
+    db.query(ExpenseMonthlyRollup).filter(ExpenseMonthlyRollup.category_id == category_id).update(
+        {ExpenseMonthlyRollup.category_id: None}, synchronize_session=False
+    )
     db.delete(category)
     db.commit()
+
+    # Every cached view with a category breakdown may have counted these expenses
+    cache.invalidate()
+    analytics_snapshot.invalidate()
+
     return None
@@ -2,7 +2,8 @@ from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models.user import User
-from app.services.currency import convert_currency
+from app.schemas.currency import ConvertBatchRequest, ConvertBatchResponse
+from app.services.currency import convert_currency, convert_currency_batch
 from app.core.auth import get_current_user
 
 router = APIRouter()
@@ -41,3 +42,48 @@ async def convert_to_idr(
             "converted_currency": "IDR",
             "error": str(e)
         }
+
+
+@router.post("/currency/convert-batch", response_model=ConvertBatchResponse)
+async def convert_batch(
+    request: ConvertBatchRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Convert many amounts in one request using the cached exchange rates.
+    Results are returned in the same order as the request items.
+    """
+    items = request.items
+    try:
+        converted, known = await convert_currency_batch(
+            [item.amount for item in items],
+            [item.from_currency for item in items],
+            [item.to_currency for item in items]
+        )
+    except Exception as e:
+        # Fallback: return originals if no rates are available at all
+        return {
+            "results": [
+                {
+                    "original_amount": item.amount,
+                    "original_currency": item.from_currency,
+                    "converted_amount": item.amount,
+                    "converted_currency": item.to_currency.upper(),
+                    "error": str(e)
+                }
+                for item in items
+            ]
+        }
+
+    return {
+        "results": [
+            {
+                "original_amount": item.amount,
+                "original_currency": item.from_currency,
+                "converted_amount": float(amount),
+                "converted_currency": item.to_currency.upper(),
+                "error": None if ok else f"Currency pair {item.from_currency}->{item.to_currency} not found in exchange rates"
+            }
+            for item, amount, ok in zip(items, converted.tolist(), known.tolist())
+        ]
+    }
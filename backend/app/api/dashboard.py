@@ -1,98 +1,394 @@
 from fastapi import APIRouter, Depends, Query
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm import Session
 from sqlalchemy import func, extract
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, timedelta
 from decimal import Decimal
-from typing import Optional
+from typing import Callable, List, Optional, Tuple
+import asyncio
+import functools
+import os
+import tempfile
 
-from app.database import get_db
+from app.database import SessionLocal
 from app.models.expense import Expense
+from app.models.category import Category
+from app.models.expense_rollup import ExpenseMonthlyRollup
 from app.models.user import User
-from app.services.cache import cache
-from app.services.currency import convert_currency
+from app.services.cache import cache, month_tag, month_tags
+from app.services.currency import get_conversion_rates, amount_idr_expr
+from app.services.rollup import rollup_amount_idr
+from app.services.analytics import analytics_snapshot, use_snapshot
+from app.services.warmup import CacheWarmer
 from app.core.auth import get_current_user
 
 router = APIRouter()
 
+# Dashboard payloads are fresh for 5 minutes, then served stale for up to
+# 10 more minutes while a single background task recomputes them
+DASHBOARD_TTL_SECONDS = 300
+DASHBOARD_STALE_TTL_SECONDS = 600
+
+# Days of history covered by the monthly trend, independent of the requested range
+TREND_WINDOW_DAYS = 180
+
+# Whole-month segments that payloads for any range are composed from. Writes evict
+# only their month's segment; the TTL bounds how long amounts of expenses without
+# a materialized IDR amount keep the rates they were converted at.
+DASHBOARD_SEGMENT_TTL_SECONDS = 1800
+
+# Newest expenses listed on the dashboard
+DASHBOARD_TOP_EXPENSES = 10
+
+# Independent dashboard queries run concurrently on this many threads, each with
+# its own session; keep it below the database connection pool size
+_query_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("DASHBOARD_QUERY_WORKERS", "4")),
+    thread_name_prefix="dashboard-query"
+)
+
 
 @router.get("/dashboard")
 async def get_dashboard_data(
     start_date: Optional[date] = Query(None, description="Start date for filtering expenses"),
     end_date: Optional[date] = Query(None, description="End date for filtering expenses"),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    engine: Optional[str] = Query(None, description="Execution engine: db or snapshot (default from REPORTS_ENGINE)"),
+    current_user: User = Depends(get_current_user)
 ):
     """
     Combined dashboard endpoint with caching.
     Returns summary, category breakdown, top expenses, and monthly trend in a single request.
     """
+    snapshot = use_snapshot(engine)
+    # Popular ranges are recomputed in the background after writes and at startup
+    dashboard_warmer.record((
+        start_date.isoformat() if start_date else None,
+        end_date.isoformat() if end_date else None,
+        snapshot
+    ))
+    return await cached_dashboard(start_date, end_date, snapshot)
 
+
+async def cached_dashboard(start_date: Optional[date], end_date: Optional[date], snapshot: bool = False) -> dict:
+    """Dashboard payload for a range, from the cache or computed once for concurrent callers"""
     # Generate cache key based on date range
-    cache_key = f"dashboard:{start_date}:{end_date}"
+    cache_key = f"dashboard:{start_date}:{end_date}:{'snapshot' if snapshot else 'db'}"
+
+    # Tag with every month the payload depends on (the requested range plus
+    # the trend window) so writes evict only what they touch
+    trend_start = date.today() - timedelta(days=TREND_WINDOW_DAYS)
+    tags = {"dashboard", *month_tags(start_date, end_date), *month_tags(trend_start, date.today())}
+
+    # Concurrent misses share one computation; stale entries are refreshed in the background
+    return await cache.get_or_compute(
+        cache_key,
+        lambda: compute_dashboard(start_date, end_date, snapshot),
+        ttl_seconds=DASHBOARD_TTL_SECONDS,
+        stale_ttl_seconds=DASHBOARD_STALE_TTL_SECONDS,
+        tags=tags
+    )
+
+
+async def _warm_dashboard(spec: Tuple) -> dict:
+    start_date, end_date, snapshot = spec
+    return await cached_dashboard(
+        date.fromisoformat(start_date) if start_date else None,
+        date.fromisoformat(end_date) if end_date else None,
+        snapshot
+    )
+
+
+dashboard_warmer = CacheWarmer(
+    "dashboard",
+    _warm_dashboard,
+    top_n=int(os.getenv("DASHBOARD_WARMUP_TOP_N", "10")),
+    debounce_seconds=float(os.getenv("DASHBOARD_WARMUP_DEBOUNCE_SECONDS", "2")),
+    state_path=os.getenv("DASHBOARD_WARMUP_STATE_PATH") or os.path.join(
+        tempfile.gettempdir(), "expense-tracker-dashboard-warmup.json"
+    )
+)
+
+
+async def compute_dashboard(start_date: Optional[date], end_date: Optional[date], snapshot: bool = False) -> dict:
+    """
+    Compute the dashboard payload. Its queries run on their own database sessions,
+    so it can also run as a background refresh after the request has finished.
+    """
+    return await _build_dashboard(start_date, end_date, snapshot)
+
+
+def _run_with_session(query: Callable, *args):
+    """Run query(db, *args) on a fresh session (called on a pool thread)"""
+    db = SessionLocal()
+    try:
+        return query(db, *args)
+    finally:
+        db.close()
+
+
+async def _run_queries(*calls: Tuple) -> list:
+    """
+    Run independent (query, *args) calls at the same time, each on its own session
+    and pooled connection, and return their results in order
+    """
+    loop = asyncio.get_running_loop()
+    return await asyncio.gather(*[
+        loop.run_in_executor(_query_pool, functools.partial(_run_with_session, query, *args))
+        for query, *args in calls
+    ])
+
+
+def _month_index(value: date) -> int:
+    """Month number in the rollup's year * 12 + month scheme"""
+    return value.year * 12 + value.month
+
+
+def _month_start(month_index: int) -> date:
+    return date((month_index - 1) // 12, (month_index - 1) % 12 + 1, 1)
+
+
+def _month_end(month_index: int) -> date:
+    return _month_start(month_index + 1) - timedelta(days=1)
+
+
+def _segment_key(month_index: int) -> str:
+    start = _month_start(month_index)
+    return f"dashboard:segment:{start.year:04d}-{start.month:02d}"
+
+
+def _split_range(start_date: date, end_date: date) -> Tuple[List[int], List[Tuple[date, date]]]:
+    """Split a range into whole months (cacheable segments) and at most two partial edge ranges"""
+    if start_date > end_date:
+        return [], []
+    first, last = _month_index(start_date), _month_index(end_date)
+    starts_aligned = start_date.day == 1
+    ends_aligned = end_date == _month_end(last)
+    if first == last and not (starts_aligned and ends_aligned):
+        return [], [(start_date, end_date)]
+    months = list(range(first, last + 1))
+    edges = []
+    if not starts_aligned:
+        edges.append((start_date, _month_end(first)))
+        months.remove(first)
+    if not ends_aligned:
+        edges.append((_month_start(last), end_date))
+        months.remove(last)
+    return months, edges
+
+
+def _expense_item(row) -> dict:
+    return {
+        "id": str(row.id),
+        "description": row.description,
+        "amount": float(row.amount),
+        "currency": row.currency,
+        "date": row.date.isoformat(),
+        "category": row.category_name
+    }
+
+
+def _live_segment(db: Session, start_date: date, end_date: date, amount_in_idr, with_latest: bool = True) -> dict:
+    """Aggregate of a partial month, computed from expenses on every request"""
+    category_rows = db.query(
+        Category.name.label('category_name'),
+        func.sum(amount_in_idr).label('total'),
+        func.count(Expense.id).label('count')
+    ).outerjoin(
+        Category, Expense.category_id == Category.id
+    ).filter(
+        Expense.date >= start_date, Expense.date <= end_date
+    ).group_by(Category.name).all()
+    latest = []
+    if with_latest:
+        latest = db.query(
+            Expense.id, Expense.description, Expense.amount, Expense.currency, Expense.date,
+            Category.name.label('category_name')
+        ).outerjoin(
+            Category, Expense.category_id == Category.id
+        ).filter(
+            Expense.date >= start_date, Expense.date <= end_date
+        ).order_by(Expense.date.desc(), Expense.created_at.desc(), Expense.id.desc()).limit(DASHBOARD_TOP_EXPENSES).all()
+    return _segment(category_rows, latest)
+
+
+def _segment(category_rows, latest_rows) -> dict:
+    """{"categories": {name: [IDR total, count]}, "latest": newest expenses first}"""
+    categories = {}
+    for row in category_rows:
+        entry = categories.setdefault(row.category_name or "Uncategorized", [0.0, 0])
+        entry[0] += float(row.total or 0)
+        entry[1] += int(row.count or 0)
+    return {"categories": categories, "latest": [_expense_item(row) for row in latest_rows]}
+
+
+def _month_segments(db: Session, months: List[int], rollup_in_idr) -> List[dict]:
+    """
+    Aggregates of whole months, from the cache where possible. Missing months are
+    computed together: category totals from the rollup and each month's newest
+    expenses with one ranked query. Segments carry their month's tag, so an
+    expense write evicts only the month it touches.
+    """
+    segments = {month: cache.get(_segment_key(month)) for month in months}
+    missing = [month for month, segment in segments.items() if segment is None]
+    if missing:
+        generation = cache.generation
+        R = ExpenseMonthlyRollup
+        month_index = R.year * 12 + R.month
+        category_rows = db.query(
+            month_index.label('month_index'),
+            Category.name.label('category_name'),
+            func.sum(rollup_in_idr).label('total'),
+            func.sum(R.count).label('count')
+        ).outerjoin(
+            Category, R.category_id == Category.id
+        ).filter(
+            month_index.in_(missing)
+        ).group_by(R.year, R.month, Category.name).having(func.sum(R.count) > 0).all()
+
+        year, month = extract('year', Expense.date), extract('month', Expense.date)
+        ranked = db.query(
+            Expense.id.label('id'),
+            Expense.description.label('description'),
+            Expense.amount.label('amount'),
+            Expense.currency.label('currency'),
+            Expense.date.label('date'),
+            Category.name.label('category_name'),
+            (year * 12 + month).label('month_index'),
+            func.row_number().over(
+                partition_by=(year, month),
+                order_by=(Expense.date.desc(), Expense.created_at.desc(), Expense.id.desc())
+            ).label('position')
+        ).outerjoin(
+            Category, Expense.category_id == Category.id
+        ).filter(
+            Expense.date >= _month_start(min(missing)),
+            Expense.date <= _month_end(max(missing))
+        ).subquery()
+        latest_rows = db.query(ranked).filter(
+            ranked.c.position <= DASHBOARD_TOP_EXPENSES,
+            ranked.c.month_index.in_(missing)
+        ).order_by(ranked.c.position).all()
+
+        for month in missing:
+            segments[month] = _segment(
+                [row for row in category_rows if int(row.month_index) == month],
+                [row for row in latest_rows if int(row.month_index) == month]
+            )
+            cache.set(
+                _segment_key(month),
+                segments[month],
+                ttl_seconds=DASHBOARD_SEGMENT_TTL_SECONDS,
+                tags={"dashboard", month_tag(_month_start(month))},
+                generation=generation
+            )
+    return [segments[month] for month in months]
+
+
+def _unrated_currencies(db: Session) -> List[str]:
+    return [row[0] for row in db.query(Expense.currency).filter(Expense.amount_idr.is_(None)).distinct().all()]
+
+
+def _month_bounds(db: Session) -> Tuple[Optional[int], Optional[int]]:
+    """First and last month holding expenses, as rollup month indexes"""
+    R = ExpenseMonthlyRollup
+    return tuple(db.query(func.min(R.year * 12 + R.month), func.max(R.year * 12 + R.month)).filter(R.count != 0).one())
 
-    # Check cache first
-    cached_data = cache.get(cache_key)
-    if cached_data:
-        return cached_data
 
-    # Build base query with eager loading
-    query = db.query(Expense).options(joinedload(Expense.category))
+def _build_snapshot(db: Session) -> List[str]:
+    analytics_snapshot.ensure_built(db)
+    return analytics_snapshot.currencies
 
-    if start_date:
-        query = query.filter(Expense.date >= start_date)
-    if end_date:
-        query = query.filter(Expense.date <= end_date)
 
-    expenses = query.all()
+def _snapshot_category_rows(db: Session, start_date: Optional[date], end_date: Optional[date], rates) -> List[Tuple]:
+    """(category name, IDR total, count) from two prefix-sum lookups per category on the in-memory snapshot"""
+    totals = analytics_snapshot.category_totals(start_date, end_date, rates)
+    names = dict(db.query(Category.id, Category.name).filter(
+        Category.id.in_([cat_id for cat_id, _, _ in totals if cat_id is not None])
+    ).all())
+    return [(names.get(cat_id) or "Uncategorized", total, count) for cat_id, total, count in totals]
+
+
+async def _build_dashboard(start_date: Optional[date], end_date: Optional[date], snapshot: bool = False) -> dict:
+    # Stage 1: what the aggregate queries depend on (currencies needing on-the-fly
+    # conversion, the months holding data, and the snapshot if it is used)
+    stage_one = [(_unrated_currencies,), (_month_bounds,)]
+    if snapshot:
+        stage_one.append((_build_snapshot,))
+    unrated_currencies, (first_month, last_month), *snapshot_currencies = await _run_queries(*stage_one)
+
+    # IDR amount of each expense: the materialized amount_idr, with on-the-fly
+    # conversion only for rows saved before a rate was known
+    fallback_rates = await get_conversion_rates(unrated_currencies, "IDR")
+    amount_in_idr = amount_idr_expr(Expense.amount_idr, Expense.amount, Expense.currency, Expense.date, fallback_rates)
+    rollup_in_idr = rollup_amount_idr(fallback_rates)
+
+    # The requested range as cached whole-month segments plus live partial edges;
+    # open range ends extend to the first/last month holding expenses
+    if first_month is None:
+        months, edges = [], []
+    else:
+        months, edges = _split_range(start_date or _month_start(first_month), end_date or _month_end(last_month))
+
+    # Monthly trend (last 6 months up to the current one, all currencies): the partial
+    # first month live, every following month from the segments. Future-dated months
+    # are left out so the trend matches the month tags cached_dashboard() registers.
+    today = date.today()
+    six_months_ago = today - timedelta(days=TREND_WINDOW_DAYS)
+    trend_first_month = _month_index(six_months_ago)
+    trend_months = list(range(trend_first_month + 1, min(last_month or 0, _month_index(today)) + 1))
+
+    # Stage 2: every segment batch and live edge at once, each on its own connection
+    segment_months = sorted(set(months) | set(trend_months))
+    stage_two = [
+        (_month_segments, segment_months, rollup_in_idr),
+        (_live_segment, six_months_ago, _month_end(trend_first_month), amount_in_idr, False),
+        *[(_live_segment, edge_start, edge_end, amount_in_idr) for edge_start, edge_end in edges],
+    ]
+    if snapshot:
+        snapshot_rates = await get_conversion_rates(snapshot_currencies[0], "IDR")
+        stage_two.append((_snapshot_category_rows, start_date, end_date, snapshot_rates))
+    month_segments, trend_edge, *rest = await _run_queries(*stage_two)
+    edge_segments = rest[:len(edges)]
+    segments_by_month = dict(zip(segment_months, month_segments))
+
+    # Pieces newest first, so the latest expenses can be taken from the front
+    pieces = [(_month_start(month), segments_by_month[month]) for month in months]
+    pieces += [(edge_start, segment) for (edge_start, _), segment in zip(edges, edge_segments)]
+    pieces.sort(key=lambda piece: piece[0], reverse=True)
 
     # Calculate summary and category breakdown
-    total_idr = Decimal('0')
     category_totals = {}
-
-    for expense in expenses:
-        # Convert to IDR
-        if expense.currency == "IDR":
-            amount_idr = expense.amount
-        else:
-            try:
-                converted = await convert_currency(float(expense.amount), expense.currency, "IDR")
-                amount_idr = Decimal(str(converted))
-            except Exception:
-                # If conversion fails, use original amount
-                amount_idr = expense.amount
-
-        total_idr += amount_idr
-
-        # Aggregate by category
-        cat_name = expense.category.name if expense.category else "Uncategorized"
-        if cat_name not in category_totals:
-            category_totals[cat_name] = {
-                "total": Decimal('0'),
-                "count": 0
-            }
-        category_totals[cat_name]["total"] += amount_idr
-        category_totals[cat_name]["count"] += 1
+    if snapshot:
+        category_rows = rest[len(edges)]
+    else:
+        category_rows = [
+            (cat_name, total, count)
+            for _, segment in pieces
+            for cat_name, (total, count) in segment["categories"].items()
+        ]
+    for cat_name, total, count in category_rows:
+        entry = category_totals.setdefault(cat_name, {"total": Decimal('0'), "count": 0})
+        entry["total"] += Decimal(str(total))
+        entry["count"] += count
+    total_idr = sum((data["total"] for data in category_totals.values()), Decimal('0'))
+    expense_count = sum(data["count"] for data in category_totals.values())
 
     # Top expenses (last 10, sorted by date descending)
-    top_expenses_list = sorted(expenses, key=lambda e: e.date, reverse=True)[:10]
-
-    # Monthly trend (last 6 months of IDR expenses only - simplified for performance)
-    six_months_ago = date.today() - timedelta(days=180)
-    trend_query = db.query(
-        extract('year', Expense.date).label('year'),
-        extract('month', Expense.date).label('month'),
-        func.sum(Expense.amount).label('total')
-    ).filter(
-        Expense.currency == "IDR",
-        Expense.date >= six_months_ago
-    ).group_by('year', 'month').order_by('year', 'month').all()
+    top_expenses_list = [item for _, segment in pieces for item in segment["latest"]][:DASHBOARD_TOP_EXPENSES]
+
+    trend_totals = {}
+    trend_pieces = [(trend_first_month, trend_edge)] + [(month, segments_by_month[month]) for month in trend_months]
+    for month, segment in trend_pieces:
+        if segment["categories"]:
+            start = _month_start(month)
+            trend_totals[(start.year, start.month)] = sum(total for total, _ in segment["categories"].values())
 
     # Build response
     result = {
         "summary": {
             "total": float(total_idr),
             "currency": "IDR",
-            "expense_count": len(expenses),
+            "expense_count": expense_count,
             "date_range": {
                 "start": start_date.isoformat() if start_date else None,
                 "end": end_date.isoformat() if end_date else None
@@ -107,28 +403,15 @@ async def get_dashboard_data(
             }
             for cat, data in sorted(category_totals.items(), key=lambda x: x[1]["total"], reverse=True)
         ],
-        "top_expenses": [
-            {
-                "id": str(e.id),
-                "description": e.description,
-                "amount": float(e.amount),
-                "currency": e.currency,
-                "date": e.date.isoformat(),
-                "category": e.category.name if e.category else None
-            }
-            for e in top_expenses_list
-        ],
+        "top_expenses": top_expenses_list,
         "monthly_trend": [
             {
-                "year": int(row.year),
-                "month": int(row.month),
-                "total": float(row.total)
+                "year": year,
+                "month": month,
+                "total": float(total)
             }
-            for row in trend_query
+            for (year, month), total in sorted(trend_totals.items())
         ]
     }
 
-    # Cache for 5 minutes
-    cache.set(cache_key, result, ttl_seconds=300)
-
     return result
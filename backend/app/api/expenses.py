@@ -1,30 +1,82 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import and_, or_, func, case
+from sqlalchemy import String, and_, or_, type_coerce, insert, update, delete
 from typing import Optional, List, Dict
-from datetime import date
+from datetime import date, datetime
 from uuid import UUID
 from decimal import Decimal
+import base64
 import json
 import logging
 import traceback
+import uuid
 
 from app.database import get_db
 from app.models.expense import Expense
 from app.models.history import ExpenseHistory
 from app.models.category import Category
 from app.models.user import User
-from app.schemas.expense import ExpenseCreate, ExpenseUpdate, ExpenseResponse
+from app.schemas.expense import (
+    ExpenseCreate, ExpenseUpdate, ExpenseResponse, ExpenseBulkRequest, ExpenseBulkResponse, BULK_MAX_OPERATIONS
+)
 from app.core.auth import get_current_user
-from app.services.currency import get_exchange_rates
-from app.services.cache import cache
+from app.services.currency import get_conversion_rates, conversion_case, compute_amount_idr, materialize_amount_idr
+from app.services.cache import cache, expense_write_tags
+from app.services.rollup import apply_expense_to_rollup, RollupBatch
+from app.services.analytics import analytics_snapshot
+from app.services.search import apply_description_search
+from app.services.audit import audit_log
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Response header carrying the cursor of the next page of GET /expenses
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _encode_expenses_cursor(expense: Expense) -> str:
+    """Encode the (date, created_at, id) sort key of the last row on a page as an opaque cursor"""
+    payload = json.dumps({
+        "d": expense.date.isoformat(),
+        "c": expense.created_at.isoformat() if expense.created_at else None,
+        "id": str(expense.id)
+    })
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def _decode_expenses_cursor(cursor: str):
+    """Decode a cursor produced by _encode_expenses_cursor"""
+    payload = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    created_at = datetime.fromisoformat(payload["c"]) if payload["c"] else None
+    return date.fromisoformat(payload["d"]), created_at, UUID(payload["id"])
+
+
+def _after_cursor(db: Session, cursor_date: date, cursor_created_at: Optional[datetime], cursor_id: UUID):
+    """
+    Rows after the cursor in (date desc, created_at desc nulls last, id desc) order.
+    The leading date bound lets the database seek the composite index instead of skipping rows.
+    """
+    if cursor_created_at is not None and db.bind.dialect.name == "sqlite":
+        # SQLite compares timestamps as text and CURRENT_TIMESTAMP omits the fraction
+        # that a bound DateTime would carry, so bind the value as SQLite stored it
+        cursor_created_at = type_coerce(cursor_created_at.isoformat(sep=" "), String)
+    if cursor_created_at is None:
+        same_date = and_(Expense.created_at.is_(None), Expense.id < cursor_id)
+    else:
+        same_date = or_(
+            Expense.created_at < cursor_created_at,
+            Expense.created_at.is_(None),
+            and_(Expense.created_at == cursor_created_at, Expense.id < cursor_id)
+        )
+    return and_(
+        Expense.date <= cursor_date,
+        or_(Expense.date < cursor_date, and_(Expense.date == cursor_date, same_date))
+    )
+
 
 @router.get("/expenses", response_model=List[ExpenseResponse])
 async def get_expenses(
+    response: Response,
     category_id: Optional[UUID] = Query(None, description="Single category ID (deprecated, use category_ids)"),
     category_ids: Optional[List[UUID]] = Query(None, description="Multiple category IDs for OR filtering"),
     start_date: Optional[date] = Query(None),
@@ -32,12 +84,26 @@ async def get_expenses(
     min_amount: Optional[float] = Query(None),
     max_amount: Optional[float] = Query(None),
     search: Optional[str] = Query(None),
+    sort: Optional[str] = Query("date", description="Sort order: date (newest first) or relevance (best search matches first, requires search)"),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from a previous page's X-Next-Cursor header (takes precedence over skip)"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get expenses with advanced filtering"""
+    """
+    Get expenses with advanced filtering, newest first.
+    When more rows follow, the X-Next-Cursor response header holds a cursor for the
+    next page; passing it as ?cursor= seeks straight to that page in constant time.
+    Relevance-sorted searches page with skip/limit only.
+    """
+    if sort not in ("date", "relevance"):
+        raise HTTPException(status_code=400, detail="sort must be 'date' or 'relevance'")
+    if sort == "relevance" and not search:
+        raise HTTPException(status_code=400, detail="sort=relevance requires a search term")
+    if sort == "relevance" and cursor:
+        raise HTTPException(status_code=400, detail="Cursor pagination is only supported when sorting by date")
+
     # Use eager loading to prevent N+1 queries when accessing category
     query = db.query(Expense).options(joinedload(Expense.category))
 
@@ -53,86 +119,59 @@ async def get_expenses(
     if end_date:
         query = query.filter(Expense.date <= end_date)
 
-    # Handle amount filtering with currency conversion to IDR
+    # Handle amount filtering on IDR-equivalent amounts
     if min_amount is not None or max_amount is not None:
-        # Get unique currencies from expenses
-        unique_currencies = db.query(Expense.currency).distinct().all()
-        currencies = [curr[0] for curr in unique_currencies]
-        
-        # If no currencies found, apply simple filtering
-        if not currencies:
+        materialized = []
+        converted = []
+        if min_amount is not None:
+            materialized.append(Expense.amount_idr >= Decimal(str(min_amount)))
+        if max_amount is not None:
+            materialized.append(Expense.amount_idr <= Decimal(str(max_amount)))
+
+        # Rows saved before a rate was known have no amount_idr yet: convert those
+        # in SQL using rates from the cached rate matrix. Currencies without a rate
+        # are compared unconverted, so the API still works if the exchange rate API
+        # is unavailable.
+        unique_currencies = db.query(Expense.currency).filter(Expense.amount_idr.is_(None)).distinct().all()
+        if unique_currencies:
+            conversion_rates = await get_conversion_rates([curr[0] for curr in unique_currencies], "IDR")
+            amount_in_idr = conversion_case(Expense.amount, Expense.currency, conversion_rates)
             if min_amount is not None:
-                query = query.filter(Expense.amount >= Decimal(str(min_amount)))
+                converted.append(amount_in_idr >= Decimal(str(min_amount)))
             if max_amount is not None:
-                query = query.filter(Expense.amount <= Decimal(str(max_amount)))
+                converted.append(amount_in_idr <= Decimal(str(max_amount)))
+            query = query.filter(or_(
+                and_(*materialized),
+                and_(Expense.amount_idr.is_(None), *converted)
+            ))
         else:
-            # Fetch exchange rates for IDR conversion
-            # For each currency, fetch rates with that currency as base to get IDR rate directly
-            try:
-                # Build conversion rates dictionary: currency -> IDR rate
-                conversion_rates: Dict[str, Decimal] = {}
-                
-                # Fetch USD rates once (most common base currency)
-                usd_rates = await get_exchange_rates("USD")
-                idr_from_usd = usd_rates.get("IDR", 1.0)
-                
-                for currency in currencies:
-                    currency_upper = currency.upper()
-                    if currency_upper == "IDR":
-                        conversion_rates[currency] = Decimal("1.0")
-                    elif currency_upper == "USD":
-                        conversion_rates[currency] = Decimal(str(idr_from_usd))
-                    else:
-                        # Fetch rates for this currency (base = currency)
-                        # The API returns rates[IDR] which is IDR per 1 unit of currency
-                        try:
-                            curr_rates = await get_exchange_rates(currency_upper)
-                            idr_rate = curr_rates.get("IDR")
-                            if idr_rate:
-                                conversion_rates[currency] = Decimal(str(idr_rate))
-                            else:
-                                # Fallback: convert via USD
-                                usd_rate = curr_rates.get("USD")
-                                if usd_rate and usd_rate > 0:
-                                    # Currency -> USD -> IDR: amount * (IDR_rate / USD_rate)
-                                    conversion_rates[currency] = Decimal(str(float(idr_from_usd) / float(usd_rate)))
-                                else:
-                                    # If conversion not possible, use 1:1 (no conversion)
-                                    conversion_rates[currency] = Decimal("1.0")
-                        except Exception:
-                            # Fallback: if we can't get rates, assume 1:1 (no conversion)
-                            conversion_rates[currency] = Decimal("1.0")
-                
-                # Build CASE statement to convert amounts to IDR
-                when_conditions = [
-                    (Expense.currency == currency, Expense.amount * conversion_rates[currency])
-                    for currency in conversion_rates.keys()
-                ]
-                amount_in_idr = case(*[(condition, result) for condition, result in when_conditions], else_=Expense.amount)
-                
-                # Filter on IDR-equivalent amounts
-                if min_amount is not None:
-                    query = query.filter(amount_in_idr >= Decimal(str(min_amount)))
-                
-                if max_amount is not None:
-                    query = query.filter(amount_in_idr <= Decimal(str(max_amount)))
-            except Exception as e:
-                # If currency conversion fails, fall back to original filtering (by original currency amount)
-                # This ensures the API doesn't break if exchange rate API is unavailable
-                if min_amount is not None:
-                    query = query.filter(Expense.amount >= Decimal(str(min_amount)))
-                if max_amount is not None:
-                    query = query.filter(Expense.amount <= Decimal(str(max_amount)))
+            # Plain range predicate on the indexed column
+            query = query.filter(*materialized)
     
     if search:
-        search_term = f"%{search}%"
-        query = query.filter(Expense.description.ilike(search_term))
+        query, rank = apply_description_search(db, query, search)
+        if sort == "relevance" and rank is not None:
+            query = query.order_by(rank.desc())
 
-    # Order by date descending
-    query = query.order_by(Expense.date.desc(), Expense.created_at.desc())
+    # Order by date descending, with id as a tie-breaker so pages never overlap
+    query = query.order_by(Expense.date.desc(), Expense.created_at.desc().nulls_last(), Expense.id.desc())
+    
+    # Pagination: keyset when a cursor is given, offset otherwise
+    if cursor:
+        try:
+            cursor_key = _decode_expenses_cursor(cursor)
+        except (ValueError, TypeError, KeyError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.filter(_after_cursor(db, *cursor_key))
+    else:
+        query = query.offset(skip)
     
-    # Pagination
-    expenses = query.offset(skip).limit(limit).all()
+    # Fetch one extra row to know whether another page exists
+    expenses = query.limit(limit + 1).all()
+    if len(expenses) > limit:
+        expenses = expenses[:limit]
+        if sort == "date":
+            response.headers[NEXT_CURSOR_HEADER] = _encode_expenses_cursor(expenses[-1])
     return expenses
 
 
@@ -144,42 +183,211 @@ async def create_expense(
 ):
     """Create a new expense"""
     db_expense = Expense(**expense.model_dump())
+    db_expense.amount_idr = await compute_amount_idr(db, expense.amount, expense.currency, expense.date)
     db.add(db_expense)
-    db.commit()
+    apply_expense_to_rollup(db, db_expense)
+    # Assigns the id the history entry refers to
+    db.flush()
+
+    # Log history (spooled before the commit, inserted in the background by the audit log)
+    with audit_log.recording(
+        db_expense.id, 'create', current_user,
+        f"Created expense: {db_expense.description}",
+        new_data=_expense_data(db_expense, _category_names(db, db_expense.category_id))
+    ):
+        db.commit()
     db.refresh(db_expense)
-    
-    # Log history
-    # Get category name if category_id exists
-    category_name = None
-    if db_expense.category_id:
-        category = db.query(Category).filter(Category.id == db_expense.category_id).first()
-        category_name = category.name if category else None
-    
-    history_entry = ExpenseHistory(
-        expense_id=db_expense.id,
-        action='create',
-        user_id=current_user.id,
-        username=current_user.username or current_user.email or 'unknown',
-        description=f"Created expense: {db_expense.description}",
-        new_data=json.dumps({
-            'id': str(db_expense.id),
-            'amount': float(db_expense.amount),
-            'currency': db_expense.currency,
-            'description': db_expense.description,
-            'date': db_expense.date.isoformat(),
-            'category_id': str(db_expense.category_id) if db_expense.category_id else None,
-            'category_name': category_name
-        }, default=str)
-    )
-    db.add(history_entry)
-    db.commit()
 
-    # Invalidate dashboard cache after creating expense
-    cache.invalidate("dashboard")
+    # Invalidate cached views covering this expense's month
+    cache.invalidate_tags(*expense_write_tags(db_expense.date))
+    analytics_snapshot.upsert(db_expense)
 
     return db_expense
 
 
+def _category_names(db: Session, *category_ids: Optional[UUID]) -> Dict[UUID, str]:
+    """Names of the given categories, by id (None ids are ignored)"""
+    ids = {category_id for category_id in category_ids if category_id}
+    if not ids:
+        return {}
+    return {category.id: category.name for category in db.query(Category).filter(Category.id.in_(ids)).all()}
+
+
+def _expense_data(expense: Expense, category_names: Dict[UUID, str]) -> dict:
+    """Snapshot of an expense stored in ExpenseHistory old_data/new_data"""
+    return {
+        'id': str(expense.id),
+        'amount': float(expense.amount),
+        'currency': expense.currency,
+        'description': expense.description,
+        'date': expense.date.isoformat(),
+        'category_id': str(expense.category_id) if expense.category_id else None,
+        'category_name': category_names.get(expense.category_id)
+    }
+
+
+def _load_expenses(db: Session, expense_ids: List[UUID]) -> Dict[UUID, Expense]:
+    """Current state of the given expenses, by id"""
+    if not expense_ids:
+        return {}
+    return {
+        expense.id: expense
+        for expense in db.query(Expense).filter(Expense.id.in_(expense_ids)).populate_existing().all()
+    }
+
+
+@router.post("/expenses/bulk", response_model=ExpenseBulkResponse)
+async def bulk_expenses(
+    request: ExpenseBulkRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Create, update and delete many expenses in one transaction.
+    Rows are written with multi-row statements, history entries are inserted
+    together, and caches are invalidated once. Either every operation applies
+    or none does.
+    """
+    operation_count = len(request.create) + len(request.update) + len(request.delete)
+    if operation_count > BULK_MAX_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_MAX_OPERATIONS} operations per request")
+    update_ids = [item.id for item in request.update]
+    delete_ids = list(request.delete)
+    if len(set(update_ids)) != len(update_ids) or len(set(delete_ids)) != len(delete_ids) \
+            or set(update_ids) & set(delete_ids):
+        raise HTTPException(status_code=400, detail="Each expense may appear in at most one update or delete")
+
+    # Locked like in update_expense: their old amounts are subtracted from the rollups
+    existing = {
+        expense.id: expense
+        for expense in db.query(Expense).filter(Expense.id.in_(update_ids + delete_ids)).with_for_update().all()
+    } if update_ids or delete_ids else {}
+    missing = [str(expense_id) for expense_id in update_ids + delete_ids if expense_id not in existing]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Expenses not found: {', '.join(missing)}")
+
+    updates = [(item, item.model_dump(exclude_unset=True, exclude={"id"})) for item in request.update]
+    category_ids = {expense.category_id for expense in existing.values()}
+    category_ids |= {item.category_id for item in request.create}
+    category_ids |= {changes["category_id"] for _, changes in updates if "category_id" in changes}
+    category_ids.discard(None)
+    category_names = _category_names(db, *category_ids)
+    unknown = [str(category_id) for category_id in category_ids if category_id not in category_names]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Categories not found: {', '.join(unknown)}")
+
+    username = current_user.username or current_user.email or 'unknown'
+    old_data = {expense_id: _expense_data(expense, category_names) for expense_id, expense in existing.items()}
+    touched_dates = [expense.date for expense in existing.values()]
+    # Old contributions leave the rollups before the rows change
+    rollup = RollupBatch()
+    for expense in existing.values():
+        rollup.add(expense, -1)
+
+    try:
+        history = []
+        if delete_ids:
+            # Keep earlier history of deleted expenses (see delete_expense)
+            db.execute(
+                update(ExpenseHistory).where(ExpenseHistory.expense_id.in_(delete_ids)).values(expense_id=None),
+                execution_options={"synchronize_session": False}
+            )
+            db.execute(
+                delete(Expense).where(Expense.id.in_(delete_ids)),
+                execution_options={"synchronize_session": False}
+            )
+            history += [
+                {
+                    "expense_id": None,
+                    "action": 'delete',
+                    "user_id": current_user.id,
+                    "username": username,
+                    "description": f"Deleted expense: {existing[expense_id].description}",
+                    "old_data": json.dumps(old_data[expense_id], default=str),
+                    "new_data": None,
+                }
+                for expense_id in delete_ids
+            ]
+
+        # ORM bulk UPDATE by primary key: one executemany per set of changed columns
+        update_rows = [{"id": item.id, **changes} for item, changes in updates if changes]
+        if update_rows:
+            db.execute(update(Expense), update_rows)
+
+        created_ids = []
+        if request.create:
+            create_rows = [{"id": uuid.uuid4(), **item.model_dump()} for item in request.create]
+            created_ids = [row["id"] for row in create_rows]
+            db.execute(insert(Expense), create_rows)
+
+        # IDR amounts for new rows and rows whose amount, currency or date changed, in one UPDATE
+        await materialize_amount_idr(db, created_ids + [
+            item.id for item, changes in updates if changes.keys() & {"amount", "currency", "date"}
+        ])
+
+        written = _load_expenses(db, created_ids + update_ids)
+        for expense in written.values():
+            rollup.add(expense)
+            touched_dates.append(expense.date)
+        rollup.apply(db)
+
+        history += [
+            {
+                "expense_id": item.id,
+                "action": 'update',
+                "user_id": current_user.id,
+                "username": username,
+                "description": f"Updated expense: {written[item.id].description} (changed: {', '.join(changes)})",
+                "old_data": json.dumps(old_data[item.id], default=str),
+                "new_data": json.dumps(_expense_data(written[item.id], category_names), default=str),
+            }
+            for item, changes in updates if changes
+        ]
+        history += [
+            {
+                "expense_id": expense_id,
+                "action": 'create',
+                "user_id": current_user.id,
+                "username": username,
+                "description": f"Created expense: {written[expense_id].description}",
+                "old_data": None,
+                "new_data": json.dumps(_expense_data(written[expense_id], category_names), default=str),
+            }
+            for expense_id in created_ids
+        ]
+        # Inserted in the transaction rather than through audit_log: one multi-row insert
+        # is already amortized over the batch, and history commits or rolls back with it
+        if history:
+            db.execute(insert(ExpenseHistory), history)
+
+        db.commit()
+        # Reload the committed rows in one query rather than one refresh per row
+        written = _load_expenses(db, created_ids + update_ids)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Bulk expense write failed: {str(e)}")
+        logger.error(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=f"Failed to apply bulk expense operations: {str(e)}")
+
+    # Invalidate cached views covering every touched month, once
+    if touched_dates:
+        cache.invalidate_tags(*expense_write_tags(*touched_dates))
+    for expense in written.values():
+        analytics_snapshot.upsert(expense)
+    for expense_id in delete_ids:
+        analytics_snapshot.remove(expense_id)
+
+    logger.info(
+        f"Bulk expense write by user {current_user.id}: {len(created_ids)} created, "
+        f"{len(update_ids)} updated, {len(delete_ids)} deleted"
+    )
+    return {
+        "created": [written[expense_id] for expense_id in created_ids],
+        "updated": [written[expense_id] for expense_id in update_ids],
+        "deleted": delete_ids,
+    }
+
+
 @router.get("/expenses/{expense_id}", response_model=ExpenseResponse)
 async def get_expense(
     expense_id: UUID,
@@ -201,66 +409,46 @@ async def update_expense(
     db: Session = Depends(get_db)
 ):
     """Update an expense"""
-    expense = db.query(Expense).filter(Expense.id == expense_id).first()
+    # Lock the row: its old amounts are subtracted from the rollup, so a concurrent
+    # update must not read them too (no-op on SQLite, which serializes writers)
+    expense = db.query(Expense).filter(Expense.id == expense_id).with_for_update().first()
     if not expense:
         raise HTTPException(status_code=404, detail="Expense not found")
     
     # Store old data for history
-    # Get old category name if category_id exists
-    old_category_name = None
-    if expense.category_id:
-        old_category = db.query(Category).filter(Category.id == expense.category_id).first()
-        old_category_name = old_category.name if old_category else None
-    
-    old_data = {
-        'id': str(expense.id),
-        'amount': float(expense.amount),
-        'currency': expense.currency,
-        'description': expense.description,
-        'date': expense.date.isoformat(),
-        'category_id': str(expense.category_id) if expense.category_id else None,
-        'category_name': old_category_name
-    }
+    category_names = _category_names(db, expense.category_id)
+    old_data = _expense_data(expense, category_names)
     
+    old_date = expense.date
     update_data = expense_update.model_dump(exclude_unset=True)
     changed_fields = list(update_data.keys())
+    # Move the expense's contribution between monthly rollups in the same transaction
+    apply_expense_to_rollup(db, expense, -1)
     for field, value in update_data.items():
         setattr(expense, field, value)
-    
-    db.commit()
-    db.refresh(expense)
-    
-    # Log history
+
+    if update_data.keys() & {"amount", "currency", "date"}:
+        expense.amount_idr = await compute_amount_idr(db, expense.amount, expense.currency, expense.date)
+    apply_expense_to_rollup(db, expense)
+
+    # Log history (spooled before the commit, inserted in the background by the audit log)
     if changed_fields:
-        # Get new category name if category_id exists
-        new_category_name = None
-        if expense.category_id:
-            new_category = db.query(Category).filter(Category.id == expense.category_id).first()
-            new_category_name = new_category.name if new_category else None
-        
-        new_data = {
-            'id': str(expense.id),
-            'amount': float(expense.amount),
-            'currency': expense.currency,
-            'description': expense.description,
-            'date': expense.date.isoformat(),
-            'category_id': str(expense.category_id) if expense.category_id else None,
-            'category_name': new_category_name
-        }
-        history_entry = ExpenseHistory(
-            expense_id=expense.id,
-            action='update',
-            user_id=current_user.id,
-            username=current_user.username or current_user.email or 'unknown',
-            description=f"Updated expense: {expense.description} (changed: {', '.join(changed_fields)})",
-            old_data=json.dumps(old_data, default=str),
-            new_data=json.dumps(new_data, default=str)
-        )
-        db.add(history_entry)
+        if expense.category_id not in category_names:
+            category_names.update(_category_names(db, expense.category_id))
+        with audit_log.recording(
+            expense.id, 'update', current_user,
+            f"Updated expense: {expense.description} (changed: {', '.join(changed_fields)})",
+            old_data=old_data,
+            new_data=_expense_data(expense, category_names)
+        ):
+            db.commit()
+    else:
         db.commit()
+    db.refresh(expense)
 
-    # Invalidate dashboard cache after updating expense
-    cache.invalidate("dashboard")
+    # Invalidate cached views covering the old and new months
+    cache.invalidate_tags(*expense_write_tags(old_date, expense.date))
+    analytics_snapshot.upsert(expense)
 
     return expense
 
@@ -272,160 +460,31 @@ async def delete_expense(
     db: Session = Depends(get_db)
 ):
     """Delete an expense"""
-    # #region agent log
-    import os
-    log_path = '/Users/andri.danusasmita/github/andridns/sandbox/.cursor/debug.log'
-    import json as json_lib
-    import time
-    try:
-        with open(log_path, 'a') as f:
-            f.write(json_lib.dumps({'sessionId': 'debug-session', 'runId': 'run1', 'hypothesisId': 'A', 'location': 'expenses.py:250', 'message': 'delete_expense entry', 'data': {'expense_id': str(expense_id), 'user_id': str(current_user.id)}, 'timestamp': int(time.time() * 1000)}) + '\n')
-    except: pass
-    # #endregion
-    
-    expense = db.query(Expense).filter(Expense.id == expense_id).first()
-    
-    # #region agent log
-    try:
-        with open(log_path, 'a') as f:
-            f.write(json_lib.dumps({'sessionId': 'debug-session', 'runId': 'run1', 'hypothesisId': 'A', 'location': 'expenses.py:252', 'message': 'expense query result', 'data': {'expense_found': expense is not None, 'expense_id': str(expense_id)}, 'timestamp': int(time.time() * 1000)}) + '\n')
-    except: pass
-    # #endregion
-    
+    # Lock the row so a concurrent update cannot also subtract its amounts from the rollup
+    expense = db.query(Expense).filter(Expense.id == expense_id).with_for_update().first()
     if not expense:
         raise HTTPException(status_code=404, detail="Expense not found")
     
     # Store data for history before deletion
-    # Get category name if category_id exists
-    category_name = None
-    if expense.category_id:
-        category = db.query(Category).filter(Category.id == expense.category_id).first()
-        category_name = category.name if category else None
-    
-    old_data = {
-        'id': str(expense.id),
-        'amount': float(expense.amount),
-        'currency': expense.currency,
-        'description': expense.description,
-        'date': expense.date.isoformat(),
-        'category_id': str(expense.category_id) if expense.category_id else None,
-        'category_name': category_name,
-        'tags': expense.tags if expense.tags else [],
-        'location': expense.location,
-        'notes': expense.notes,
-        'is_recurring': expense.is_recurring,
-        'receipt_url': expense.receipt_url,
-    }
+    expense_date = expense.date
+    expense_description = expense.description
+    old_data = _expense_data(expense, _category_names(db, expense.category_id))
     
     try:
-        # #region agent log
-        try:
-            with open(log_path, 'a') as f:
-                f.write(json_lib.dumps({'sessionId': 'debug-session', 'runId': 'run1', 'hypothesisId': 'B', 'location': 'expenses.py:265', 'message': 'before creating history entry', 'data': {'expense_id': str(expense.id)}, 'timestamp': int(time.time() * 1000)}) + '\n')
-        except: pass
-        # #endregion
-        
-        # Update any existing history entries for this expense to set expense_id to None
-        # This is a workaround for PostgreSQL foreign key constraints until migration 005 is applied
-        # After migration 005, PostgreSQL will automatically set expense_id to NULL via ON DELETE SET NULL
-        # #region agent log
-        try:
-            existing_history_count = db.query(ExpenseHistory).filter(ExpenseHistory.expense_id == expense_id).count()
-            with open(log_path, 'a') as f:
-                f.write(json_lib.dumps({'sessionId': 'debug-session', 'runId': 'run1', 'hypothesisId': 'C', 'location': 'expenses.py:294', 'message': 'before updating existing history', 'data': {'expense_id': str(expense_id), 'existing_history_count': existing_history_count}, 'timestamp': int(time.time() * 1000)}) + '\n')
-        except: pass
-        # #endregion
-        
-        try:
-            # Update existing history entries by fetching and updating individually
-            # Flush after update to ensure PostgreSQL sees the changes before delete
-            existing_history_entries = db.query(ExpenseHistory).filter(ExpenseHistory.expense_id == expense_id).all()
-            for history_entry in existing_history_entries:
-                history_entry.expense_id = None
-            # Flush to make the updates visible to PostgreSQL before delete
-            db.flush()
-            # #region agent log
-            try:
-                with open(log_path, 'a') as f:
-                    f.write(json_lib.dumps({'sessionId': 'debug-session', 'runId': 'run1', 'hypothesisId': 'C', 'location': 'expenses.py:307', 'message': 'existing history updated and flushed', 'data': {'updated_count': len(existing_history_entries)}, 'timestamp': int(time.time() * 1000)}) + '\n')
-            except: pass
-            # #endregion
-        except Exception as update_error:
-            # #region agent log
-            try:
-                with open(log_path, 'a') as f:
-                    f.write(json_lib.dumps({'sessionId': 'debug-session', 'runId': 'run1', 'hypothesisId': 'C', 'location': 'expenses.py:309', 'message': 'update existing history failed', 'data': {'error': str(update_error), 'error_type': type(update_error).__name__}, 'timestamp': int(time.time() * 1000)}) + '\n')
-            except: pass
-            # #endregion
-            logger.error(f"Failed to update existing history entries: {str(update_error)}")
-            logger.error(traceback.format_exc())
-            # Continue anyway - we'll try to create the new history entry
-        
-        # Log history BEFORE deletion
-        # Set expense_id to None to avoid foreign key constraint issues
-        # The old_data JSON contains all the expense information we need
-        history_entry = ExpenseHistory(
-            expense_id=None,  # Set to None to allow expense deletion
-            action='delete',
-            user_id=current_user.id,
-            username=current_user.username or current_user.email or 'unknown',
-            description=f"Deleted expense: {expense.description}",
-            old_data=json.dumps(old_data, default=str)
+        # Detach existing history entries so the delete passes the foreign key
+        # (PostgreSQL before migration 005, which adds ON DELETE SET NULL)
+        db.query(ExpenseHistory).filter(ExpenseHistory.expense_id == expense_id).update(
+            {ExpenseHistory.expense_id: None}, synchronize_session=False
         )
-        db.add(history_entry)
-        
-        # #region agent log
-        try:
-            with open(log_path, 'a') as f:
-                f.write(json_lib.dumps({'sessionId': 'debug-session', 'runId': 'run1', 'hypothesisId': 'B', 'location': 'expenses.py:300', 'message': 'history entry added', 'data': {'history_entry_id': str(history_entry.id)}, 'timestamp': int(time.time() * 1000)}) + '\n')
-        except: pass
-        # #endregion
-        
-        # #region agent log
-        try:
-            with open(log_path, 'a') as f:
-                f.write(json_lib.dumps({'sessionId': 'debug-session', 'runId': 'run1', 'hypothesisId': 'D', 'location': 'expenses.py:302', 'message': 'before deleting expense', 'data': {'expense_id': str(expense.id)}, 'timestamp': int(time.time() * 1000)}) + '\n')
-        except: pass
-        # #endregion
-        
+        apply_expense_to_rollup(db, expense, -1)
         db.delete(expense)
-        
-        # #region agent log
-        try:
-            with open(log_path, 'a') as f:
-                f.write(json_lib.dumps({'sessionId': 'debug-session', 'runId': 'run1', 'hypothesisId': 'D', 'location': 'expenses.py:305', 'message': 'expense marked for deletion', 'data': {}, 'timestamp': int(time.time() * 1000)}) + '\n')
-        except: pass
-        # #endregion
-        
-        # #region agent log
-        try:
-            with open(log_path, 'a') as f:
-                f.write(json_lib.dumps({'sessionId': 'debug-session', 'runId': 'run1', 'hypothesisId': 'D', 'location': 'expenses.py:307', 'message': 'before commit', 'data': {}, 'timestamp': int(time.time() * 1000)}) + '\n')
-        except: pass
-        # #endregion
-        
-        db.commit()
-
-        # Invalidate dashboard cache after deleting expense
-        cache.invalidate("dashboard")
-
-        # #region agent log
-        try:
-            with open(log_path, 'a') as f:
-                f.write(json_lib.dumps({'sessionId': 'debug-session', 'runId': 'run1', 'hypothesisId': 'D', 'location': 'expenses.py:309', 'message': 'commit successful', 'data': {}, 'timestamp': int(time.time() * 1000)}) + '\n')
-        except: pass
-        # #endregion
-
-        logger.info(f"Successfully deleted expense {expense_id} by user {current_user.id}")
-    except HTTPException:
-        raise
+        # Log history (spooled before the commit, inserted in the background by the
+        # audit log). The expense is gone, so the entry keeps only old_data.
+        with audit_log.recording(
+            None, 'delete', current_user, f"Deleted expense: {expense_description}", old_data=old_data
+        ):
+            db.commit()
     except Exception as e:
-        # #region agent log
-        try:
-            with open(log_path, 'a') as f:
-                f.write(json_lib.dumps({'sessionId': 'debug-session', 'runId': 'run1', 'hypothesisId': 'D', 'location': 'expenses.py:315', 'message': 'delete/commit failed', 'data': {'error': str(e), 'error_type': type(e).__name__, 'traceback': traceback.format_exc()}, 'timestamp': int(time.time() * 1000)}) + '\n')
-        except: pass
-        # #endregion
         db.rollback()
         logger.error(f"Failed to delete expense {expense_id}: {str(e)}")
         logger.error(traceback.format_exc())
@@ -433,5 +492,10 @@ async def delete_expense(
             status_code=500,
             detail=f"Failed to delete expense: {str(e)}"
         )
-    
+
+    # Invalidate cached views covering this expense's month
+    cache.invalidate_tags(*expense_write_tags(expense_date))
+    analytics_snapshot.remove(expense_id)
+
+    logger.info(f"Successfully deleted expense {expense_id} by user {current_user.id}")
     return None
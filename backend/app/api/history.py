@@ -9,6 +9,7 @@ from app.models.history import ExpenseHistory
 from app.models.user import User
 from app.schemas.history import ExpenseHistoryResponse
 from app.core.auth import get_current_user
+from app.services.audit import audit_log
 
 router = APIRouter()
 
@@ -23,6 +24,8 @@ async def get_expense_history(
     db: Session = Depends(get_db)
 ):
     """Get expense history/audit log"""
+    # Include events still queued by the batched audit writer
+    await audit_log.flush()
     query = db.query(ExpenseHistory)
     
     # Apply filters
@@ -47,5 +50,6 @@ async def get_unique_usernames(
     db: Session = Depends(get_db)
 ):
     """Get list of unique usernames from expense history"""
+    await audit_log.flush()
     usernames = db.query(distinct(ExpenseHistory.username)).order_by(ExpenseHistory.username).all()
     return [username[0] for username in usernames if username[0]]
@@ -13,6 +13,10 @@ from app.models.category import Category
 from app.models.user import User
 from app.services.excel_import import ExcelImportService
 from app.services.category_matcher import CategoryMatcher
+from app.services.currency import get_rate_matrix, rerate_expenses
+from app.services.rollup import apply_expense_to_rollup
+from app.services.analytics import analytics_snapshot
+from app.services.cache import cache
 from app.schemas.expense import ExpenseCreate
 from app.schemas.category import CategoryCreate
 from app.core.auth import get_current_user
@@ -334,6 +338,7 @@ async def import_excel(
                 logger.debug(f"Row {idx + 1}: Saving to database")
                 db_expense = Expense(**expense_create.model_dump())
                 db.add(db_expense)
+                apply_expense_to_rollup(db, db_expense)
                 db.commit()
                 
                 imported_count += 1
@@ -350,6 +355,16 @@ async def import_excel(
                 logger.debug(f"Row {idx + 1}: Failed row data: {expense_data}")
                 failed_rows.append(error_info)
         
+        # Materialize IDR amounts for the imported rows in one statement
+        if imported_count:
+            try:
+                rate_matrix = await get_rate_matrix()
+            except Exception:
+                rate_matrix = None
+            rerate_expenses(db, rate_matrix, only_missing=True)
+            analytics_snapshot.invalidate()
+            cache.invalidate_tags("dashboard")
+        
         # Prepare response
         summary = {
             "total_rows": len(expenses_data),
@@ -1,33 +1,181 @@
-from fastapi import APIRouter, Depends, Query
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, extract
-from typing import Optional, List
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from sqlalchemy import func, and_, or_, case
+from typing import Optional, List, Tuple
 from datetime import date, datetime, timedelta
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
 from uuid import UUID
+import base64
+import json
+from types import SimpleNamespace
 
 from app.database import get_db
 from app.models.expense import Expense
 from app.models.category import Category
+from app.models.expense_rollup import ExpenseMonthlyRollup
 from app.models.user import User
-from app.services.currency import get_exchange_rates
+from app.services.currency import get_conversion_rates, historical_conversion_expr, amount_idr_expr
+from app.services.rollup import (
+    is_month_aligned, month_range_filters, unrated_rollup_currencies, rollup_amount_idr
+)
+from app.services.analytics import analytics_snapshot, use_snapshot
+from app.services.distribution import spending_distribution
 from app.core.auth import get_current_user
 
 router = APIRouter()
 
 
+async def _fallback_conversion_rates(db: Session, to_currency: str):
+    """Today's rates for every currency in use, for expenses not covered by stored rate history"""
+    query = db.query(Expense.currency)
+    if to_currency.upper() == "IDR":
+        # Only rows without a materialized amount_idr are converted on the fly
+        query = query.filter(Expense.amount_idr.is_(None))
+    currencies = [row[0] for row in query.distinct().all()]
+    return await get_conversion_rates(currencies, to_currency)
+
+
+async def _snapshot_rates(db: Session):
+    """Build or refresh the analytics snapshot and fetch rates for its unrated amounts"""
+    analytics_snapshot.ensure_built(db)
+    return await get_conversion_rates(analytics_snapshot.currencies, "IDR")
+
+
+def _parse_category_filter(category_id: Optional[str], category_ids: Optional[List[str]]) -> Optional[List[UUID]]:
+    """Category IDs to filter on, or None for no filter (invalid IDs disable the filter)"""
+    try:
+        if category_ids:
+            return [UUID(cid) for cid in category_ids]
+        if category_id:
+            return [UUID(category_id)]
+    except (ValueError, TypeError):
+        pass  # Invalid UUID, ignore filter
+    return None
+
+
+async def _rollup_amount_in_idr(db: Session, rollup_filters):
+    """IDR total of each rollup row, with rates fetched only for months holding unrated expenses"""
+    fallback_rates = await get_conversion_rates(unrated_rollup_currencies(db, rollup_filters), "IDR")
+    return rollup_amount_idr(fallback_rates)
+
+
+async def _amount_in_idr(db: Session):
+    """IDR amount of each expense: materialized amount_idr, else converted at its date's rate"""
+    fallback_rates = await _fallback_conversion_rates(db, "IDR")
+    return amount_idr_expr(Expense.amount_idr, Expense.amount, Expense.currency, Expense.date, fallback_rates)
+
+
+def _encode_top_expenses_cursor(amount_in_idr, expense_id) -> str:
+    """Encode the sort key of the last row on a page as an opaque cursor"""
+    payload = json.dumps({"a": str(amount_in_idr), "id": str(expense_id)})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def _decode_top_expenses_cursor(cursor: str):
+    """Decode a cursor produced by _encode_top_expenses_cursor"""
+    payload = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    return Decimal(payload["a"]), UUID(payload["id"])
+
+
+# Periods per year of each period type
+PERIODS_PER_YEAR = {"monthly": 12, "quarterly": 4, "semester": 2, "yearly": 1}
+
+
+def _current_period(period_type: Optional[str], today: date) -> Tuple[str, int, int]:
+    """(period_type, year, index) of the period containing today; unknown types are monthly"""
+    if period_type == "yearly":
+        return "yearly", today.year, 1
+    if period_type == "semester":
+        return "semester", today.year, 1 if today.month <= 6 else 2
+    if period_type == "quarterly":
+        return "quarterly", today.year, (today.month - 1) // 3 + 1
+    return "monthly", today.year, today.month
+
+
+def _parse_period(period_type: Optional[str], period_value: Optional[str], today: date) -> Tuple[str, int, int]:
+    """
+    Parse a period value into (period_type, year, index), index being the month,
+    quarter or semester (1 for years):
+    Yearly: "2025", Monthly: "2025-03", Quarterly: "2025-Q1", Semester: "2025-S1".
+    Without a value, or with one matching no format, the current period of period_type is used.
+    """
+    if not period_value:
+        return _current_period(period_type, today)
+    if "-Q" in period_value:
+        parts = period_value.split("-Q")
+        if len(parts) == 2:
+            return "quarterly", int(parts[0]), int(parts[1])
+        # Fallback to current year
+        return "yearly", today.year, 1
+    if "-S" in period_value:
+        parts = period_value.split("-S")
+        if len(parts) == 2 and int(parts[1]) in (1, 2):
+            return "semester", int(parts[0]), int(parts[1])
+        # Invalid semester, fallback to current year
+        return "yearly", today.year, 1
+    if "-" in period_value:
+        parts = period_value.split("-")
+        if len(parts) == 2:
+            return "monthly", int(parts[0]), int(parts[1])
+        return _current_period("monthly", today)
+    if period_value.isdigit():
+        return "yearly", int(period_value), 1
+    return _current_period(period_type, today)
+
+
+def _resolve_period(period_type: Optional[str], period_value: Optional[str]) -> Tuple[str, int, int]:
+    """Parse and validate a period, rejecting malformed values with 400"""
+    try:
+        period = _parse_period(period_type, period_value, date.today())
+        _period_range(*period)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid period value: {period_value}")
+    return period
+
+
+def _period_range(period_type: str, year: int, index: int) -> Tuple[date, date]:
+    """First and last day of a parsed period"""
+    months = 12 // PERIODS_PER_YEAR[period_type]
+    start_month = (index - 1) * months + 1
+    if not 1 <= start_month <= 12:
+        raise ValueError(f"Invalid {period_type} period index: {index}")
+    end_month = start_month + months - 1
+    if end_month == 12:
+        end_date = date(year, 12, 31)
+    else:
+        end_date = date(year, end_month + 1, 1) - timedelta(days=1)
+    return date(year, start_month, 1), end_date
+
+
+def _shift_period(period_type: str, year: int, index: int, periods: int) -> Tuple[str, int, int]:
+    """The period a number of periods before (negative) or after a parsed period"""
+    per_year = PERIODS_PER_YEAR[period_type]
+    position = year * per_year + index - 1 + periods
+    return period_type, position // per_year, position % per_year + 1
+
+
+def _format_period(period_type: str, year: int, index: int) -> str:
+    """Period value string of a parsed period, as accepted by _parse_period"""
+    if period_type == "quarterly":
+        return f"{year}-Q{index}"
+    if period_type == "semester":
+        return f"{year}-S{index}"
+    if period_type == "monthly":
+        return f"{year}-{index:02d}"
+    return str(year)
+
+
 @router.get("/reports/summary")
 async def get_summary(
     start_date: Optional[date] = Query(None),
     end_date: Optional[date] = Query(None),
     period: Optional[str] = Query("monthly"),  # monthly or yearly
     currency: Optional[str] = Query("IDR", description="Currency to convert all amounts to"),
+    engine: Optional[str] = Query(None, description="Execution engine: db or snapshot (default from REPORTS_ENGINE)"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get expense summary with optional currency conversion"""
-    query = db.query(Expense)
-    
     if not start_date or not end_date:
         # Default to current month/year
         today = date.today()
@@ -42,40 +190,23 @@ async def get_summary(
             else:
                 end_date = date(today.year, today.month + 1, 1)
     
-    query = query.filter(Expense.date >= start_date, Expense.date <= end_date)
-    
-    expenses = query.all()
-    total_expenses = len(expenses)
-    
-    # Calculate totals with currency conversion
-    if currency:
-        # Get unique currencies
-        currencies = set(exp.currency for exp in expenses)
-        rates_cache = {}
-        
-        # Fetch exchange rates for each currency
-        for curr in currencies:
-            if curr.upper() != currency.upper():
-                try:
-                    rates = await get_exchange_rates(curr)
-                    rates_cache[curr.upper()] = rates.get(currency.upper(), 1.0)
-                except Exception:
-                    rates_cache[curr.upper()] = 1.0
-        
-        # Sum with conversion
-        total_amount = Decimal("0")
-        for expense in expenses:
-            if expense.currency.upper() == currency.upper():
-                total_amount += Decimal(str(expense.amount))
-            else:
-                rate = rates_cache.get(expense.currency.upper(), Decimal("1"))
-                total_amount += Decimal(str(expense.amount)) * rate
+    if currency and currency.upper() == "IDR" and use_snapshot(engine):
+        fallback_rates = await _snapshot_rates(db)
+        total_expenses, total = analytics_snapshot.summary(start_date, end_date, fallback_rates)
     else:
-        # No conversion, sum as-is
-        total_amount = db.query(func.sum(Expense.amount)).filter(
-            Expense.date >= start_date,
-            Expense.date <= end_date
-        ).scalar() or Decimal("0")
+        if currency and currency.upper() == "IDR" and is_month_aligned(start_date, end_date):
+            # Whole months: sum the monthly rollup instead of scanning expenses
+            rollup_filters = month_range_filters(start_date, end_date)
+            amount_expr = await _rollup_amount_in_idr(db, rollup_filters)
+            result = db.query(
+                func.sum(ExpenseMonthlyRollup.count).label('count'),
+                func.sum(amount_expr).label('total')
+            ).filter(*rollup_filters).one()
+        else:
+            result = await _summary_from_expenses(db, start_date, end_date, currency)
+        total_expenses, total = result.count or 0, result.total or 0
+    
+    total_amount = Decimal(str(total))
     
     avg_amount = total_amount / total_expenses if total_expenses > 0 else Decimal("0")
     
@@ -90,158 +221,108 @@ async def get_summary(
     }
 
 
+async def _summary_from_expenses(db: Session, start_date: date, end_date: date, currency: Optional[str]):
+    # Aggregate in SQL: a single row regardless of how many expenses are in range.
+    # Each expense is converted at the stored rate in effect on its own date.
+    if currency and currency.upper() == "IDR":
+        amount_expr = await _amount_in_idr(db)
+    elif currency:
+        fallback_rates = await _fallback_conversion_rates(db, currency)
+        amount_expr = historical_conversion_expr(
+            Expense.amount, Expense.currency, Expense.date, currency, fallback_rates
+        )
+    else:
+        # No conversion, sum as-is
+        amount_expr = Expense.amount
+    
+    return db.query(
+        func.count(Expense.id).label('count'),
+        func.sum(amount_expr).label('total')
+    ).filter(
+        Expense.date >= start_date,
+        Expense.date <= end_date
+    ).one()
+
+
 @router.get("/reports/trends")
 async def get_trends(
     period: Optional[str] = Query("monthly"),  # monthly, quarterly, semester, yearly
     category_id: Optional[str] = Query(None, description="Single category ID (deprecated, use category_ids)"),
     category_ids: Optional[List[str]] = Query(None, description="Multiple category IDs for OR filtering"),
+    engine: Optional[str] = Query(None, description="Execution engine: db or snapshot (default from REPORTS_ENGINE)"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get spending trends grouped by period"""
-    
-    # Build base query
-    query = db.query(Expense)
+    """Get spending trends in IDR grouped by period"""
+    R = ExpenseMonthlyRollup
     
     # Filter by category if provided - support both single category_id (backward compatibility) and multiple category_ids
-    if category_ids:
-        try:
-            uuid_list = [UUID(cid) for cid in category_ids]
-            query = query.filter(Expense.category_id.in_(uuid_list))
-        except (ValueError, TypeError):
-            pass  # Invalid UUID, ignore filter
-    elif category_id:
-        try:
-            query = query.filter(Expense.category_id == UUID(category_id))
-        except ValueError:
-            pass  # Invalid UUID, ignore filter
+    category_filter = _parse_category_filter(category_id, category_ids)
+    
+    def period_label(year: int, bucket: Optional[int]) -> str:
+        if period == "yearly":
+            return f"{year}"
+        if period == "quarterly":
+            return f"{year}-Q{bucket}"
+        if period == "semester":
+            return f"{year}-S{bucket}"
+        return f"{year}-{bucket:02d}"
+    
+    if use_snapshot(engine):
+        fallback_rates = await _snapshot_rates(db)
+        return {
+            "period": period,
+            "currency": "IDR",
+            "trends": [
+                {"period": period_label(year, bucket), "total": total}
+                for year, bucket, total in analytics_snapshot.trends(period, category_filter, fallback_rates)
+            ]
+        }
+    
+    # Trends cover whole months, so they are served from the monthly rollup
+    filters = []
+    if category_filter is not None:
+        filters.append(R.category_id.in_(category_filter))
     
+    # Bucket within the year in SQL: quarter 1-4, semester 1-2 (Jan-Jun, Jul-Dec), or the month itself
     if period == "yearly":
-        # Group by year
-        results = db.query(
-            extract('year', Expense.date).label('year'),
-            func.sum(Expense.amount).label('total')
-        )
-        if category_ids:
-            try:
-                uuid_list = [UUID(cid) for cid in category_ids]
-                results = results.filter(Expense.category_id.in_(uuid_list))
-            except (ValueError, TypeError):
-                pass
-        elif category_id:
-            try:
-                results = results.filter(Expense.category_id == UUID(category_id))
-            except ValueError:
-                pass
-        results = results.group_by('year').order_by('year').all()
-        
-        trends = []
-        for result in results:
-            trends.append({
-                "period": f"{int(result.year)}",
-                "total": float(result.total or 0)
-            })
+        bucket = None
     elif period == "quarterly":
-        # Group by quarter (every 3 months)
-        # Calculate quarter: (month - 1) // 3 + 1
-        results = db.query(
-            extract('year', Expense.date).label('year'),
-            extract('month', Expense.date).label('month'),
-            func.sum(Expense.amount).label('total')
-        )
-        if category_ids:
-            try:
-                uuid_list = [UUID(cid) for cid in category_ids]
-                results = results.filter(Expense.category_id.in_(uuid_list))
-            except (ValueError, TypeError):
-                pass
-        elif category_id:
-            try:
-                results = results.filter(Expense.category_id == UUID(category_id))
-            except ValueError:
-                pass
-        results = results.group_by('year', 'month').order_by('year', 'month').all()
-        
-        # Group months into quarters
-        quarterly_data = {}
-        for result in results:
-            quarter = ((int(result.month) - 1) // 3) + 1
-            key = f"{int(result.year)}-Q{quarter}"
-            if key not in quarterly_data:
-                quarterly_data[key] = 0.0
-            quarterly_data[key] += float(result.total or 0)
-        
-        trends = []
-        for key in sorted(quarterly_data.keys()):
-            trends.append({
-                "period": key,
-                "total": quarterly_data[key]
-            })
+        bucket = case((R.month <= 3, 1), (R.month <= 6, 2), (R.month <= 9, 3), else_=4)
     elif period == "semester":
-        # Group by semester (every 6 months)
-        # Semester 1: Jan-Jun (months 1-6), Semester 2: Jul-Dec (months 7-12)
-        results = db.query(
-            extract('year', Expense.date).label('year'),
-            extract('month', Expense.date).label('month'),
-            func.sum(Expense.amount).label('total')
-        )
-        if category_ids:
-            try:
-                uuid_list = [UUID(cid) for cid in category_ids]
-                results = results.filter(Expense.category_id.in_(uuid_list))
-            except (ValueError, TypeError):
-                pass
-        elif category_id:
-            try:
-                results = results.filter(Expense.category_id == UUID(category_id))
-            except ValueError:
-                pass
-        results = results.group_by('year', 'month').order_by('year', 'month').all()
-        
-        # Group months into semesters
-        semester_data = {}
-        for result in results:
-            semester = 1 if int(result.month) <= 6 else 2
-            key = f"{int(result.year)}-S{semester}"
-            if key not in semester_data:
-                semester_data[key] = 0.0
-            semester_data[key] += float(result.total or 0)
-        
-        trends = []
-        for key in sorted(semester_data.keys()):
-            trends.append({
-                "period": key,
-                "total": semester_data[key]
-            })
+        bucket = case((R.month <= 6, 1), else_=2)
     else:  # monthly
-        # Group by month
-        results = db.query(
-            extract('year', Expense.date).label('year'),
-            extract('month', Expense.date).label('month'),
-            func.sum(Expense.amount).label('total')
-        )
-        if category_ids:
-            try:
-                uuid_list = [UUID(cid) for cid in category_ids]
-                results = results.filter(Expense.category_id.in_(uuid_list))
-            except (ValueError, TypeError):
-                pass
-        elif category_id:
-            try:
-                results = results.filter(Expense.category_id == UUID(category_id))
-            except ValueError:
-                pass
-        results = results.group_by('year', 'month').order_by('year', 'month').all()
-        
-        trends = []
-        for result in results:
-            trends.append({
-                "period": f"{int(result.year)}-{int(result.month):02d}",
-                "total": float(result.total or 0)
-            })
+        bucket = R.month
+    
+    # Convert and aggregate in the same query. Grouped by label so the
+    # bucket CASE isn't repeated with its own bound parameters.
+    amount_in_idr = await _rollup_amount_in_idr(db, filters)
+    columns = [R.year.label('year'), func.sum(amount_in_idr).label('total')]
+    group_by = ['year']
+    if bucket is not None:
+        columns.append(bucket.label('bucket'))
+        group_by.append('bucket')
+    results = db.query(*columns).filter(
+        *filters
+    ).group_by(
+        *group_by
+    ).having(
+        func.sum(R.count) > 0
+    ).order_by(
+        *group_by
+    ).all()
+    
+    trends = [
+        {
+            "period": period_label(int(result.year), int(result.bucket) if bucket is not None else None),
+            "total": float(result.total or 0)
+        }
+        for result in results
+    ]
     
     return {
         "period": period,
+        "currency": "IDR",
         "trends": trends
     }
 
@@ -252,157 +333,64 @@ async def get_category_breakdown(
     end_date: Optional[date] = Query(None),
     period_type: Optional[str] = Query(None, description="Period type: monthly, quarterly, semester, yearly"),
     period_value: Optional[str] = Query(None, description="Specific period value (e.g., '2025', '2025-03', '2025-Q1', '2025-S1')"),
+    engine: Optional[str] = Query(None, description="Execution engine: db or snapshot (default from REPORTS_ENGINE)"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get category-wise breakdown with optional period-based filtering and IDR conversion"""
     
     # Calculate date range based on period_value or period_type if start_date/end_date not provided
-    today = date.today()
-    
     if not start_date or not end_date:
-        if period_value:
-            # Parse specific period value (same logic as top-expenses)
-            if "-Q" in period_value:
-                # Quarterly format: "2025-Q1"
-                parts = period_value.split("-Q")
-                if len(parts) == 2:
-                    year = int(parts[0])
-                    quarter = int(parts[1])
-                    start_month = ((quarter - 1) * 3) + 1
-                    end_month = quarter * 3
-                    start_date = date(year, start_month, 1)
-                    if end_month == 12:
-                        end_date = date(year, 12, 31)
-                    else:
-                        end_date = date(year, end_month + 1, 1) - timedelta(days=1)
-                else:
-                    start_date = date(today.year, 1, 1)
-                    end_date = date(today.year, 12, 31)
-            elif "-S" in period_value:
-                # Semester format: "2025-S1" or "2025-S2"
-                parts = period_value.split("-S")
-                if len(parts) == 2:
-                    year = int(parts[0])
-                    semester = int(parts[1])
-                    if semester == 1:
-                        # Semester 1: Jan-Jun
-                        start_date = date(year, 1, 1)
-                        end_date = date(year, 6, 30)
-                    elif semester == 2:
-                        # Semester 2: Jul-Dec
-                        start_date = date(year, 7, 1)
-                        end_date = date(year, 12, 31)
-                    else:
-                        # Invalid semester, fallback to current year
-                        start_date = date(today.year, 1, 1)
-                        end_date = date(today.year, 12, 31)
-                else:
-                    start_date = date(today.year, 1, 1)
-                    end_date = date(today.year, 12, 31)
-            elif "-" in period_value:
-                # Monthly format: "2025-03"
-                parts = period_value.split("-")
-                if len(parts) == 2:
-                    year = int(parts[0])
-                    month = int(parts[1])
-                    start_date = date(year, month, 1)
-                    if month == 12:
-                        end_date = date(year, 12, 31)
-                    else:
-                        end_date = date(year, month + 1, 1) - timedelta(days=1)
-                else:
-                    start_date = date(today.year, today.month, 1)
-                    if today.month == 12:
-                        end_date = date(today.year, 12, 31)
-                    else:
-                        end_date = date(today.year, today.month + 1, 1) - timedelta(days=1)
-            elif period_value.isdigit():
-                # Yearly format: "2025"
-                year = int(period_value)
-                start_date = date(year, 1, 1)
-                end_date = date(year, 12, 31)
-            else:
-                # Fallback to current period based on period_type
-                if period_type == "yearly":
-                    start_date = date(today.year, 1, 1)
-                    end_date = date(today.year, 12, 31)
-                elif period_type == "semester":
-                    current_semester = 1 if today.month <= 6 else 2
-                    if current_semester == 1:
-                        start_date = date(today.year, 1, 1)
-                        end_date = date(today.year, 6, 30)
-                    else:
-                        start_date = date(today.year, 7, 1)
-                        end_date = date(today.year, 12, 31)
-                elif period_type == "quarterly":
-                    current_quarter = ((today.month - 1) // 3) + 1
-                    start_month = ((current_quarter - 1) * 3) + 1
-                    end_month = current_quarter * 3
-                    start_date = date(today.year, start_month, 1)
-                    if end_month == 12:
-                        end_date = date(today.year, 12, 31)
-                    else:
-                        end_date = date(today.year, end_month + 1, 1) - timedelta(days=1)
-                else:  # monthly or default
-                    start_date = date(today.year, today.month, 1)
-                    if today.month == 12:
-                        end_date = date(today.year, 12, 31)
-                    else:
-                        end_date = date(today.year, today.month + 1, 1) - timedelta(days=1)
-        elif period_type:
-            # Use period_type to determine current period
-            if period_type == "yearly":
-                start_date = date(today.year, 1, 1)
-                end_date = date(today.year, 12, 31)
-            elif period_type == "semester":
-                current_semester = 1 if today.month <= 6 else 2
-                if current_semester == 1:
-                    start_date = date(today.year, 1, 1)
-                    end_date = date(today.year, 6, 30)
-                else:
-                    start_date = date(today.year, 7, 1)
-                    end_date = date(today.year, 12, 31)
-            elif period_type == "quarterly":
-                current_quarter = ((today.month - 1) // 3) + 1
-                start_month = ((current_quarter - 1) * 3) + 1
-                end_month = current_quarter * 3
-                start_date = date(today.year, start_month, 1)
-                if end_month == 12:
-                    end_date = date(today.year, 12, 31)
-                else:
-                    end_date = date(today.year, end_month + 1, 1) - timedelta(days=1)
-            else:  # monthly
-                start_date = date(today.year, today.month, 1)
-                if today.month == 12:
-                    end_date = date(today.year, 12, 31)
-                else:
-                    end_date = date(today.year, today.month + 1, 1) - timedelta(days=1)
-        else:
-            # Default to current month
-            start_date = date(today.year, today.month, 1)
-            if today.month == 12:
-                end_date = date(today.year, 12, 31)
-            else:
-                end_date = date(today.year, today.month + 1, 1) - timedelta(days=1)
-    
-    # Use efficient JOIN query to get expenses with categories in one query
-    # This avoids N+1 query problems that would occur with Postgres
-    # Start from Expense table and LEFT JOIN to Category to handle expenses without categories
-    results = db.query(
-        Expense.category_id.label('category_id'),
-        Category.name.label('category_name'),
-        Expense.currency,
-        func.sum(Expense.amount).label('total'),
-        func.count(Expense.id).label('count')
-    ).outerjoin(
-        Category, Expense.category_id == Category.id
-    ).filter(
-        Expense.date >= start_date,
-        Expense.date <= end_date
-    ).group_by(
-        Expense.category_id, Category.name, Expense.currency
-    ).all()
+        start_date, end_date = _period_range(*_resolve_period(period_type, period_value))
+    
+    if use_snapshot(engine):
+        fallback_rates = await _snapshot_rates(db)
+        totals = analytics_snapshot.category_totals(start_date, end_date, fallback_rates)
+        names = dict(db.query(Category.id, Category.name).filter(
+            Category.id.in_([cat_id for cat_id, _, _ in totals if cat_id is not None])
+        ).all())
+        results = [
+            SimpleNamespace(category_id=cat_id, category_name=names.get(cat_id), total=total, count=count)
+            for cat_id, total, count in totals
+        ]
+    elif is_month_aligned(start_date, end_date):
+        # Whole months: a few rollup rows per month instead of every expense
+        rollup_filters = month_range_filters(start_date, end_date)
+        amount_in_idr = await _rollup_amount_in_idr(db, rollup_filters)
+        results = db.query(
+            ExpenseMonthlyRollup.category_id.label('category_id'),
+            Category.name.label('category_name'),
+            func.sum(amount_in_idr).label('total'),
+            func.sum(ExpenseMonthlyRollup.count).label('count')
+        ).outerjoin(
+            Category, ExpenseMonthlyRollup.category_id == Category.id
+        ).filter(
+            *rollup_filters
+        ).group_by(
+            ExpenseMonthlyRollup.category_id, Category.name
+        ).having(
+            func.sum(ExpenseMonthlyRollup.count) > 0
+        ).all()
+    else:
+        # IDR amount of each expense at the rate in effect on its own date
+        amount_in_idr = await _amount_in_idr(db)
+        
+        # Use efficient JOIN query to get expenses with categories in one query
+        # This avoids N+1 query problems that would occur with Postgres
+        # Start from Expense table and LEFT JOIN to Category to handle expenses without categories
+        results = db.query(
+            Expense.category_id.label('category_id'),
+            Category.name.label('category_name'),
+            func.sum(amount_in_idr).label('total'),
+            func.count(Expense.id).label('count')
+        ).outerjoin(
+            Category, Expense.category_id == Category.id
+        ).filter(
+            Expense.date >= start_date,
+            Expense.date <= end_date
+        ).group_by(
+            Expense.category_id, Category.name
+        ).all()
     
     if not results:
         return {
@@ -411,67 +399,14 @@ async def get_category_breakdown(
             "breakdown": []
         }
     
-    # Get unique currencies from results and fetch exchange rates for IDR conversion
-    currencies = set(result.currency for result in results if result.currency)
-    conversion_rates = {}
-    
-    for curr in currencies:
-        currency_upper = curr.upper()
-        if currency_upper == "IDR":
-            conversion_rates[currency_upper] = Decimal("1.0")
-        else:
-            try:
-                rates = await get_exchange_rates(currency_upper)
-                idr_rate = rates.get("IDR")
-                if idr_rate:
-                    conversion_rates[currency_upper] = Decimal(str(idr_rate))
-                else:
-                    # Fallback: try via USD
-                    usd_rate = rates.get("USD")
-                    if usd_rate and usd_rate > 0:
-                        usd_rates = await get_exchange_rates("USD")
-                        idr_from_usd = usd_rates.get("IDR", 1.0)
-                        conversion_rates[currency_upper] = Decimal(str(float(idr_from_usd) / float(usd_rate)))
-                    else:
-                        conversion_rates[currency_upper] = Decimal("1.0")
-            except Exception:
-                conversion_rates[currency_upper] = Decimal("1.0")
-    
-    # Group by category and calculate totals in IDR
-    category_totals = {}
-    category_counts = {}
-    category_names = {}
-    
-    for result in results:
-        category_id = str(result.category_id) if result.category_id else None
-        category_name = result.category_name if result.category_name else "Uncategorized"
-        
-        # Store category name (handle both None and string category_id)
-        category_names[category_id] = category_name
-        
-        # Convert to IDR
-        currency_upper = result.currency.upper() if result.currency else "IDR"
-        rate = conversion_rates.get(currency_upper, Decimal("1.0"))
-        amount_in_idr = Decimal(str(result.total or 0)) * rate
-        
-        # Accumulate totals
-        if category_id not in category_totals:
-            category_totals[category_id] = Decimal("0")
-            category_counts[category_id] = 0
-        
-        category_totals[category_id] += amount_in_idr
-        category_counts[category_id] += (result.count or 0)
-    
     # Build breakdown list
     breakdown = []
-    for category_id, total in category_totals.items():
-        category_name = category_names.get(category_id, "Uncategorized")
-        
+    for result in results:
         breakdown.append({
-            "category_id": category_id or "",
-            "category_name": category_name,
-            "total": float(total),
-            "count": category_counts[category_id]
+            "category_id": str(result.category_id) if result.category_id else "",
+            "category_name": result.category_name if result.category_name else "Uncategorized",
+            "total": float(result.total or 0),
+            "count": result.count or 0
         })
     
     # Sort by total descending
@@ -484,6 +419,151 @@ async def get_category_breakdown(
     }
 
 
+@router.get("/reports/compare")
+async def compare_periods(
+    period_value: Optional[str] = Query(None, description="Period to compare (e.g., '2025', '2025-03', '2025-Q1', '2025-S1')"),
+    period_type: Optional[str] = Query("monthly", description="Period type used when period_value is omitted: monthly, quarterly, semester, yearly"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Per-category IDR totals of a period next to the previous period and the same
+    period a year earlier, from one conditionally aggregated query over the monthly rollup
+    """
+    current = _resolve_period(period_type, period_value)
+    periods = {
+        "current": current,
+        "previous": _shift_period(*current, -1),
+        "year_over_year": _shift_period(*current, -PERIODS_PER_YEAR[current[0]]),
+    }
+    ranges = {key: _period_range(*period) for key, period in periods.items()}
+    
+    # Periods are whole months, so each maps to a range of rollup rows
+    in_period = {key: and_(*month_range_filters(start, end)) for key, (start, end) in ranges.items()}
+    rollup_filters = [or_(*in_period.values())]
+    amount_in_idr = await _rollup_amount_in_idr(db, rollup_filters)
+    
+    columns = []
+    for key, condition in in_period.items():
+        columns.append(func.sum(case((condition, amount_in_idr), else_=0)).label(f"{key}_total"))
+        columns.append(func.sum(case((condition, ExpenseMonthlyRollup.count), else_=0)).label(f"{key}_count"))
+    results = db.query(
+        ExpenseMonthlyRollup.category_id.label('category_id'),
+        Category.name.label('category_name'),
+        *columns
+    ).outerjoin(
+        Category, ExpenseMonthlyRollup.category_id == Category.id
+    ).filter(
+        *rollup_filters
+    ).group_by(
+        ExpenseMonthlyRollup.category_id, Category.name
+    ).having(
+        func.sum(ExpenseMonthlyRollup.count) > 0
+    ).all()
+    
+    def with_changes(entry: dict) -> dict:
+        current_total = entry["current"]["total"]
+        for key in ("previous", "year_over_year"):
+            base_total = entry[key]["total"]
+            entry[f"change_vs_{key}"] = {
+                "amount": current_total - base_total,
+                "percent": (current_total - base_total) / base_total * 100 if base_total else None
+            }
+        return entry
+    
+    totals = {key: {"total": 0.0, "count": 0} for key in periods}
+    categories = []
+    for result in results:
+        entry = {
+            "category_id": str(result.category_id) if result.category_id else "",
+            "category_name": result.category_name if result.category_name else "Uncategorized",
+        }
+        for key in periods:
+            total = float(getattr(result, f"{key}_total") or 0)
+            count = int(getattr(result, f"{key}_count") or 0)
+            entry[key] = {"total": total, "count": count}
+            totals[key]["total"] += total
+            totals[key]["count"] += count
+        categories.append(with_changes(entry))
+    
+    categories.sort(key=lambda x: (x["current"]["total"], x["previous"]["total"]), reverse=True)
+    
+    return {
+        "period_type": current[0],
+        "currency": "IDR",
+        "periods": {
+            key: {
+                "period_value": _format_period(*period),
+                "start_date": ranges[key][0].isoformat(),
+                "end_date": ranges[key][1].isoformat()
+            }
+            for key, period in periods.items()
+        },
+        "totals": with_changes(totals),
+        "categories": categories
+    }
+
+
+@router.get("/reports/distribution")
+async def get_distribution(
+    start_date: Optional[date] = Query(None),
+    end_date: Optional[date] = Query(None),
+    period_type: Optional[str] = Query(None, description="Period type: monthly, quarterly, semester, yearly"),
+    period_value: Optional[str] = Query(None, description="Specific period value (e.g., '2025', '2025-03', '2025-Q1', '2025-S1')"),
+    category_id: Optional[str] = Query(None, description="Single category ID (deprecated, use category_ids)"),
+    category_ids: Optional[List[str]] = Query(None, description="Multiple category IDs for OR filtering"),
+    bins: int = Query(20, ge=1, le=100, description="Number of equal-width histogram bins"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Expense size distribution in IDR for a period: p25/p50/p75/p90/p99, a histogram
+    and outlier counts (Tukey fences), overall and per category.
+    Summarized in the database; only the buckets are returned.
+    """
+    if not start_date or not end_date:
+        start_date, end_date = _period_range(*_resolve_period(period_type, period_value))
+    
+    filters = [Expense.date >= start_date, Expense.date <= end_date]
+    category_filter = _parse_category_filter(category_id, category_ids)
+    if category_filter is not None:
+        filters.append(Expense.category_id.in_(category_filter))
+    
+    distribution = spending_distribution(db, await _amount_in_idr(db), filters, bins)
+    if distribution is None:
+        return {
+            "start_date": start_date.isoformat(),
+            "end_date": end_date.isoformat(),
+            "currency": "IDR",
+            "bin_edges": [],
+            "overall": None,
+            "categories": []
+        }
+    
+    category_stats = distribution["categories"]
+    names = dict(db.query(Category.id, Category.name).filter(
+        Category.id.in_([cat_id for cat_id in category_stats if cat_id is not None])
+    ).all())
+    categories = [
+        {
+            "category_id": str(cat_id) if cat_id else "",
+            "category_name": names.get(cat_id) or "Uncategorized",
+            **stats
+        }
+        for cat_id, stats in category_stats.items()
+    ]
+    categories.sort(key=lambda x: x["count"], reverse=True)
+    
+    return {
+        "start_date": start_date.isoformat(),
+        "end_date": end_date.isoformat(),
+        "currency": "IDR",
+        "bin_edges": distribution["bin_edges"],
+        "overall": distribution["overall"],
+        "categories": categories
+    }
+
+
 @router.get("/reports/top-expenses")
 async def get_top_expenses(
     period_type: Optional[str] = Query("monthly", description="Period type: monthly, quarterly, semester, yearly"),
@@ -492,242 +572,60 @@ async def get_top_expenses(
     category_ids: Optional[List[str]] = Query(None, description="Multiple category IDs for OR filtering"),
     limit: int = Query(500, ge=1, le=500, description="Number of top expenses to return"),
     skip: int = Query(0, ge=0, description="Number of expenses to skip for pagination"),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from a previous page's next_cursor (takes precedence over skip)"),
+    engine: Optional[str] = Query(None, description="Execution engine: db or snapshot (default from REPORTS_ENGINE)"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get top expenses filtered by period and category, sorted by IDR amount descending"""
     
     # Calculate date range based on period_value or period_type
-    today = date.today()
-    
-    if period_value:
-        # Parse specific period value
-        # Yearly: "2025"
-        # Monthly: "2025-03"
-        # Quarterly: "2025-Q1"
-        # Semester: "2025-S1"
-        if "-Q" in period_value:
-            # Quarterly format: "2025-Q1"
-            parts = period_value.split("-Q")
-            if len(parts) == 2:
-                year = int(parts[0])
-                quarter = int(parts[1])
-                start_month = ((quarter - 1) * 3) + 1
-                end_month = quarter * 3
-                start_date = date(year, start_month, 1)
-                if end_month == 12:
-                    end_date = date(year, 12, 31)
-                else:
-                    end_date = date(year, end_month + 1, 1) - timedelta(days=1)
-            else:
-                # Fallback to current year
-                start_date = date(today.year, 1, 1)
-                end_date = date(today.year, 12, 31)
-        elif "-S" in period_value:
-            # Semester format: "2025-S1" or "2025-S2"
-            parts = period_value.split("-S")
-            if len(parts) == 2:
-                year = int(parts[0])
-                semester = int(parts[1])
-                if semester == 1:
-                    # Semester 1: Jan-Jun
-                    start_date = date(year, 1, 1)
-                    end_date = date(year, 6, 30)
-                elif semester == 2:
-                    # Semester 2: Jul-Dec
-                    start_date = date(year, 7, 1)
-                    end_date = date(year, 12, 31)
-                else:
-                    # Invalid semester, fallback to current year
-                    start_date = date(today.year, 1, 1)
-                    end_date = date(today.year, 12, 31)
-            else:
-                # Fallback to current year
-                start_date = date(today.year, 1, 1)
-                end_date = date(today.year, 12, 31)
-        elif "-" in period_value:
-            # Monthly format: "2025-03"
-            parts = period_value.split("-")
-            if len(parts) == 2:
-                year = int(parts[0])
-                month = int(parts[1])
-                start_date = date(year, month, 1)
-                # Get last day of month
-                if month == 12:
-                    end_date = date(year, 12, 31)
-                else:
-                    end_date = date(year, month + 1, 1) - timedelta(days=1)
-            else:
-                # Fallback to current month
-                start_date = date(today.year, today.month, 1)
-                if today.month == 12:
-                    end_date = date(today.year, 12, 31)
-                else:
-                    end_date = date(today.year, today.month + 1, 1) - timedelta(days=1)
-        elif period_value.isdigit():
-            # Yearly format: "2025"
-            year = int(period_value)
-            start_date = date(year, 1, 1)
-            end_date = date(year, 12, 31)
-        else:
-            # Fallback to current period based on period_type
-            if period_type == "yearly":
-                start_date = date(today.year, 1, 1)
-                end_date = date(today.year, 12, 31)
-            elif period_type == "semester":
-                current_semester = 1 if today.month <= 6 else 2
-                if current_semester == 1:
-                    start_date = date(today.year, 1, 1)
-                    end_date = date(today.year, 6, 30)
-                else:
-                    start_date = date(today.year, 7, 1)
-                    end_date = date(today.year, 12, 31)
-            elif period_type == "quarterly":
-                current_quarter = ((today.month - 1) // 3) + 1
-                start_month = ((current_quarter - 1) * 3) + 1
-                end_month = current_quarter * 3
-                start_date = date(today.year, start_month, 1)
-                if end_month == 12:
-                    end_date = date(today.year, 12, 31)
-                else:
-                    end_date = date(today.year, end_month + 1, 1) - timedelta(days=1)
-            else:  # monthly
-                start_date = date(today.year, today.month, 1)
-                if today.month == 12:
-                    end_date = date(today.year, 12, 31)
-                else:
-                    end_date = date(today.year, today.month + 1, 1) - timedelta(days=1)
-    else:
-        # Use period_type to determine current period
-        if period_type == "yearly":
-            start_date = date(today.year, 1, 1)
-            end_date = date(today.year, 12, 31)
-        elif period_type == "semester":
-            # Current semester: S1 (Jan-Jun), S2 (Jul-Dec)
-            current_semester = 1 if today.month <= 6 else 2
-            if current_semester == 1:
-                start_date = date(today.year, 1, 1)
-                end_date = date(today.year, 6, 30)
-            else:
-                start_date = date(today.year, 7, 1)
-                end_date = date(today.year, 12, 31)
-        elif period_type == "quarterly":
-            # Current quarter: Q1 (Jan-Mar), Q2 (Apr-Jun), Q3 (Jul-Sep), Q4 (Oct-Dec)
-            current_quarter = ((today.month - 1) // 3) + 1
-            start_month = ((current_quarter - 1) * 3) + 1
-            end_month = current_quarter * 3
-            start_date = date(today.year, start_month, 1)
-            # Get last day of end month
-            if end_month == 12:
-                end_date = date(today.year, 12, 31)
-            else:
-                end_date = date(today.year, end_month + 1, 1) - timedelta(days=1)
-        else:  # monthly
-            start_date = date(today.year, today.month, 1)
-            # Get last day of current month
-            if today.month == 12:
-                end_date = date(today.year, 12, 31)
-            else:
-                end_date = date(today.year, today.month + 1, 1) - timedelta(days=1)
-    
-    # Build base query with eager loading to prevent N+1 queries
-    query = db.query(Expense).options(joinedload(Expense.category)).filter(
-        Expense.date >= start_date,
-        Expense.date <= end_date
-    )
+    start_date, end_date = _period_range(*_resolve_period(period_type, period_value))
     
     # Filter by category if provided
-    if category_ids:
-        try:
-            uuid_list = [UUID(cid) for cid in category_ids]
-            query = query.filter(Expense.category_id.in_(uuid_list))
-        except (ValueError, TypeError):
-            pass  # Invalid UUID, ignore filter
-    elif category_id:
-        try:
-            query = query.filter(Expense.category_id == UUID(category_id))
-        except ValueError:
-            pass  # Invalid UUID, ignore filter
-    
-    # Get all expenses matching the filters
-    expenses = query.all()
+    category_filter = _parse_category_filter(category_id, category_ids)
     
-    if not expenses:
-        return {
-            "period_type": period_type,
-            "period_value": period_value,
-            "start_date": start_date.isoformat(),
-            "end_date": end_date.isoformat(),
-            "expenses": [],
-            "has_more": False,
-            "total_count": 0
+    cursor_key = None
+    if cursor:
+        try:
+            cursor_key = _decode_top_expenses_cursor(cursor)
+        except (ValueError, TypeError, KeyError, InvalidOperation):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    if use_snapshot(engine):
+        # Rank in memory, then load just the page's rows
+        fallback_rates = await _snapshot_rates(db)
+        after = (float(cursor_key[0]), cursor_key[1]) if cursor_key else None
+        total_count, page, has_more = analytics_snapshot.top(
+            start_date, end_date, category_filter, fallback_rates, limit, skip, after
+        )
+        page_expenses = {
+            e.id: e for e in db.query(Expense).filter(Expense.id.in_([expense_id for expense_id, _ in page])).all()
         }
+        rows = [(page_expenses[expense_id], amount) for expense_id, amount in page if expense_id in page_expenses]
+    else:
+        total_count, rows, has_more = await _top_expenses_from_db(
+            db, start_date, end_date, category_filter, limit, skip, cursor_key
+        )
     
-    # Get unique currencies and fetch exchange rates
-    currencies = set(exp.currency for exp in expenses)
-    conversion_rates = {}
-    
-    # Fetch exchange rates for IDR conversion
-    for curr in currencies:
-        currency_upper = curr.upper()
-        if currency_upper == "IDR":
-            conversion_rates[currency_upper] = Decimal("1.0")
-        else:
-            try:
-                rates = await get_exchange_rates(currency_upper)
-                idr_rate = rates.get("IDR")
-                if idr_rate:
-                    conversion_rates[currency_upper] = Decimal(str(idr_rate))
-                else:
-                    # Fallback: try via USD
-                    usd_rate = rates.get("USD")
-                    if usd_rate and usd_rate > 0:
-                        usd_rates = await get_exchange_rates("USD")
-                        idr_from_usd = usd_rates.get("IDR", 1.0)
-                        conversion_rates[currency_upper] = Decimal(str(float(idr_from_usd) / float(usd_rate)))
-                    else:
-                        conversion_rates[currency_upper] = Decimal("1.0")
-            except Exception:
-                conversion_rates[currency_upper] = Decimal("1.0")
-    
-    # Calculate IDR amounts and create list with expenses
-    expenses_with_idr = []
-    for expense in expenses:
-        currency_upper = expense.currency.upper()
-        rate = conversion_rates.get(currency_upper, Decimal("1.0"))
-        amount_in_idr = Decimal(str(expense.amount)) * rate
-        
-        expenses_with_idr.append({
-            "expense": expense,
-            "amount_in_idr": float(amount_in_idr)
-        })
-    
-    # Sort by IDR amount descending
-    expenses_with_idr.sort(key=lambda x: x["amount_in_idr"], reverse=True)
-    
-    # Calculate total count before pagination
-    total_count = len(expenses_with_idr)
-    
-    # Apply pagination: skip and limit
-    paginated_expenses = expenses_with_idr[skip:skip + limit]
-    
-    # Check if there are more expenses
-    has_more = (skip + limit) < total_count
+    next_cursor = None
+    if has_more and rows:
+        last_expense, last_amount = rows[-1]
+        next_cursor = _encode_top_expenses_cursor(last_amount, last_expense.id)
     
     # Convert to response format
-    from app.schemas.expense import ExpenseResponse
     result_expenses = []
-    for item in paginated_expenses:
+    for expense, expense_amount_in_idr in rows:
         expense_dict = {
-            "id": str(item["expense"].id),
-            "amount": float(item["expense"].amount),
-            "currency": item["expense"].currency,
-            "description": item["expense"].description,
-            "category_id": str(item["expense"].category_id) if item["expense"].category_id else None,
-            "date": item["expense"].date.isoformat(),
-            "created_at": item["expense"].created_at.isoformat() if item["expense"].created_at else None,
-            "updated_at": item["expense"].updated_at.isoformat() if item["expense"].updated_at else None,
-            "amount_in_idr": item["amount_in_idr"]
+            "id": str(expense.id),
+            "amount": float(expense.amount),
+            "currency": expense.currency,
+            "description": expense.description,
+            "category_id": str(expense.category_id) if expense.category_id else None,
+            "date": expense.date.isoformat(),
+            "created_at": expense.created_at.isoformat() if expense.created_at else None,
+            "updated_at": expense.updated_at.isoformat() if expense.updated_at else None,
+            "amount_in_idr": float(expense_amount_in_idr)
         }
         result_expenses.append(expense_dict)
     
@@ -738,5 +636,57 @@ async def get_top_expenses(
         "end_date": end_date.isoformat(),
         "expenses": result_expenses,
         "has_more": has_more,
-        "total_count": total_count
+        "total_count": total_count,
+        "next_cursor": next_cursor
     }
+
+
+async def _top_expenses_from_db(
+    db: Session,
+    start_date: date,
+    end_date: date,
+    category_filter: Optional[List[UUID]],
+    limit: int,
+    skip: int,
+    cursor_key
+):
+    """Top expenses page ranked in SQL. Returns (total_count, [(expense, amount_in_idr)], has_more)."""
+    query = db.query(Expense).filter(
+        Expense.date >= start_date,
+        Expense.date <= end_date
+    )
+    if category_filter is not None:
+        query = query.filter(Expense.category_id.in_(category_filter))
+    
+    # Cheap COUNT instead of materializing every matching row
+    total_count = query.with_entities(func.count(Expense.id)).scalar() or 0
+    if total_count == 0:
+        return 0, [], False
+    
+    # Sort on the materialized, indexed amount_idr (stored in cents). Only rows saved
+    # before a rate was known need converting in SQL, at their own date's rate;
+    # that expression is rounded to cents so cursor values round-trip exactly.
+    if query.filter(Expense.amount_idr.is_(None)).with_entities(Expense.id).first() is None:
+        amount_in_idr = Expense.amount_idr
+    else:
+        amount_in_idr = func.round(await _amount_in_idr(db), 2)
+    
+    if cursor_key:
+        # Keyset pagination: seek past the last (amount_in_idr, id) of the previous page
+        cursor_amount, cursor_id = cursor_key
+        query = query.filter(
+            or_(
+                amount_in_idr < cursor_amount,
+                and_(amount_in_idr == cursor_amount, Expense.id < cursor_id)
+            )
+        )
+    
+    query = query.with_entities(Expense, amount_in_idr.label('amount_in_idr')).order_by(
+        amount_in_idr.desc(), Expense.id.desc()
+    )
+    if not cursor_key:
+        query = query.offset(skip)
+    
+    # Fetch one extra row to know whether another page exists
+    rows = query.limit(limit + 1).all()
+    return total_count, rows[:limit], len(rows) > limit
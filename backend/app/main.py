@@ -1,5 +1,6 @@
 import logging
 import sys
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
@@ -9,6 +10,8 @@ from dotenv import load_dotenv
 from app.database import engine, Base
 from app.api import expenses, categories, reports, export, backup, currency, import_api, auth, admin, history, rent_expenses, dashboard
 from app.middleware.query_profiler import setup_query_profiling
+from app.services.currency import start_rate_refresher, stop_rate_refresher
+from app.services.audit import audit_log
 
 # Configure logging first
 logging.basicConfig(
@@ -45,10 +48,26 @@ except ImportError as e:
 # Create database tables
 Base.metadata.create_all(bind=engine)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Keep exchange rates in memory so request handlers never wait on the upstream API
+    await start_rate_refresher()
+    # Write expense history in batches, replaying events spooled before a crash
+    await audit_log.start()
+    # Recompute popular dashboard ranges at startup and after cache invalidations
+    dashboard.dashboard_warmer.start()
+    yield
+    await dashboard.dashboard_warmer.stop()
+    await audit_log.stop()
+    await stop_rate_refresher()
+
+
 app = FastAPI(
     title="Expense Tracker API",
     description="Backend API for Expense Tracker application",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Enable query profiling in development mode
@@ -70,6 +89,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Cursor for the next page of GET /expenses
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Include routers
@@ -4,5 +4,7 @@ from .backup import Backup
 from .user import User
 from .history import ExpenseHistory
 from .rent_expense import RentExpense
+from .exchange_rate import ExchangeRate
+from .expense_rollup import ExpenseMonthlyRollup
 
-__all__ = ["Expense", "Category", "Backup", "User", "ExpenseHistory", "RentExpense"]
+__all__ = ["Expense", "Category", "Backup", "User", "ExpenseHistory", "RentExpense", "ExchangeRate", "ExpenseMonthlyRollup"]
@@ -0,0 +1,21 @@
+from sqlalchemy import Column, String, Numeric, Date, DateTime, PrimaryKeyConstraint
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class ExchangeRate(Base):
+    __tablename__ = "exchange_rates"
+
+    date = Column(Date, nullable=False)
+    base = Column(String(3), nullable=False)  # Base currency, e.g. 'USD'
+    quote = Column(String(3), nullable=False)  # Units of quote per 1 unit of base
+    rate = Column(Numeric(24, 10), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    # (base, quote, date) serves the "latest rate on or before a date" lookup
+    __table_args__ = (
+        PrimaryKeyConstraint('base', 'quote', 'date', name='pk_exchange_rates'),
+    )
+
+    def __repr__(self):
+        return f"<ExchangeRate(date={self.date}, {self.base}->{self.quote}={self.rate})>"
@@ -12,6 +12,9 @@ class Expense(Base):
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     amount = Column(Numeric(15, 2), nullable=False)
     currency = Column(String(3), nullable=False, default="IDR")
+    # Amount in IDR at the rate in effect on the expense date, set on write
+    # (NULL until a rate is known; see services.currency.rerate_expenses)
+    amount_idr = Column(Numeric(18, 2), nullable=True, index=True)
     description = Column(String, nullable=False)
     category_id = Column(UUID(as_uuid=True), ForeignKey("categories.id"), nullable=True)
     date = Column(Date, nullable=False, index=True)
@@ -0,0 +1,32 @@
+from sqlalchemy import Column, String, Numeric, Integer, ForeignKey, Index
+from sqlalchemy.dialects.postgresql import UUID
+import uuid
+from app.database import Base
+
+
+class ExpenseMonthlyRollup(Base):
+    """
+    Running totals of expenses per (year, month, category, currency).
+
+    Maintained in the same transaction as expense writes (see services.rollup).
+    A group may span several rows when concurrent writers both insert it, so
+    readers always SUM over the group.
+    """
+    __tablename__ = "expense_monthly_rollup"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    year = Column(Integer, nullable=False)
+    month = Column(Integer, nullable=False)
+    category_id = Column(UUID(as_uuid=True), ForeignKey("categories.id", ondelete="CASCADE"), nullable=True)
+    currency = Column(String(3), nullable=False)
+    total = Column(Numeric(18, 2), nullable=False, default=0)  # In the expenses' own currency
+    count = Column(Integer, nullable=False, default=0)
+    total_idr = Column(Numeric(18, 2), nullable=False, default=0)  # Sum of amount_idr where set
+    unrated_total = Column(Numeric(18, 2), nullable=False, default=0)  # Sum of amount where amount_idr is NULL
+
+    __table_args__ = (
+        Index('ix_expense_monthly_rollup_period', 'year', 'month'),
+    )
+
+    def __repr__(self):
+        return f"<ExpenseMonthlyRollup({self.year}-{self.month:02d}, {self.currency}, total={self.total}, count={self.count})>"
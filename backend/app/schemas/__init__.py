@@ -1,4 +1,4 @@
-from .expense import ExpenseCreate, ExpenseUpdate, ExpenseResponse
+from .expense import ExpenseCreate, ExpenseUpdate, ExpenseResponse, ExpenseBulkRequest, ExpenseBulkResponse
 from .category import CategoryCreate, CategoryUpdate, CategoryResponse
 from .backup import BackupResponse
 
@@ -6,6 +6,8 @@ __all__ = [
     "ExpenseCreate",
     "ExpenseUpdate",
     "ExpenseResponse",
+    "ExpenseBulkRequest",
+    "ExpenseBulkResponse",
     "CategoryCreate",
     "CategoryUpdate",
     "CategoryResponse",
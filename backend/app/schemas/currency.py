@@ -0,0 +1,28 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+
+# Upper bound on items per batch request
+MAX_BATCH_CONVERSIONS = 5000
+
+
+class ConversionItem(BaseModel):
+    amount: float
+    from_currency: str = Field(min_length=3, max_length=3, description="Source currency code")
+    to_currency: str = Field(default="IDR", min_length=3, max_length=3, description="Target currency code")
+
+
+class ConvertBatchRequest(BaseModel):
+    items: List[ConversionItem] = Field(max_length=MAX_BATCH_CONVERSIONS)
+
+
+class ConversionResult(BaseModel):
+    original_amount: float
+    original_currency: str
+    converted_amount: float
+    converted_currency: str
+    error: Optional[str] = None
+
+
+class ConvertBatchResponse(BaseModel):
+    results: List[ConversionResult]
@@ -26,8 +26,29 @@ class ExpenseUpdate(BaseModel):
 
 class ExpenseResponse(ExpenseBase):
     id: UUID
+    amount_idr: Optional[float] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
+
+
+# Most operations (creates + updates + deletes) accepted by one POST /expenses/bulk
+BULK_MAX_OPERATIONS = 1000
+
+
+class ExpenseBulkUpdate(ExpenseUpdate):
+    id: UUID
+
+
+class ExpenseBulkRequest(BaseModel):
+    create: List[ExpenseCreate] = Field(default_factory=list, max_length=BULK_MAX_OPERATIONS)
+    update: List[ExpenseBulkUpdate] = Field(default_factory=list, max_length=BULK_MAX_OPERATIONS)
+    delete: List[UUID] = Field(default_factory=list, max_length=BULK_MAX_OPERATIONS)
+
+
+class ExpenseBulkResponse(BaseModel):
+    created: List[ExpenseResponse]
+    updated: List[ExpenseResponse]
+    deleted: List[UUID]
@@ -0,0 +1,422 @@
+"""
+Columnar in-process snapshot of expenses for report endpoints.
+
+Reports are read-heavy and expense writes are rare, so a process can keep every
+expense as a handful of NumPy columns and answer range/category aggregations
+with vectorized masks instead of a database round trip.
+
+Range totals (overall and per category, in IDR) come from per-day prefix sums,
+so any start_date/end_date pair costs two lookups and a subtraction no matter
+how many years it spans.
+
+The snapshot is built lazily on first use and kept current by the expense
+write paths in this process. Writes made by other workers are picked up when
+the snapshot is rebuilt after ANALYTICS_SNAPSHOT_MAX_AGE_SECONDS.
+"""
+from datetime import date
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from uuid import UUID
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.models.expense import Expense
+
+logger = logging.getLogger(__name__)
+
+# Report execution engines selectable per request or via REPORTS_ENGINE
+ENGINE_DB = "db"
+ENGINE_SNAPSHOT = "snapshot"
+DEFAULT_REPORTS_ENGINE = os.getenv("REPORTS_ENGINE", ENGINE_DB).lower()
+
+
+def use_snapshot(engine: Optional[str]) -> bool:
+    """Whether a report request should run on the in-memory snapshot"""
+    return (engine or DEFAULT_REPORTS_ENGINE).lower() == ENGINE_SNAPSHOT
+
+
+class AnalyticsSnapshot:
+    """
+    Expenses as parallel NumPy columns: date ordinal, year, month, category index,
+    currency index, amount and materialized amount_idr (NaN where not yet rated).
+
+    Alongside the rows it keeps a days x categories grid of rated IDR totals and
+    counts; its cumulative sums are recomputed on the first range query after a
+    write. Unrated rows are tracked by position and converted at query time.
+
+    Deleted rows are tombstoned in a live mask and compacted once they make up
+    a quarter of the arrays. All access goes through one lock; the queries are
+    vectorized and hold it only for microseconds to milliseconds.
+    """
+
+    def __init__(self, max_age_seconds: float = 600):
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        self._built_at: Optional[float] = None
+        # Counts write notifications, so a build that raced with a write is redone
+        self._writes = 0
+        self._reset(0)
+
+    def _reset(self, capacity: int):
+        self._size = 0
+        self._dead = 0
+        self._ids = np.empty(capacity, dtype=object)
+        self._day = np.empty(capacity, dtype=np.int32)
+        self._year = np.empty(capacity, dtype=np.int32)
+        self._month = np.empty(capacity, dtype=np.int32)
+        self._category = np.empty(capacity, dtype=np.int32)
+        self._currency = np.empty(capacity, dtype=np.int32)
+        self._amount = np.empty(capacity, dtype=np.float64)
+        self._amount_idr = np.empty(capacity, dtype=np.float64)
+        self._live = np.zeros(capacity, dtype=bool)
+        self._positions: Dict[UUID, int] = {}
+        # Index 0 is "no category", so category indexes feed bincount directly
+        self._categories: List[Optional[UUID]] = [None]
+        self._category_index: Dict[Optional[UUID], int] = {None: 0}
+        self._currencies: List[str] = []
+        self._currency_index: Dict[str, int] = {}
+        # Day grid: row i is day ordinal _day_origin + i, column is the category index
+        self._day_origin = 0
+        self._day_idr = np.zeros((0, 1), dtype=np.float64)
+        self._day_count = np.zeros((0, 1), dtype=np.int64)
+        # Positions of live rows without amount_idr, left out of the day grid's totals
+        self._unrated: Set[int] = set()
+        # (cumulative IDR by category, cumulative count by category, overall IDR, overall count), None when stale
+        self._prefix: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = None
+
+    # ---- building and maintenance ----
+
+    @property
+    def is_built(self) -> bool:
+        return self._built_at is not None
+
+    def ensure_built(self, db: Session):
+        """Build the snapshot if missing or older than max_age_seconds"""
+        built_at = self._built_at
+        if built_at is None or time.monotonic() - built_at > self.max_age_seconds:
+            self.build(db)
+
+    def build(self, db: Session):
+        """Load every expense into fresh columns"""
+        started = time.perf_counter()
+        writes_before = self._writes
+        rows = db.query(
+            Expense.id, Expense.date, Expense.category_id, Expense.currency, Expense.amount, Expense.amount_idr
+        ).all()
+        with self._lock:
+            self._reset(max(len(rows), 1024))
+            for row in rows:
+                self._write(self._size, row.id, row.date, row.category_id, row.currency, row.amount, row.amount_idr)
+                self._positions[row.id] = self._size
+                self._size += 1
+            self._rebuild_day_totals()
+            self._built_at = time.monotonic()
+            if self._writes != writes_before:
+                # A write landed while loading and may be missing: serve this build once, then rebuild
+                self._built_at -= self.max_age_seconds + 1
+        logger.info(f"Built analytics snapshot of {len(rows)} expenses in {(time.perf_counter() - started) * 1000:.1f}ms")
+
+    def invalidate(self):
+        """Drop the snapshot; the next report request rebuilds it (after bulk writes)"""
+        with self._lock:
+            self._writes += 1
+            self._built_at = None
+            self._reset(0)
+
+    def upsert(self, expense: Expense):
+        """Apply a created or updated expense. No-op until the snapshot is built."""
+        with self._lock:
+            self._writes += 1
+            if self._built_at is None:
+                return
+            position = self._positions.get(expense.id)
+            if position is None:
+                if self._size == len(self._ids):
+                    self._grow()
+                position = self._size
+                self._positions[expense.id] = position
+                self._size += 1
+            else:
+                self._account(position, -1)
+            self._write(
+                position, expense.id, expense.date, expense.category_id,
+                expense.currency, expense.amount, expense.amount_idr
+            )
+            self._account(position, 1)
+
+    def remove(self, expense_id: UUID):
+        """Apply a deleted expense. No-op until the snapshot is built."""
+        with self._lock:
+            self._writes += 1
+            if self._built_at is None:
+                return
+            position = self._positions.pop(expense_id, None)
+            if position is None:
+                return
+            self._account(position, -1)
+            self._live[position] = False
+            self._dead += 1
+            if self._dead * 4 > self._size:
+                self._compact()
+
+    def _write(self, position: int, expense_id, expense_date: date, category_id, currency: str, amount, amount_idr):
+        self._ids[position] = expense_id
+        self._day[position] = expense_date.toordinal()
+        self._year[position] = expense_date.year
+        self._month[position] = expense_date.month
+        self._category[position] = self._intern_category(category_id)
+        self._currency[position] = self._intern_currency(currency)
+        self._amount[position] = float(amount)
+        self._amount_idr[position] = float(amount_idr) if amount_idr is not None else np.nan
+        self._live[position] = True
+
+    def _intern_category(self, category_id) -> int:
+        index = self._category_index.get(category_id)
+        if index is None:
+            index = len(self._categories)
+            self._categories.append(category_id)
+            self._category_index[category_id] = index
+        return index
+
+    def _intern_currency(self, currency: str) -> int:
+        code = (currency or "IDR").upper()
+        index = self._currency_index.get(code)
+        if index is None:
+            index = len(self._currencies)
+            self._currencies.append(code)
+            self._currency_index[code] = index
+        return index
+
+    def _columns(self):
+        return (
+            self._ids, self._day, self._year, self._month, self._category,
+            self._currency, self._amount, self._amount_idr, self._live
+        )
+
+    def _grow(self):
+        capacity = max(len(self._ids) * 2, 1024)
+        (self._ids, self._day, self._year, self._month, self._category,
+         self._currency, self._amount, self._amount_idr, self._live) = [
+            np.concatenate([column, np.zeros(capacity - len(column), dtype=column.dtype)])
+            for column in self._columns()
+        ]
+
+    def _compact(self):
+        keep = np.flatnonzero(self._live[:self._size])
+        (self._ids, self._day, self._year, self._month, self._category,
+         self._currency, self._amount, self._amount_idr, self._live) = [
+            column[keep].copy() for column in self._columns()
+        ]
+        self._size = len(keep)
+        self._dead = 0
+        self._positions = {expense_id: position for position, expense_id in enumerate(self._ids)}
+        self._unrated = set(np.flatnonzero(np.isnan(self._amount_idr)).tolist())
+
+    def _rebuild_day_totals(self):
+        """Fill the day grid from the live rows"""
+        n = self._size
+        live = self._live[:n]
+        days = self._day[:n][live]
+        categories = self._category[:n][live]
+        amount_idr = self._amount_idr[:n][live]
+        width = len(self._categories)
+        self._day_origin = int(days.min()) if len(days) else 0
+        rows = int(days.max()) - self._day_origin + 1 if len(days) else 0
+        cells = (days - self._day_origin) * width + categories
+        rated = ~np.isnan(amount_idr)
+        # bincount returns integers when no row is rated; keep the grid float
+        self._day_idr = np.bincount(
+            cells[rated], weights=amount_idr[rated], minlength=rows * width
+        ).astype(np.float64).reshape(rows, width)
+        self._day_count = np.bincount(cells, minlength=rows * width).astype(np.int64).reshape(rows, width)
+        self._unrated = set(np.flatnonzero(live & np.isnan(self._amount_idr[:n])).tolist())
+        self._prefix = None
+
+    def _account(self, position: int, sign: int):
+        """Add (sign=1) or remove (sign=-1) a row's contribution to the day grid"""
+        row = self._day_row(int(self._day[position]))
+        category = int(self._category[position])
+        self._day_count[row, category] += sign
+        amount_idr = self._amount_idr[position]
+        if np.isnan(amount_idr):
+            if sign > 0:
+                self._unrated.add(position)
+            else:
+                self._unrated.discard(position)
+        else:
+            self._day_idr[row, category] += sign * amount_idr
+        self._prefix = None
+
+    def _day_row(self, day: int) -> int:
+        """Grid row of a day ordinal, growing the grid to cover it (and any new category)"""
+        rows, width = self._day_idr.shape
+        if rows == 0:
+            self._day_origin = day
+        top = max(self._day_origin - day, 0)
+        bottom = max(day - (self._day_origin + rows) + 1, 0) if rows else 1
+        right = max(len(self._categories) - width, 0)
+        if top or bottom or right:
+            padding = ((top, bottom), (0, right))
+            self._day_idr = np.pad(self._day_idr, padding)
+            self._day_count = np.pad(self._day_count, padding)
+            self._day_origin -= top
+        return day - self._day_origin
+
+    def _prefix_sums(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Cumulative day totals with a leading zero row, so a range is cum[hi] - cum[lo]"""
+        if self._prefix is None:
+            rows, width = self._day_idr.shape
+            width = max(width, len(self._categories))
+            cum_idr = np.zeros((rows + 1, width), dtype=np.float64)
+            cum_count = np.zeros((rows + 1, width), dtype=np.int64)
+            np.cumsum(self._day_idr, axis=0, out=cum_idr[1:, :self._day_idr.shape[1]])
+            np.cumsum(self._day_count, axis=0, out=cum_count[1:, :self._day_count.shape[1]])
+            self._prefix = (cum_idr, cum_count, cum_idr.sum(axis=1), cum_count.sum(axis=1))
+        return self._prefix
+
+    # ---- queries ----
+
+    @property
+    def currencies(self) -> List[str]:
+        """Currency codes present in the snapshot, for fetching conversion rates"""
+        with self._lock:
+            return list(self._currencies)
+
+    def _mask(self, start_date: Optional[date], end_date: Optional[date], category_ids: Optional[Iterable[UUID]]):
+        n = self._size
+        mask = self._live[:n].copy()
+        if start_date:
+            mask &= self._day[:n] >= start_date.toordinal()
+        if end_date:
+            mask &= self._day[:n] <= end_date.toordinal()
+        if category_ids is not None:
+            indexes = [self._category_index[c] for c in category_ids if c in self._category_index]
+            mask &= np.isin(self._category[:n], indexes)
+        return mask
+
+    def _day_bounds(self, start_date: Optional[date], end_date: Optional[date]) -> Tuple[int, int]:
+        """Prefix-sum rows (lo, hi) such that the range total is cum[hi] - cum[lo]"""
+        rows = len(self._day_idr)
+        lo = 0 if start_date is None else min(max(start_date.toordinal() - self._day_origin, 0), rows)
+        hi = rows if end_date is None else min(max(end_date.toordinal() - self._day_origin + 1, 0), rows)
+        return lo, max(lo, hi)
+
+    def _unrated_in_range(self, start_date: Optional[date], end_date: Optional[date], fallback_rates: Dict[str, Decimal]):
+        """(category indexes, IDR amounts at fallback_rates) of unrated rows in range"""
+        positions = np.fromiter(self._unrated, dtype=np.int64, count=len(self._unrated))
+        if start_date:
+            positions = positions[self._day[positions] >= start_date.toordinal()]
+        if end_date:
+            positions = positions[self._day[positions] <= end_date.toordinal()]
+        rates = np.array([float(fallback_rates.get(code, 1)) for code in self._currencies] or [1.0])
+        return self._category[positions], self._amount[positions] * rates[self._currency[positions]]
+
+    def _amounts_in_idr(self, fallback_rates: Dict[str, Decimal]) -> np.ndarray:
+        """Materialized amount_idr, else amount at fallback_rates (1:1 for unknown currencies)"""
+        n = self._size
+        rates = np.array([float(fallback_rates.get(code, 1)) for code in self._currencies] or [1.0])
+        idr = self._amount_idr[:n]
+        return np.where(np.isnan(idr), self._amount[:n] * rates[self._currency[:n]], idr)
+
+    def summary(self, start_date: Optional[date], end_date: Optional[date], fallback_rates: Dict[str, Decimal]) -> Tuple[int, float]:
+        """(count, IDR total) of expenses in range"""
+        with self._lock:
+            _, _, cum_idr, cum_count = self._prefix_sums()
+            lo, hi = self._day_bounds(start_date, end_date)
+            total = cum_idr[hi] - cum_idr[lo]
+            if self._unrated:
+                total += self._unrated_in_range(start_date, end_date, fallback_rates)[1].sum()
+            return int(cum_count[hi] - cum_count[lo]), float(total)
+
+    def category_totals(
+        self,
+        start_date: Optional[date],
+        end_date: Optional[date],
+        fallback_rates: Dict[str, Decimal]
+    ) -> List[Tuple[Optional[UUID], float, int]]:
+        """(category_id, IDR total, count) for every category with expenses in range"""
+        with self._lock:
+            cum_idr, cum_count, _, _ = self._prefix_sums()
+            lo, hi = self._day_bounds(start_date, end_date)
+            totals = cum_idr[hi] - cum_idr[lo]
+            counts = cum_count[hi] - cum_count[lo]
+            if self._unrated:
+                categories, amounts = self._unrated_in_range(start_date, end_date, fallback_rates)
+                np.add.at(totals, categories, amounts)
+            return [
+                (self._categories[index], float(totals[index]), int(counts[index]))
+                for index in np.flatnonzero(counts)
+            ]
+
+    def trends(
+        self,
+        period: str,
+        category_ids: Optional[Iterable[UUID]],
+        fallback_rates: Dict[str, Decimal]
+    ) -> List[Tuple[int, Optional[int], float]]:
+        """(year, bucket, IDR total) per period, bucket being the month, quarter, semester or None (yearly)"""
+        with self._lock:
+            mask = self._mask(None, None, category_ids)
+            months = self._month[:self._size][mask]
+            if period == "yearly":
+                buckets = np.zeros_like(months)
+            elif period == "quarterly":
+                buckets = (months - 1) // 3 + 1
+            elif period == "semester":
+                buckets = np.where(months <= 6, 1, 2)
+            else:  # monthly
+                buckets = months
+            keys = self._year[:self._size][mask] * 16 + buckets
+            unique_keys, inverse = np.unique(keys, return_inverse=True)
+            totals = np.bincount(inverse, weights=self._amounts_in_idr(fallback_rates)[mask], minlength=len(unique_keys))
+            return [
+                (int(key // 16), None if period == "yearly" else int(key % 16), float(total))
+                for key, total in zip(unique_keys, totals)
+            ]
+
+    def top(
+        self,
+        start_date: Optional[date],
+        end_date: Optional[date],
+        category_ids: Optional[Iterable[UUID]],
+        fallback_rates: Dict[str, Decimal],
+        limit: int,
+        skip: int = 0,
+        after: Optional[Tuple[float, UUID]] = None
+    ) -> Tuple[int, List[Tuple[UUID, float]], bool]:
+        """
+        Largest expenses by IDR amount (rounded to cents), ties broken by id, both descending.
+        after seeks past a previous page's last (amount, id) instead of skipping.
+        Returns (total matching count, [(id, amount_in_idr)], has_more).
+        """
+        with self._lock:
+            mask = self._mask(start_date, end_date, category_ids)
+            total_count = int(mask.sum())
+            amounts = np.round(self._amounts_in_idr(fallback_rates), 2)
+            if after is not None:
+                after_amount, after_id = after
+                ties = np.flatnonzero(mask & (amounts == after_amount))
+                mask &= amounts < after_amount
+                mask[ties[self._ids[ties] < after_id]] = True
+                skip = 0
+
+            candidates = np.flatnonzero(mask)
+            wanted = skip + limit + 1
+            if len(candidates) > wanted:
+                # Partial selection of the top values, keeping every row tied with the cut-off
+                threshold = -np.partition(-amounts[candidates], wanted - 1)[wanted - 1]
+                candidates = candidates[amounts[candidates] >= threshold]
+            ordered = sorted(candidates.tolist(), key=lambda i: (amounts[i], self._ids[i]), reverse=True)
+            page = ordered[skip:skip + limit + 1]
+            has_more = len(page) > limit
+            return total_count, [(self._ids[i], float(amounts[i])) for i in page[:limit]], has_more
+
+
+analytics_snapshot = AnalyticsSnapshot(
+    max_age_seconds=float(os.getenv("ANALYTICS_SNAPSHOT_MAX_AGE_SECONDS", "600"))
+)
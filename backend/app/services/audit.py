@@ -0,0 +1,352 @@
+"""
+Batched, asynchronous writes of the expense audit log (ExpenseHistory).
+
+Handlers wrap their commit in audit_log.recording(...) instead of committing a
+history row of their own. The event is appended to a local spool file before
+the commit, so a crash at any point after it loses nothing, and queued once the
+commit succeeded (a failed commit spools a cancel marker instead); a background
+task bulk inserts the queue every AUDIT_FLUSH_INTERVAL_SECONDS, or as soon as
+AUDIT_BATCH_SIZE events are waiting. Spool files left behind by a crashed
+process are replayed at startup. Events carry their own id, and ids already
+stored are skipped, so replaying a spool twice is harmless. A crash between the
+spool write and the commit replays an event for a change that never landed:
+the audit log errs towards an extra entry rather than a missing one.
+"""
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional
+from uuid import UUID
+import asyncio
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import uuid
+
+from sqlalchemy import insert
+
+from app.database import SessionLocal
+from app.models.expense import Expense
+from app.models.history import ExpenseHistory
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+# Spool files: audit-<pid>.jsonl is being appended to, audit-<pid>-<n>.flushing.jsonl
+# holds a batch taken for insertion
+_SPOOL_NAME = re.compile(r"^audit-(\d+)(?:-\d+\.flushing)?\.jsonl$")
+
+# Most history rows inserted per transaction
+_INSERT_CHUNK = 1000
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class AuditLog:
+    """
+    Spool-backed queue of history events, flushed in batches by a background task.
+    Until start() is called (scripts, tests) events are written through immediately.
+    """
+
+    def __init__(self, spool_dir: str, batch_size: int = 100, flush_interval_seconds: float = 1.0, fsync: bool = False):
+        self.spool_dir = spool_dir
+        self.batch_size = batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        # fsync every event: survives power loss, not only process crashes, at the cost of a disk sync per write
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending: List[dict] = []
+        # Spooled events whose change is not committed yet, by id
+        self._uncommitted: Dict[str, dict] = {}
+        self._spool = None
+        self._spool_batches = 0
+        # Rotated spool files whose events may not all be stored yet
+        self._unflushed_spools: List[str] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional["asyncio.Task"] = None
+
+    @property
+    def _spool_path(self) -> str:
+        return os.path.join(self.spool_dir, f"audit-{os.getpid()}.jsonl")
+
+    def record(
+        self,
+        expense_id: Optional[UUID],
+        action: str,
+        user: User,
+        description: str,
+        old_data: Optional[dict] = None,
+        new_data: Optional[dict] = None
+    ):
+        """Queue a history event for a change that is already committed"""
+        event = _event(expense_id, action, user, description, old_data, new_data)
+        with self._lock:
+            self._append_to_spool(event)
+            self._pending.append(event)
+            queued = len(self._pending)
+        self._flush_if_due(queued)
+
+    @contextmanager
+    def recording(
+        self,
+        expense_id: Optional[UUID],
+        action: str,
+        user: User,
+        description: str,
+        old_data: Optional[dict] = None,
+        new_data: Optional[dict] = None
+    ) -> Iterator[dict]:
+        """
+        Spool a history event, then run the block that commits the change.
+        The event is queued if the block succeeds and cancelled if it raises.
+        """
+        event = _event(expense_id, action, user, description, old_data, new_data)
+        with self._lock:
+            self._append_to_spool(event)
+            self._uncommitted[event["id"]] = event
+        try:
+            yield event
+        except BaseException:
+            with self._lock:
+                del self._uncommitted[event["id"]]
+                self._append_to_spool({"id": event["id"], "cancelled": True})
+            raise
+        with self._lock:
+            # Both under one lock, so a spool rotation always finds the event in one of them
+            del self._uncommitted[event["id"]]
+            self._pending.append(event)
+            queued = len(self._pending)
+        self._flush_if_due(queued)
+
+    def _flush_if_due(self, queued: int):
+        if self._task is None:
+            self._flush_sync()
+        elif queued >= self.batch_size:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def start(self):
+        """Replay spool files left by crashed processes and start the background flusher"""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        await asyncio.to_thread(self._replay_spools)
+        self._task = self._loop.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flusher and write everything still queued"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.to_thread(self._flush_sync)
+        with self._lock:
+            if self._spool is not None:
+                self._spool.close()
+                self._spool = None
+        self._loop = None
+
+    async def flush(self) -> int:
+        """Insert all queued events now (e.g. before reading history). Returns the number inserted."""
+        if self._task is None:
+            return self._flush_sync()
+        return await asyncio.to_thread(self._flush_sync)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await asyncio.to_thread(self._flush_sync)
+
+    def _append_to_spool(self, event: dict):
+        # Called under self._lock
+        try:
+            if self._spool is None:
+                os.makedirs(self.spool_dir, exist_ok=True)
+                self._spool = open(self._spool_path, "a", encoding="utf-8")
+            self._spool.write(json.dumps(event) + "\n")
+            self._spool.flush()
+            if self.fsync:
+                os.fsync(self._spool.fileno())
+        except OSError as e:
+            # Still queued in memory: only crash safety is lost
+            logger.warning(f"Could not spool audit event to {self.spool_dir}: {e}")
+
+    def _take_pending(self):
+        """Queued events and the spool file holding exactly them (None if not spooled)"""
+        with self._lock:
+            events, self._pending = self._pending, []
+            spool_path = None
+            if self._spool is not None:
+                self._spool.close()
+                self._spool = None
+                self._spool_batches += 1
+                spool_path = os.path.join(
+                    self.spool_dir, f"audit-{os.getpid()}-{self._spool_batches}.flushing.jsonl"
+                )
+                try:
+                    os.replace(self._spool_path, spool_path)
+                except OSError as e:
+                    logger.warning(f"Could not rotate audit spool {self._spool_path}: {e}")
+                    spool_path = None
+                else:
+                    # The rotated file is removed once its queued events are stored;
+                    # events still waiting for their commit move to the new spool
+                    for event in self._uncommitted.values():
+                        self._append_to_spool(event)
+            return events, spool_path
+
+    def _flush_sync(self) -> int:
+        with self._flush_lock:
+            events, spool_path = self._take_pending()
+            if spool_path:
+                self._unflushed_spools.append(spool_path)
+            if not events:
+                return 0
+            try:
+                inserted = _insert_events(events)
+            except Exception as e:
+                logger.error(f"Writing {len(events)} audit events failed, will retry: {e}")
+                with self._lock:
+                    self._pending[:0] = events
+                return 0
+            for path in self._unflushed_spools:
+                _remove(path)
+            self._unflushed_spools = []
+            return inserted
+
+    def _replay_spools(self):
+        try:
+            names = os.listdir(self.spool_dir)
+        except FileNotFoundError:
+            return
+        own_pid = os.getpid()
+        paths = []
+        for name in sorted(names):
+            match = _SPOOL_NAME.match(name)
+            # Skip spools of other live workers; our own pid may be reused from a crashed process
+            if match and (int(match.group(1)) == own_pid or not _pid_alive(int(match.group(1)))):
+                paths.append(os.path.join(self.spool_dir, name))
+        if not paths:
+            return
+        events = []
+        cancelled = set()
+        for path in paths:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        # A line cut short by the crash
+                        logger.warning(f"Skipping unreadable audit event in {path}")
+                        continue
+                    if event.get("cancelled"):
+                        cancelled.add(event["id"])
+                    else:
+                        events.append(event)
+        events = [event for event in events if event["id"] not in cancelled]
+        try:
+            inserted = _insert_events(events)
+        except Exception as e:
+            logger.error(f"Replaying audit spools failed, keeping {len(paths)} files for the next start: {e}")
+            return
+        for path in paths:
+            _remove(path)
+        logger.info(f"Replayed {len(events)} spooled audit events ({inserted} not yet stored)")
+
+
+def _event(
+    expense_id: Optional[UUID],
+    action: str,
+    user: User,
+    description: str,
+    old_data: Optional[dict],
+    new_data: Optional[dict]
+) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "expense_id": str(expense_id) if expense_id else None,
+        "action": action,
+        "user_id": str(user.id),
+        "username": user.username or user.email or 'unknown',
+        "description": description,
+        "old_data": json.dumps(old_data, default=str) if old_data is not None else None,
+        "new_data": json.dumps(new_data, default=str) if new_data is not None else None,
+        # Stamped now rather than at insert, so history keeps the order of the writes
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _insert_events(events: List[dict]) -> int:
+    """Bulk insert events whose id is not stored yet. Returns the number inserted."""
+    inserted = 0
+    db = SessionLocal()
+    try:
+        for start in range(0, len(events), _INSERT_CHUNK):
+            chunk = events[start:start + _INSERT_CHUNK]
+            ids = [UUID(event["id"]) for event in chunk]
+            stored = {row[0] for row in db.query(ExpenseHistory.id).filter(ExpenseHistory.id.in_(ids))}
+            # Expenses deleted since the event was queued can no longer be referenced
+            expense_ids = {UUID(event["expense_id"]) for event in chunk if event["expense_id"]}
+            live = {
+                row[0] for row in db.query(Expense.id).filter(Expense.id.in_(expense_ids))
+            } if expense_ids else set()
+            rows = []
+            for event in chunk:
+                if UUID(event["id"]) in stored:
+                    continue
+                # The same event may sit in two spool files, e.g. after a failed rotation
+                stored.add(UUID(event["id"]))
+                expense_id = UUID(event["expense_id"]) if event["expense_id"] else None
+                rows.append({
+                    "id": UUID(event["id"]),
+                    "expense_id": expense_id if expense_id in live else None,
+                    "action": event["action"],
+                    "user_id": UUID(event["user_id"]),
+                    "username": event["username"],
+                    "description": event["description"],
+                    "old_data": event["old_data"],
+                    "new_data": event["new_data"],
+                    "created_at": datetime.fromisoformat(event["created_at"]),
+                })
+            if rows:
+                db.execute(insert(ExpenseHistory), rows)
+            db.commit()
+            inserted += len(rows)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    return inserted
+
+
+audit_log = AuditLog(
+    spool_dir=os.getenv("AUDIT_SPOOL_DIR") or os.path.join(tempfile.gettempdir(), "expense-tracker-audit"),
+    batch_size=int(os.getenv("AUDIT_BATCH_SIZE", "100")),
+    flush_interval_seconds=float(os.getenv("AUDIT_FLUSH_INTERVAL_SECONDS", "1")),
+    fsync=os.getenv("AUDIT_SPOOL_FSYNC", "false").lower() == "true"
+)
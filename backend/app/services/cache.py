@@ -1,32 +1,210 @@
-from datetime import datetime, timedelta
-from typing import Dict, Any, Optional
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, Any, Awaitable, Callable, Iterable, Optional, List, Set, Tuple
+import asyncio
+import heapq
+import logging
+import os
+import sys
 import threading
+import time
+
+from app.services.cache_backends import CacheBackend, create_backend_from_env
+
+logger = logging.getLogger(__name__)
+
+
+def _estimate_size(value: Any, _seen: Optional[set] = None) -> int:
+    """Approximate the memory footprint of a cached value in bytes"""
+    if _seen is None:
+        _seen = set()
+    if id(value) in _seen:
+        return 0
+    _seen.add(id(value))
+
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_estimate_size(k, _seen) + _estimate_size(v, _seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(_estimate_size(item, _seen) for item in value)
+    return size
+
+
+# Tag carried by entries whose date range is open-ended; any dated write affects them
+OPEN_RANGE_TAG = "month:open"
+
+
+def month_tag(value: date) -> str:
+    """Tag for the calendar month containing a date, e.g. 'month:2025-03'"""
+    return f"month:{value.year:04d}-{value.month:02d}"
+
+
+def month_tags(start_date: Optional[date], end_date: Optional[date]) -> List[str]:
+    """Tags for every calendar month covered by a date range"""
+    if start_date is None or end_date is None:
+        return [OPEN_RANGE_TAG]
+    tags = []
+    year, month = start_date.year, start_date.month
+    while (year, month) <= (end_date.year, end_date.month):
+        tags.append(f"month:{year:04d}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return tags
+
+
+def expense_write_tags(*expense_dates: Optional[date]) -> List[str]:
+    """Tags to invalidate after an expense dated on any of these dates was written"""
+    tags = {OPEN_RANGE_TAG}
+    for expense_date in expense_dates:
+        if expense_date is not None:
+            tags.add(month_tag(expense_date))
+    return sorted(tags)
 
 
 class InMemoryCache:
-    """Thread-safe in-memory cache with TTL support"""
+    """
+    Thread-safe in-memory LRU cache with TTL support.
+
+    The cache is bounded by both entry count and approximate size in bytes;
+    the least recently used entries are evicted first when either limit is hit.
+    A background sweeper removes expired entries proactively using a heap
+    ordered by expiry, so keys that are never read again do not pile up.
+    Expiry uses the monotonic clock and is unaffected by wall-clock changes.
 
-    def __init__(self):
-        self._cache: Dict[str, tuple[Any, datetime]] = {}
+    Entries can be registered with tags (e.g. 'dashboard', 'month:2025-03');
+    a reverse tag index lets invalidate_tags() touch only the affected keys.
+
+    get_or_compute() adds single-flight computation and stale-while-revalidate
+    on top: concurrent misses share one in-flight computation, and entries past
+    their TTL but within their stale window are served while a background task
+    refreshes them.
+
+    An optional shared backend (see cache_backends) makes entries visible to
+    every worker process: local misses fall through to it, writes go to both,
+    and invalidations bump a shared version counter. Other workers check it at
+    most every version_check_interval seconds and then drop only the local
+    entries whose tags (or keys) were invalidated since their last check.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        max_bytes: int = 64 * 1024 * 1024,
+        sweep_interval: Optional[float] = 60.0,
+        backend: Optional[CacheBackend] = None,
+        version_check_interval: float = 0.1
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # key -> (value, fresh_until, expires_at, size_bytes), ordered from least to most
+        # recently used. Between fresh_until and expires_at an entry is stale but servable.
+        self._cache: "OrderedDict[str, Tuple[Any, float, float, int]]" = OrderedDict()
+        # (expires_at, key) min-heap; may hold stale pairs for overwritten/removed keys
+        self._expiry_heap: List[Tuple[float, str]] = []
+        self._total_bytes = 0
+        # tag -> keys carrying it, and key -> its tags (reverse index for invalidation)
+        self._tag_index: Dict[str, Set[str]] = {}
+        self._key_tags: Dict[str, Tuple[str, ...]] = {}
+        # Bumped on every invalidation so in-flight computations don't store outdated results
+        self._generation = 0
+        # key -> in-flight computation task (single-flight for get_or_compute)
+        self._inflight: Dict[str, "asyncio.Task"] = {}
+        # Called after invalidations that removed entries (e.g. to re-warm popular keys)
+        self._invalidation_listeners: List[Callable[[], None]] = []
         self._lock = threading.Lock()
 
+        self.backend = backend
+        # Lookups may serve entries invalidated by another worker for up to this long
+        self.version_check_interval = version_check_interval
+        # Last shared invalidation version this process has applied locally, and when it was checked
+        self._backend_version = 0
+        self._backend_version = self._read_backend_version()
+        self._version_checked_at = time.monotonic()
+
+        self._sweep_interval = sweep_interval
+        self._stop_event = threading.Event()
+        self._sweeper: Optional[threading.Thread] = None
+        if sweep_interval:
+            self.start_sweeper()
+
     def get(self, key: str) -> Optional[Any]:
         """Get value from cache if not expired"""
+        value, is_fresh = self._lookup(key)
+        return value if is_fresh else None
+
+    def set(
+        self,
+        key: str,
+        value: Any,
+        ttl_seconds: int = 300,
+        tags: Iterable[str] = (),
+        stale_ttl_seconds: int = 0,
+        generation: Optional[int] = None
+    ):
+        """
+        Set cache value with TTL (default 5 minutes) and optional invalidation tags.
+        With stale_ttl_seconds, the entry stays servable by get_or_compute() for that
+        much longer after the TTL while it is refreshed in the background.
+        With generation (read from .generation before computing the value), the value
+        is dropped if an invalidation happened in the meantime.
+        """
+        if generation is not None:
+            self._sync_backend_version(force=True)
+            if generation != self._generation:
+                return
+        tags = tuple(set(tags))
+        self._store_local(key, value, ttl_seconds, ttl_seconds + stale_ttl_seconds, tags)
+
+        if self.backend is not None:
+            now = time.time()
+            try:
+                self.backend.set(key, value, now + ttl_seconds, now + ttl_seconds + stale_ttl_seconds, tags)
+            except Exception as e:
+                logger.warning(f"Shared cache write failed for {key}: {e}")
+
+    def _store_local(
+        self,
+        key: str,
+        value: Any,
+        fresh_seconds: float,
+        expires_seconds: float,
+        tags: Tuple[str, ...]
+    ):
+        """Store an entry in the local LRU, evicting as needed"""
+        size = _estimate_size(value)
         with self._lock:
             if key in self._cache:
-                value, expiry = self._cache[key]
-                if datetime.now() < expiry:
-                    return value
-                else:
-                    # Remove expired entry
-                    del self._cache[key]
-        return None
+                self._remove(key)
+            if size > self.max_bytes:
+                # Never let a single oversized value flush the whole cache
+                logger.warning(f"Not caching {key}: ~{size} bytes exceeds cache limit of {self.max_bytes}")
+                return
 
-    def set(self, key: str, value: Any, ttl_seconds: int = 300):
-        """Set cache value with TTL (default 5 minutes)"""
-        with self._lock:
-            expiry = datetime.now() + timedelta(seconds=ttl_seconds)
-            self._cache[key] = (value, expiry)
+            now = time.monotonic()
+            fresh_until = now + fresh_seconds
+            expires_at = now + expires_seconds
+            self._cache[key] = (value, fresh_until, expires_at, size)
+            self._total_bytes += size
+            heapq.heappush(self._expiry_heap, (expires_at, key))
+            if tags:
+                self._key_tags[key] = tags
+                for tag in tags:
+                    self._tag_index.setdefault(tag, set()).add(key)
+
+            # Evict least recently used entries until within limits
+            while len(self._cache) > self.max_entries or self._total_bytes > self.max_bytes:
+                oldest_key = next(iter(self._cache))
+                self._remove(oldest_key)
+
+            # Drop stale heap pairs once they clearly outnumber live entries
+            if len(self._expiry_heap) > 2 * len(self._cache) + 64:
+                self._expiry_heap = [(entry[2], k) for k, entry in self._cache.items()]
+                heapq.heapify(self._expiry_heap)
+
+    @property
+    def generation(self) -> int:
+        """Invalidation counter, for set(generation=...) on values computed outside get_or_compute()"""
+        self._sync_backend_version(force=True)
+        return self._generation
 
     def invalidate(self, pattern: str = None):
         """
@@ -35,23 +213,299 @@ class InMemoryCache:
         If pattern is provided, removes all keys containing that pattern.
         """
         with self._lock:
+            self._generation += 1
             if pattern is None:
-                self._cache.clear()
+                self._clear()
             else:
                 keys_to_delete = [k for k in self._cache.keys() if pattern in k]
                 for key in keys_to_delete:
-                    del self._cache[key]
+                    self._remove(key)
+
+        if self.backend is not None:
+            try:
+                self._applied_own_invalidation(self.backend.invalidate_pattern(pattern))
+            except Exception as e:
+                logger.warning(f"Shared cache invalidation failed: {e}")
+        self._notify_invalidation()
+
+    def invalidate_tags(self, *tags: str) -> int:
+        """
+        Invalidate every entry registered with any of the given tags.
+        Only the affected entries are touched. Returns the number removed.
+        """
+        removed = 0
+        with self._lock:
+            self._generation += 1
+            for tag in tags:
+                for key in list(self._tag_index.get(tag, ())):
+                    self._remove(key)
+                    removed += 1
+
+        if self.backend is not None:
+            try:
+                self._applied_own_invalidation(self.backend.invalidate_tags(tags))
+            except Exception as e:
+                logger.warning(f"Shared cache invalidation failed: {e}")
+        if removed:
+            self._notify_invalidation()
+        return removed
+
+    def add_invalidation_listener(self, listener: Callable[[], None]):
+        """
+        Register a callback run after invalidate(), clear() and invalidate_tags()
+        calls that removed entries. It may be called from any thread and must not block.
+        """
+        self._invalidation_listeners.append(listener)
+
+    def remove_invalidation_listener(self, listener: Callable[[], None]):
+        """Unregister a callback added with add_invalidation_listener()"""
+        if listener in self._invalidation_listeners:
+            self._invalidation_listeners.remove(listener)
+
+    def _notify_invalidation(self):
+        for listener in list(self._invalidation_listeners):
+            try:
+                listener()
+            except Exception as e:
+                logger.warning(f"Cache invalidation listener failed: {e}")
+
+    async def get_or_compute(
+        self,
+        key: str,
+        factory: Callable[[], Awaitable[Any]],
+        ttl_seconds: int = 300,
+        stale_ttl_seconds: int = 0,
+        tags: Iterable[str] = ()
+    ) -> Any:
+        """
+        Get a cached value, computing it with the async factory on a miss.
+
+        Concurrent callers for the same key await a single in-flight computation.
+        A stale entry (past its TTL but within stale_ttl_seconds) is returned
+        immediately while one background task refreshes it.
+        The factory must not depend on request-scoped resources, since a
+        background refresh can outlive the request that triggered it.
+        """
+        value, is_fresh = self._lookup(key)
+        if is_fresh:
+            return value
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(
+                self._compute(key, factory, ttl_seconds, stale_ttl_seconds, tuple(tags))
+            )
+            # Also retrieves the exception of refreshes nobody awaits
+            task.add_done_callback(self._log_refresh_error)
+            self._inflight[key] = task
+
+        if value is not None:
+            # Stale hit: serve the old value, the refresh continues in the background
+            return value
+
+        # Shield so one cancelled caller doesn't cancel the computation for everyone else
+        return await asyncio.shield(task)
+
+    async def _compute(
+        self,
+        key: str,
+        factory: Callable[[], Awaitable[Any]],
+        ttl_seconds: int,
+        stale_ttl_seconds: int,
+        tags: Tuple[str, ...]
+    ) -> Any:
+        self._sync_backend_version(force=True)
+        generation = self._generation
+        try:
+            value = await factory()
+            # Another worker may have invalidated while we were computing
+            self._sync_backend_version(force=True)
+            if generation == self._generation:
+                self.set(key, value, ttl_seconds=ttl_seconds, tags=tags, stale_ttl_seconds=stale_ttl_seconds)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    @staticmethod
+    def _log_refresh_error(task: "asyncio.Task"):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Cache computation failed: {task.exception()}")
 
     def clear(self):
         """Clear all cache entries"""
         with self._lock:
-            self._cache.clear()
+            self._generation += 1
+            self._clear()
+
+        if self.backend is not None:
+            try:
+                self._applied_own_invalidation(self.backend.invalidate_pattern(None))
+            except Exception as e:
+                logger.warning(f"Shared cache clear failed: {e}")
+        self._notify_invalidation()
 
     def size(self) -> int:
         """Get number of cached entries"""
         with self._lock:
             return len(self._cache)
 
+    def stats(self) -> Dict[str, int]:
+        """Get entry count and approximate memory usage"""
+        with self._lock:
+            return {
+                "entries": len(self._cache),
+                "bytes": self._total_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+            }
+
+    def sweep_expired(self) -> int:
+        """Remove all expired entries. Returns the number of entries removed."""
+        removed = 0
+        now = time.monotonic()
+        with self._lock:
+            while self._expiry_heap and self._expiry_heap[0][0] <= now:
+                expires_at, key = heapq.heappop(self._expiry_heap)
+                entry = self._cache.get(key)
+                # Skip stale heap pairs left behind by overwrites and evictions
+                if entry is not None and entry[2] == expires_at:
+                    self._remove(key)
+                    removed += 1
+
+        if self.backend is not None:
+            removed += self.backend.purge_expired()
+        return removed
+
+    def start_sweeper(self):
+        """Start the background thread that removes expired entries"""
+        if self._sweeper is not None and self._sweeper.is_alive():
+            return
+        self._stop_event.clear()
+        self._sweeper = threading.Thread(target=self._sweep_loop, name="cache-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self):
+        """Stop the background sweeper thread"""
+        self._stop_event.set()
+        if self._sweeper is not None:
+            self._sweeper.join(timeout=1.0)
+            self._sweeper = None
+
+    def _sweep_loop(self):
+        while not self._stop_event.wait(self._sweep_interval):
+            try:
+                removed = self.sweep_expired()
+                if removed:
+                    logger.debug(f"Cache sweeper removed {removed} expired entries")
+            except Exception as e:
+                logger.error(f"Cache sweep failed: {e}")
+
+    def _lookup(self, key: str) -> Tuple[Optional[Any], bool]:
+        """Get (value, is_fresh) for a key; value is None on a miss or after expiry"""
+        self._sync_backend_version()
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                value, fresh_until, expires_at, _ = entry
+                now = time.monotonic()
+                if now < expires_at:
+                    self._cache.move_to_end(key)
+                    return value, now < fresh_until
+                # Remove expired entry
+                self._remove(key)
+
+        if self.backend is None:
+            return None, False
+
+        # Local miss: another worker may already have computed it
+        try:
+            shared = self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"Shared cache read failed for {key}: {e}")
+            return None, False
+        if shared is None:
+            return None, False
+        value, fresh_until, expires_at, tags = shared
+        now = time.time()
+        self._store_local(key, value, fresh_until - now, expires_at - now, tags)
+        return value, now < fresh_until
+
+    def _read_backend_version(self) -> int:
+        if self.backend is None:
+            return 0
+        try:
+            return self.backend.version()
+        except Exception as e:
+            logger.warning(f"Shared cache version read failed: {e}")
+            return self._backend_version
+
+    def _sync_backend_version(self, force: bool = False):
+        """
+        Drop the local entries other workers invalidated in the shared cache.
+        Unless forced, checks at most every version_check_interval seconds.
+        """
+        if self.backend is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._version_checked_at < self.version_check_interval:
+            return
+        self._version_checked_at = now
+        known = self._backend_version
+        try:
+            version, changes = self.backend.invalidations_since(known)
+        except Exception as e:
+            logger.warning(f"Shared cache version read failed: {e}")
+            return
+        if version == known:
+            return
+        with self._lock:
+            # Another thread may have applied these already
+            if self._backend_version != known:
+                return
+            self._generation += 1
+            for kind, name in changes:
+                if kind == "all":
+                    self._clear()
+                elif kind == "pattern":
+                    for key in [k for k in self._cache.keys() if name in k]:
+                        self._remove(key)
+                else:
+                    for key in list(self._tag_index.get(name, ())):
+                        self._remove(key)
+            self._backend_version = version
+
+    def _applied_own_invalidation(self, version: int):
+        """Record the version produced by our own invalidation"""
+        if version != self._backend_version + 1:
+            # Other workers invalidated in between; apply their changes too
+            self._sync_backend_version(force=True)
+            return
+        self._backend_version = version
+
+    def _remove(self, key: str):
+        """Remove an entry. Caller must hold the lock."""
+        size = self._cache.pop(key)[3]
+        self._total_bytes -= size
+        for tag in self._key_tags.pop(key, ()):
+            keys = self._tag_index.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tag_index[tag]
+
+    def _clear(self):
+        """Remove all entries. Caller must hold the lock."""
+        self._cache.clear()
+        self._expiry_heap.clear()
+        self._total_bytes = 0
+        self._tag_index.clear()
+        self._key_tags.clear()
+
 
 # Global cache instance
-cache = InMemoryCache()
+cache = InMemoryCache(
+    max_entries=int(os.getenv("CACHE_MAX_ENTRIES", "1000")),
+    max_bytes=int(os.getenv("CACHE_MAX_MB", "64")) * 1024 * 1024,
+    backend=create_backend_from_env(),
+    version_check_interval=int(os.getenv("CACHE_VERSION_CHECK_MS", "100")) / 1000,
+)
@@ -0,0 +1,240 @@
+"""
+Shared storage backends for InMemoryCache.
+
+The in-process cache is the first level; a backend is an optional second level
+that every worker on the machine can see, plus a version counter that is bumped
+on each invalidation. Each invalidated tag (or key pattern) records the version
+that last touched it, so other workers drop only the local copies it affects.
+"""
+from abc import ABC, abstractmethod
+from typing import Any, Iterable, List, Optional, Tuple
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CacheBackend(ABC):
+    """
+    Interface for a cache store shared between processes.
+
+    Times are wall-clock epoch seconds (time.time()), since monotonic clocks
+    are not comparable across processes.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Tuple[Any, float, float, Tuple[str, ...]]]:
+        """Get (value, fresh_until, expires_at, tags) for a key, or None if missing or expired"""
+
+    @abstractmethod
+    def set(self, key: str, value: Any, fresh_until: float, expires_at: float, tags: Iterable[str] = ()):
+        """Store a value with its freshness/expiry deadlines and invalidation tags"""
+
+    @abstractmethod
+    def invalidate_tags(self, tags: Iterable[str]) -> int:
+        """Remove entries carrying any of the tags and bump the version. Returns the new version."""
+
+    @abstractmethod
+    def invalidate_pattern(self, pattern: Optional[str]) -> int:
+        """Remove entries whose key contains pattern (all if None) and bump the version. Returns the new version."""
+
+    @abstractmethod
+    def version(self) -> int:
+        """Current invalidation version"""
+
+    @abstractmethod
+    def invalidations_since(self, version: int) -> Tuple[int, List[Tuple[str, str]]]:
+        """
+        Current version and the (kind, name) invalidations made after version:
+        ('tag', tag), ('pattern', key substring) or ('all', '').
+        """
+
+    @abstractmethod
+    def purge_expired(self) -> int:
+        """Remove expired entries. Returns the number removed."""
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    Cache backend stored in a local SQLite file.
+
+    Works across uvicorn workers on a single machine without any external service.
+    Values are stored as JSON, so only JSON-serializable values (API payloads) are shared.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._init_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode; multi-statement writes open their own transaction
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, fresh_until REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_entries_expires_at ON cache_entries (expires_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_tags (tag TEXT NOT NULL, key TEXT NOT NULL, PRIMARY KEY (tag, key))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_tags_key ON cache_tags (key)")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache_meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO cache_meta (name, value) VALUES ('version', 0)")
+            # Last version that invalidated each tag / key pattern; one row per name, so it stays small
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_invalidations ("
+                "kind TEXT NOT NULL, name TEXT NOT NULL, version INTEGER NOT NULL, PRIMARY KEY (kind, name))"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_cache_invalidations_version ON cache_invalidations (version)"
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get(self, key: str) -> Optional[Tuple[Any, float, float, Tuple[str, ...]]]:
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT value, fresh_until, expires_at FROM cache_entries WHERE key = ? AND expires_at > ?",
+            (key, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        tags = tuple(tag for (tag,) in conn.execute("SELECT tag FROM cache_tags WHERE key = ?", (key,)))
+        return json.loads(row[0]), row[1], row[2], tags
+
+    def set(self, key: str, value: Any, fresh_until: float, expires_at: float, tags: Iterable[str] = ()):
+        payload = json.dumps(value)
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, value, fresh_until, expires_at) VALUES (?, ?, ?, ?)",
+                (key, payload, fresh_until, expires_at)
+            )
+            conn.execute("DELETE FROM cache_tags WHERE key = ?", (key,))
+            conn.executemany(
+                "INSERT OR IGNORE INTO cache_tags (tag, key) VALUES (?, ?)",
+                [(tag, key) for tag in set(tags)]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def invalidate_tags(self, tags: Iterable[str]) -> int:
+        tags = list(set(tags))
+        placeholders = ",".join("?" * len(tags))
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if tags:
+                keys_query = f"SELECT key FROM cache_tags WHERE tag IN ({placeholders})"
+                conn.execute(f"DELETE FROM cache_entries WHERE key IN ({keys_query})", tags)
+                conn.execute(f"DELETE FROM cache_tags WHERE key IN ({keys_query})", tags)
+            version = self._bump_version(conn, [("tag", tag) for tag in tags])
+            conn.execute("COMMIT")
+            return version
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def invalidate_pattern(self, pattern: Optional[str]) -> int:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if pattern is None:
+                conn.execute("DELETE FROM cache_entries")
+                conn.execute("DELETE FROM cache_tags")
+            else:
+                # instr() is a plain substring match, like InMemoryCache.invalidate()
+                conn.execute("DELETE FROM cache_entries WHERE instr(key, ?) > 0", (pattern,))
+                conn.execute("DELETE FROM cache_tags WHERE instr(key, ?) > 0", (pattern,))
+            version = self._bump_version(conn, [("all", "")] if pattern is None else [("pattern", pattern)])
+            conn.execute("COMMIT")
+            return version
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def version(self) -> int:
+        row = self._connect().execute("SELECT value FROM cache_meta WHERE name = 'version'").fetchone()
+        return row[0] if row else 0
+
+    def invalidations_since(self, version: int) -> Tuple[int, List[Tuple[str, str]]]:
+        conn = self._connect()
+        # One read transaction, so the version matches the rows
+        conn.execute("BEGIN")
+        try:
+            row = conn.execute("SELECT value FROM cache_meta WHERE name = 'version'").fetchone()
+            current = row[0] if row else 0
+            changes = [] if current == version else conn.execute(
+                "SELECT kind, name FROM cache_invalidations WHERE version > ?", (version,)
+            ).fetchall()
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if current < version:
+            # The cache file was recreated; everything this worker holds may be outdated
+            return current, [("all", "")]
+        return current, [tuple(change) for change in changes]
+
+    def purge_expired(self) -> int:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            conn.execute(
+                "DELETE FROM cache_tags WHERE key IN (SELECT key FROM cache_entries WHERE expires_at <= ?)",
+                (now,)
+            )
+            removed = conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (now,)).rowcount
+            conn.execute("COMMIT")
+            return removed
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _bump_version(conn: sqlite3.Connection, invalidated: List[Tuple[str, str]]) -> int:
+        conn.execute("UPDATE cache_meta SET value = value + 1 WHERE name = 'version'")
+        version = conn.execute("SELECT value FROM cache_meta WHERE name = 'version'").fetchone()[0]
+        conn.executemany(
+            "INSERT OR REPLACE INTO cache_invalidations (kind, name, version) VALUES (?, ?, ?)",
+            [(kind, name, version) for kind, name in invalidated]
+        )
+        return version
+
+
+def create_backend_from_env() -> Optional[CacheBackend]:
+    """
+    Build the shared backend selected by CACHE_BACKEND.
+    'memory' (default) means no shared backend: each worker caches on its own.
+    """
+    backend_name = os.getenv("CACHE_BACKEND", "memory").lower()
+    if backend_name == "sqlite":
+        path = os.getenv("CACHE_SQLITE_PATH") or os.path.join(tempfile.gettempdir(), "expense-tracker-cache.sqlite3")
+        logger.info(f"Using shared SQLite cache backend at {path}")
+        return SQLiteCacheBackend(path)
+    if backend_name != "memory":
+        logger.warning(f"Unknown CACHE_BACKEND '{backend_name}', falling back to in-memory only")
+    return None
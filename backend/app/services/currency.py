@@ -1,56 +1,557 @@
 from decimal import Decimal
-from typing import Dict, Optional
-from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from datetime import date, datetime, time, timedelta
+from uuid import UUID
+import asyncio
+import logging
+import os
 import httpx
+import numpy as np
 from functools import lru_cache
+from sqlalchemy import case, func, literal, literal_column, null, select, update
+from sqlalchemy.dialects import postgresql as postgresql_dialect, sqlite as sqlite_dialect
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models.exchange_rate import ExchangeRate
+from app.models.expense import Expense
+from app.services.analytics import analytics_snapshot
+from app.services.cache import cache
 
 # Cache exchange rates for 1 hour to avoid hitting API limits
-_EXCHANGE_RATE_CACHE: Dict[str, tuple[datetime, Dict[str, float]]] = {}
+_RATE_MATRIX_CACHE: Optional["RateMatrix"] = None
 CACHE_DURATION = timedelta(hours=1)
 
 # Free API endpoint (no API key required)
 EXCHANGE_RATE_API = "https://api.exchangerate-api.com/v4/latest/{base_currency}"
 
+# All pairs are derived from a single table quoted against this currency
+MATRIX_BASE_CURRENCY = "USD"
 
-async def get_exchange_rates(base_currency: str) -> Dict[str, float]:
+# How often the background refresher re-fetches rates (well within CACHE_DURATION)
+RATE_REFRESH_INTERVAL = timedelta(seconds=int(os.getenv("EXCHANGE_RATE_REFRESH_SECONDS", "1800")))
+
+logger = logging.getLogger(__name__)
+
+# Long-lived pooled client and refresher task, managed by the app lifespan
+_http_client: Optional[httpx.AsyncClient] = None
+_refresher_task: Optional[asyncio.Task] = None
+# Single-flight guard so concurrent cold-start misses trigger one upstream fetch
+_refresh_lock = asyncio.Lock()
+
+
+class RateMatrix:
     """
-    Get exchange rates for a base currency.
-    Uses caching to avoid hitting API rate limits.
+    Exchange rates between every pair of currencies, derived from one rate table.
+
+    The table holds units of each currency per 1 unit of the base currency (USD),
+    so any from -> to rate is the cross rate base_rates[to] / base_rates[from].
     """
-    cache_key = base_currency.upper()
-    now = datetime.now()
-    
+
+    def __init__(self, base_rates: Dict[str, float], fetched_at: datetime, base_currency: str = MATRIX_BASE_CURRENCY):
+        self.base_currency = base_currency.upper()
+        self.fetched_at = fetched_at
+        self._base_rates: Dict[str, Decimal] = {
+            code.upper(): Decimal(str(rate)) for code, rate in base_rates.items() if rate
+        }
+        self._base_rates[self.base_currency] = Decimal("1")
+
+    @property
+    def currencies(self) -> list:
+        return sorted(self._base_rates.keys())
+
+    @property
+    def base_rates(self) -> Dict[str, Decimal]:
+        """Units of each currency per 1 unit of the base currency"""
+        return dict(self._base_rates)
+
+    def has(self, currency: str) -> bool:
+        return currency.upper() in self._base_rates
+
+    def rate(self, from_currency: str, to_currency: str) -> Optional[Decimal]:
+        """Units of to_currency per 1 unit of from_currency, or None if either is unknown"""
+        from_code, to_code = from_currency.upper(), to_currency.upper()
+        if from_code == to_code:
+            return Decimal("1")
+        from_rate = self._base_rates.get(from_code)
+        to_rate = self._base_rates.get(to_code)
+        if from_rate is None or to_rate is None:
+            return None
+        return to_rate / from_rate
+
+    def rates_from(self, base_currency: str) -> Dict[str, float]:
+        """All rates with base_currency as the base, shaped like the upstream API's 'rates'"""
+        base_rate = self._base_rates.get(base_currency.upper())
+        if base_rate is None:
+            raise ValueError(f"Currency {base_currency} not found in exchange rates")
+        return {code: float(rate / base_rate) for code, rate in self._base_rates.items()}
+
+    def is_fresh(self, now: datetime) -> bool:
+        return now - self.fetched_at < CACHE_DURATION
+
+
+async def _fetch_usd_rates() -> Dict[str, float]:
+    """Fetch the USD-based rate table from the upstream API"""
+    url = EXCHANGE_RATE_API.format(base_currency=MATRIX_BASE_CURRENCY)
+    if _http_client is not None:
+        response = await _http_client.get(url)
+    else:
+        # Outside the app lifespan (scripts): use a one-off client
+        async with httpx.AsyncClient(timeout=5.0) as client:
+            response = await client.get(url)
+    response.raise_for_status()
+    data = response.json()
+    # Extract rates (API returns {"rates": {...}, "base": "USD", "date": "..."})
+    return data.get("rates", {})
+
+
+async def refresh_rate_matrix() -> RateMatrix:
+    """Fetch rates from upstream and swap in a new matrix"""
+    async with _refresh_lock:
+        return await _refresh_rate_matrix_locked()
+
+
+async def _refresh_rate_matrix_locked() -> RateMatrix:
+    """Fetch and swap in a new matrix. Caller must hold _refresh_lock."""
+    global _RATE_MATRIX_CACHE
+    rates = await _fetch_usd_rates()
+    _RATE_MATRIX_CACHE = RateMatrix(rates, fetched_at=datetime.now())
+    return _RATE_MATRIX_CACHE
+
+
+def store_rate_matrix(db: Session, matrix: RateMatrix, as_of: Optional[date] = None) -> int:
+    """
+    Persist a matrix's base rates as the snapshot for a day, replacing any earlier one that day.
+    Returns the number of rates stored.
+
+    Every worker stores the same day's snapshot, so rows are upserted: concurrent
+    writers overwrite each other's rates instead of failing on the primary key.
+    """
+    as_of = as_of or matrix.fetched_at.date()
+    rows = [
+        {"date": as_of, "base": matrix.base_currency, "quote": quote, "rate": rate}
+        for quote, rate in matrix.base_rates.items()
+    ]
+    # Quotes the upstream no longer lists drop out of the day's snapshot
+    db.query(ExchangeRate).filter(
+        ExchangeRate.date == as_of,
+        ExchangeRate.base == matrix.base_currency,
+        ExchangeRate.quote.not_in([row["quote"] for row in rows])
+    ).delete(synchronize_session=False)
+    if rows:
+        statement = _upsert_dialect(db).insert(ExchangeRate)
+        db.execute(statement.on_conflict_do_update(
+            index_elements=[ExchangeRate.base, ExchangeRate.quote, ExchangeRate.date],
+            set_={"rate": statement.excluded.rate}
+        ), rows)
+    db.commit()
+    return len(rows)
+
+
+def _upsert_dialect(db: Session):
+    """Dialect module providing insert(...).on_conflict_do_update (PostgreSQL and SQLite)"""
+    if db.bind.dialect.name == "sqlite":
+        return sqlite_dialect
+    return postgresql_dialect
+
+
+def load_rate_matrix(db: Session, as_of: Optional[date] = None) -> Optional[RateMatrix]:
+    """
+    Build a matrix from the latest stored snapshot on or before as_of (default: latest overall).
+    Returns None if no snapshot is stored.
+    """
+    latest_query = db.query(func.max(ExchangeRate.date)).filter(ExchangeRate.base == MATRIX_BASE_CURRENCY)
+    if as_of is not None:
+        latest_query = latest_query.filter(ExchangeRate.date <= as_of)
+    snapshot_date = latest_query.scalar()
+    if snapshot_date is None:
+        return None
+
+    rows = db.query(ExchangeRate.quote, ExchangeRate.rate).filter(
+        ExchangeRate.base == MATRIX_BASE_CURRENCY,
+        ExchangeRate.date == snapshot_date
+    ).all()
+    return RateMatrix(
+        {row.quote: row.rate for row in rows},
+        fetched_at=datetime.combine(snapshot_date, time.min)
+    )
+
+
+def _store_current_matrix():
+    db = SessionLocal()
+    try:
+        store_rate_matrix(db, _RATE_MATRIX_CACHE)
+    finally:
+        db.close()
+
+
+def _fill_missing_amount_idr() -> int:
+    db = SessionLocal()
+    try:
+        return rerate_expenses(db, _RATE_MATRIX_CACHE, only_missing=True)
+    finally:
+        db.close()
+
+
+def _load_latest_matrix() -> Optional[RateMatrix]:
+    db = SessionLocal()
+    try:
+        return load_rate_matrix(db)
+    finally:
+        db.close()
+
+
+async def _refresher_loop():
+    global _RATE_MATRIX_CACHE
+    if _RATE_MATRIX_CACHE is None:
+        # Warm start from the last stored snapshot, so restarts don't depend on the upstream
+        try:
+            _RATE_MATRIX_CACHE = await asyncio.to_thread(_load_latest_matrix)
+        except Exception as e:
+            logger.warning(f"Could not load stored exchange rates: {e}")
+
+    while True:
+        try:
+            await refresh_rate_matrix()
+            logger.info("Exchange rates refreshed")
+            # Record today's snapshot for as-of-date conversion of historical expenses
+            await asyncio.to_thread(_store_current_matrix)
+            # Materialize IDR amounts of expenses saved while no rate was known
+            filled = await asyncio.to_thread(_fill_missing_amount_idr)
+            if filled:
+                logger.info(f"Filled IDR amounts for {filled} expenses")
+        except Exception as e:
+            # Keep serving the previous matrix; try again next round
+            logger.warning(f"Exchange rate refresh failed: {e}")
+        await asyncio.sleep(RATE_REFRESH_INTERVAL.total_seconds())
+
+
+async def start_rate_refresher():
+    """
+    Start the background task that keeps the rate matrix fresh.
+    Called from the app lifespan; request handlers then only read from memory.
+    """
+    global _http_client, _refresher_task
+    if _refresher_task is not None and not _refresher_task.done():
+        return
+    _http_client = httpx.AsyncClient(
+        timeout=5.0,
+        limits=httpx.Limits(max_connections=4, max_keepalive_connections=2)
+    )
+    _refresher_task = asyncio.create_task(_refresher_loop())
+
+
+async def stop_rate_refresher():
+    """Stop the background refresher and close the pooled client"""
+    global _http_client, _refresher_task
+    if _refresher_task is not None:
+        _refresher_task.cancel()
+        try:
+            await _refresher_task
+        except asyncio.CancelledError:
+            pass
+        _refresher_task = None
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+async def get_rate_matrix() -> RateMatrix:
+    """
+    Get the rate matrix for all currency pairs.
+    One upstream fetch (cached for CACHE_DURATION) serves every pair.
+    Can also be used as a FastAPI dependency.
+
+    While the background refresher runs, this only reads from memory; the
+    upstream is hit on the request path only on a cold start, and then once
+    for all concurrent callers.
+    """
+    refresher_running = _refresher_task is not None and not _refresher_task.done()
+
     # Check cache
-    if cache_key in _EXCHANGE_RATE_CACHE:
-        cached_time, rates = _EXCHANGE_RATE_CACHE[cache_key]
-        if now - cached_time < CACHE_DURATION:
-            return rates
-    
+    matrix = _RATE_MATRIX_CACHE
+    if matrix is not None and (refresher_running or matrix.is_fresh(datetime.now())):
+        return matrix
+
     # Fetch from API
     try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            url = EXCHANGE_RATE_API.format(base_currency=base_currency.upper())
-            response = await client.get(url)
-            response.raise_for_status()
-            data = response.json()
-            
-            # Extract rates (API returns {"rates": {...}, "base": "USD", "date": "..."})
-            rates = data.get("rates", {})
-            
-            # Cache the result
-            _EXCHANGE_RATE_CACHE[cache_key] = (now, rates)
-            
-            return rates
+        async with _refresh_lock:
+            # Another caller may have fetched while we waited for the lock
+            matrix = _RATE_MATRIX_CACHE
+            if matrix is not None and matrix.is_fresh(datetime.now()):
+                return matrix
+            return await _refresh_rate_matrix_locked()
     except Exception as e:
-        # If API fails, check cache even if expired (better than nothing)
-        if cache_key in _EXCHANGE_RATE_CACHE:
-            _, rates = _EXCHANGE_RATE_CACHE[cache_key]
-            return rates
-        
+        # If API fails, use the cached matrix even if expired (better than nothing)
+        if _RATE_MATRIX_CACHE is not None:
+            return _RATE_MATRIX_CACHE
+
+        # Otherwise fall back to the last stored snapshot (offline operation)
+        try:
+            stored = await asyncio.to_thread(_load_latest_matrix)
+        except Exception:
+            stored = None
+        if stored is not None:
+            return stored
+
         # If no cache and API fails, raise error
         raise Exception(f"Failed to fetch exchange rates: {str(e)}")
 
 
+async def get_exchange_rates(base_currency: str) -> Dict[str, float]:
+    """
+    Get exchange rates for a base currency.
+    Derived locally from the cached rate matrix, so no per-base upstream request is made.
+    """
+    matrix = await get_rate_matrix()
+    return matrix.rates_from(base_currency)
+
+
+async def get_conversion_rates(
+    currencies: Iterable[str],
+    to_currency: str = "IDR"
+) -> Dict[str, Decimal]:
+    """
+    Get the rate from each currency into a target currency.
+
+    All rates come from one cached rate matrix lookup. Currencies the matrix
+    doesn't know (or every currency, if no rates are available) fall back to 1:1.
+
+    Returns:
+        Mapping of upper-cased currency code -> rate into to_currency
+    """
+    target = to_currency.upper()
+    try:
+        matrix = await get_rate_matrix()
+    except Exception:
+        matrix = None
+
+    conversion_rates: Dict[str, Decimal] = {}
+    for curr in {c.upper() for c in currencies if c}:
+        rate = matrix.rate(curr, target) if matrix is not None else None
+        if rate is None:
+            rate = Decimal("1.0")
+        conversion_rates[curr] = rate
+
+    return conversion_rates
+
+
+def conversion_case(
+    amount_column,
+    currency_column,
+    conversion_rates: Dict[str, Decimal],
+    keep_unknown: bool = True
+):
+    """
+    Build a SQL CASE expression that converts an amount column using pre-fetched rates.
+
+    Currencies without a rate are left unconverted, matching get_conversion_rates' 1:1 fallback,
+    or become NULL with keep_unknown=False.
+    """
+    unknown = amount_column if keep_unknown else null()
+    if not conversion_rates:
+        return unknown
+    return case(
+        *[
+            (func.upper(currency_column) == curr, amount_column * rate)
+            for curr, rate in conversion_rates.items()
+        ],
+        else_=unknown
+    )
+
+
+def _base_rate_as_of(currency_expr, date_column):
+    """Correlated subquery: latest stored base->currency rate on or before date_column"""
+    return select(ExchangeRate.rate).where(
+        ExchangeRate.base == MATRIX_BASE_CURRENCY,
+        ExchangeRate.quote == func.upper(currency_expr),
+        ExchangeRate.date <= date_column
+    ).order_by(ExchangeRate.date.desc()).limit(1).scalar_subquery()
+
+
+def historical_conversion_expr(
+    amount_column,
+    currency_column,
+    date_column,
+    to_currency: str,
+    fallback_rates: Dict[str, Decimal],
+    keep_unknown: bool = True
+):
+    """
+    Build a SQL expression converting each row at the rate in effect on its own date.
+
+    Uses the latest stored snapshot on or before the row's date. Rows dated before
+    the first snapshot, or in currencies never stored, use fallback_rates (today's
+    rates from get_conversion_rates); see conversion_case for keep_unknown.
+    """
+    target = to_currency.upper()
+    # Multiply by 1.0 so SQLite doesn't do integer division on whole-number rates
+    historical = (
+        amount_column * _base_rate_as_of(literal(target), date_column)
+        / (_base_rate_as_of(currency_column, date_column) * literal_column("1.0"))
+    )
+    return case(
+        (func.upper(currency_column) == target, amount_column),
+        else_=func.coalesce(
+            historical, conversion_case(amount_column, currency_column, fallback_rates, keep_unknown)
+        )
+    )
+
+
+def convert_currency_as_of(
+    db: Session,
+    amount: float,
+    from_currency: str,
+    to_currency: str,
+    as_of: date
+) -> Optional[float]:
+    """
+    Convert an amount at the stored rate in effect on a given date.
+    Returns None if no snapshot covers the date or the pair is unknown.
+    """
+    if from_currency.upper() == to_currency.upper():
+        return float(amount)
+    matrix = load_rate_matrix(db, as_of)
+    rate = matrix.rate(from_currency, to_currency) if matrix is not None else None
+    if rate is None:
+        return None
+    return float(Decimal(str(amount)) * rate)
+
+
+def amount_idr_expr(amount_idr_column, amount_column, currency_column, date_column, fallback_rates: Dict[str, Decimal]):
+    """
+    IDR amount of each row: the materialized amount_idr where set,
+    else converted on the fly like historical_conversion_expr.
+    """
+    return func.coalesce(
+        amount_idr_column,
+        historical_conversion_expr(amount_column, currency_column, date_column, "IDR", fallback_rates)
+    )
+
+
+async def compute_amount_idr(db: Session, amount: float, currency: str, as_of: date) -> Optional[Decimal]:
+    """
+    IDR amount to materialize for an expense: converted at the stored rate in effect
+    on its date, or at the current rate if no snapshot covers the date.
+    Returns None if no rate is known, so the refresher can fill it in later.
+    """
+    if currency.upper() == "IDR":
+        return Decimal(str(amount)).quantize(Decimal("0.01"))
+    matrix = load_rate_matrix(db, as_of)
+    rate = matrix.rate(currency, "IDR") if matrix is not None else None
+    if rate is None:
+        try:
+            rate = (await get_rate_matrix()).rate(currency, "IDR")
+        except Exception:
+            rate = None
+    if rate is None:
+        return None
+    return (Decimal(str(amount)) * rate).quantize(Decimal("0.01"))
+
+
+async def materialize_amount_idr(db: Session, expense_ids: List[UUID]) -> None:
+    """
+    Set amount_idr of many expenses in one UPDATE, with the rules of compute_amount_idr
+    (stored rate in effect on each date, else the current rate, else NULL).
+    Does not commit.
+    """
+    if not expense_ids:
+        return
+    current_rates: Dict[str, Decimal] = {}
+    try:
+        matrix = await get_rate_matrix()
+    except Exception:
+        matrix = None
+    if matrix is not None:
+        for (curr,) in db.query(Expense.currency).filter(Expense.id.in_(expense_ids)).distinct():
+            rate = matrix.rate(curr, "IDR") if curr else None
+            if rate is not None:
+                current_rates[curr.upper()] = rate
+    amount_idr = func.round(
+        historical_conversion_expr(
+            Expense.amount, Expense.currency, Expense.date, "IDR", current_rates, keep_unknown=False
+        ),
+        2
+    )
+    # Keep updated_at as set by the write itself
+    db.execute(
+        update(Expense).where(Expense.id.in_(expense_ids)).values(amount_idr=amount_idr, updated_at=Expense.updated_at),
+        execution_options={"synchronize_session": False}
+    )
+
+
+def rerate_expenses(
+    db: Session,
+    current_matrix: Optional[RateMatrix] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    only_missing: bool = False
+) -> int:
+    """
+    Recompute the materialized amount_idr of expenses in one UPDATE, using the same
+    rules as compute_amount_idr, and rebuild the affected monthly rollups.
+    current_matrix supplies rates for dates before the first stored snapshot.
+    Returns the number of rows updated.
+    """
+    filters = []
+    if start_date:
+        filters.append(Expense.date >= start_date)
+    if end_date:
+        filters.append(Expense.date <= end_date)
+    if only_missing:
+        filters.append(Expense.amount_idr.is_(None))
+
+    current_rates: Dict[str, Decimal] = {}
+    if current_matrix is not None:
+        for (curr,) in db.query(Expense.currency).filter(*filters).distinct():
+            rate = current_matrix.rate(curr, "IDR") if curr else None
+            if rate is not None:
+                current_rates[curr.upper()] = rate
+        if only_missing:
+            # Skip rows that would stay NULL, so periodic fills only touch convertible rows
+            filters.append(func.upper(Expense.currency).in_([*current_rates, "IDR"]))
+
+    amount_idr = func.round(
+        historical_conversion_expr(
+            Expense.amount, Expense.currency, Expense.date, "IDR", current_rates, keep_unknown=False
+        ),
+        2
+    )
+    # Keep updated_at as is: re-rating is not a user edit
+    updated_dates = db.execute(
+        update(Expense).where(*filters).values(amount_idr=amount_idr, updated_at=Expense.updated_at)
+        .returning(Expense.date),
+        execution_options={"synchronize_session": False}
+    ).scalars().all()
+    if updated_dates:
+        # Imported here: the rollup module builds on this one's conversion helpers
+        from app.services.rollup import rebuild_monthly_rollup
+        # Only the months holding re-rated rows, so a periodic fill of a few rows does
+        # not rewrite the whole rollup under concurrent incremental writers
+        for first_day, last_day in _month_runs(updated_dates):
+            rebuild_monthly_rollup(db, first_day, last_day)
+    db.commit()
+    if updated_dates:
+        analytics_snapshot.invalidate()
+        cache.invalidate_tags("dashboard")
+    return len(updated_dates)
+
+
+def _month_runs(dates: Iterable[date]) -> List[Tuple[date, date]]:
+    """(first day, last day) of each run of consecutive calendar months holding any of the dates"""
+    months = sorted({d.year * 12 + d.month - 1 for d in dates})
+    runs = []
+    for month in months:
+        if runs and runs[-1][1] == month - 1:
+            runs[-1][1] = month
+        else:
+            runs.append([month, month])
+    return [
+        (date(first // 12, first % 12 + 1, 1), date((last + 1) // 12, (last + 1) % 12 + 1, 1) - timedelta(days=1))
+        for first, last in runs
+    ]
+
+
 async def convert_currency(
     amount: float,
     from_currency: str,
@@ -71,22 +572,57 @@ async def convert_currency(
     if from_currency.upper() == to_currency.upper():
         return float(amount)
     
-    # Get exchange rates from source currency
-    rates = await get_exchange_rates(from_currency)
+    matrix = await get_rate_matrix()
     
     # Get target currency rate
-    target_rate = rates.get(to_currency.upper())
-    if target_rate is None:
+    rate = matrix.rate(from_currency, to_currency)
+    if rate is None:
         raise ValueError(
-            f"Currency {to_currency} not found in exchange rates. "
-            f"Available currencies: {list(rates.keys())[:10]}..."
+            f"Currency pair {from_currency}->{to_currency} not found in exchange rates. "
+            f"Available currencies: {matrix.currencies[:10]}..."
         )
     
-    # Convert: amount * target_rate
-    converted = float(Decimal(str(amount)) * Decimal(str(target_rate)))
+    # Convert: amount * rate
+    converted = float(Decimal(str(amount)) * rate)
     return converted
 
 
+async def convert_currency_batch(
+    amounts: Sequence[float],
+    from_currencies: Sequence[str],
+    to_currencies: Sequence[str]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Convert many amounts at once using the cached rate matrix.
+
+    Each currency code is mapped to its base rate once, then every cross rate
+    and product is computed as one array operation.
+
+    Returns:
+        (converted, known): converted amounts, and a mask that is False where a
+        currency was unknown (those amounts are returned unconverted)
+    """
+    matrix = await get_rate_matrix()
+    base_rates = matrix.base_rates
+    codes = list(base_rates.keys())
+    index = {code: i for i, code in enumerate(codes)}
+    # Trailing NaN slot: unknown currencies index -1 and propagate NaN
+    table = np.array([float(base_rates[code]) for code in codes] + [np.nan], dtype=np.float64)
+
+    from_codes = np.array([c.upper() for c in from_currencies], dtype=object)
+    to_codes = np.array([c.upper() for c in to_currencies], dtype=object)
+    from_idx = np.fromiter((index.get(c, -1) for c in from_codes), dtype=np.intp, count=len(from_codes))
+    to_idx = np.fromiter((index.get(c, -1) for c in to_codes), dtype=np.intp, count=len(to_codes))
+
+    values = np.asarray(amounts, dtype=np.float64)
+    converted = values * table[to_idx] / table[from_idx]
+
+    same = from_codes == to_codes
+    known = same | ~np.isnan(converted)
+    converted = np.where(known & ~same, converted, values)
+    return converted, known
+
+
 def convert_currency_sync(
     amount: float,
     from_currency: str,
@@ -0,0 +1,157 @@
+"""
+Spending distribution statistics: percentiles, histograms and outlier counts.
+
+On PostgreSQL everything is summarized in the database with percentile_cont and
+width_bucket, so only one row per category (and per category and bucket) comes
+back. Other databases (SQLite) fetch the matching IDR amounts and summarize
+them with NumPy using the same definitions.
+"""
+from typing import Dict, List, Optional
+from uuid import UUID
+
+import numpy as np
+from sqlalchemy import case, func, literal, or_
+from sqlalchemy.orm import Session
+
+from app.models.expense import Expense
+
+# Reported percentiles (percentile_cont, i.e. linear interpolation)
+PERCENTILES = (0.25, 0.5, 0.75, 0.9, 0.99)
+
+# Tukey fences: amounts more than this many interquartile ranges beyond the quartiles are outliers
+OUTLIER_IQR_FACTOR = 1.5
+
+
+def _percentile_label(q: float) -> str:
+    return f"p{round(q * 100)}"
+
+
+def _group_stats(count: int, low, high, quantiles, histogram, outlier_count: int) -> dict:
+    return {
+        "count": int(count),
+        "min": float(low),
+        "max": float(high),
+        "percentiles": {_percentile_label(q): float(value) for q, value in zip(PERCENTILES, quantiles)},
+        "outlier_count": int(outlier_count),
+        "histogram": [int(c) for c in histogram],
+    }
+
+
+def spending_distribution(db: Session, amount_expr, filters: List, bins: int) -> Optional[dict]:
+    """
+    Distribution of amount_expr over expenses matching filters.
+
+    Returns None when nothing matches, else {"bin_edges": [...], "overall": stats,
+    "categories": {category_id: stats}}. Stats hold count, min, max, percentiles,
+    outlier_count (against the group's own fences) and histogram counts over the
+    shared bin_edges, which split the overall [min, max] into equal-width bins.
+    """
+    if db.bind.dialect.name == "postgresql":
+        return _distribution_in_database(db, amount_expr, filters, bins)
+    return _distribution_with_numpy(db, amount_expr, filters, bins)
+
+
+def _bin_edges(low: float, high: float, bins: int) -> List[float]:
+    return np.linspace(low, high, bins + 1).tolist()
+
+
+def _distribution_in_database(db: Session, amount, filters: List, bins: int) -> Optional[dict]:
+    def stats_columns():
+        return [
+            func.count(Expense.id).label('count'),
+            func.min(amount).label('min'),
+            func.max(amount).label('max'),
+            *[func.percentile_cont(q).within_group(amount).label(_percentile_label(q)) for q in PERCENTILES],
+        ]
+
+    overall = db.query(*stats_columns()).filter(*filters).one()
+    if not overall.count:
+        return None
+    by_category = db.query(Expense.category_id.label('category_id'), *stats_columns()).filter(
+        *filters
+    ).group_by(Expense.category_id).all()
+
+    # Histogram bucket (1..bins) and outlier flags in one pass, joined to each category's quartiles
+    low, high = overall.min, overall.max
+    if high > low:
+        # width_bucket puts the maximum itself in bucket bins + 1
+        bucket = func.least(func.width_bucket(amount, low, high, bins), bins)
+    else:
+        bucket = literal(1)
+    quartiles = db.query(
+        Expense.category_id.label('fence_category_id'),
+        func.percentile_cont(0.25).within_group(amount).label('q1'),
+        func.percentile_cont(0.75).within_group(amount).label('q3')
+    ).filter(*filters).group_by(Expense.category_id).subquery()
+    spread = OUTLIER_IQR_FACTOR * (quartiles.c.q3 - quartiles.c.q1)
+    overall_spread = OUTLIER_IQR_FACTOR * (overall.p75 - overall.p25)
+    rows = db.query(
+        Expense.category_id.label('category_id'),
+        bucket.label('bucket'),
+        func.count(Expense.id).label('count'),
+        func.sum(case(
+            (or_(amount < quartiles.c.q1 - spread, amount > quartiles.c.q3 + spread), 1), else_=0
+        )).label('category_outliers'),
+        func.sum(case(
+            (or_(amount < overall.p25 - overall_spread, amount > overall.p75 + overall_spread), 1), else_=0
+        )).label('overall_outliers')
+    ).join(
+        quartiles, Expense.category_id.isnot_distinct_from(quartiles.c.fence_category_id)
+    ).filter(*filters).group_by(Expense.category_id, 'bucket').all()
+
+    histograms: Dict[Optional[UUID], List[int]] = {row.category_id: [0] * bins for row in by_category}
+    outliers: Dict[Optional[UUID], int] = {row.category_id: 0 for row in by_category}
+    overall_histogram = [0] * bins
+    overall_outliers = 0
+    for row in rows:
+        histograms[row.category_id][int(row.bucket) - 1] += row.count
+        overall_histogram[int(row.bucket) - 1] += row.count
+        outliers[row.category_id] += int(row.category_outliers or 0)
+        overall_outliers += int(row.overall_outliers or 0)
+
+    def quantiles(row):
+        return [getattr(row, _percentile_label(q)) for q in PERCENTILES]
+
+    return {
+        "bin_edges": _bin_edges(float(low), float(high), bins),
+        "overall": _group_stats(overall.count, low, high, quantiles(overall), overall_histogram, overall_outliers),
+        "categories": {
+            row.category_id: _group_stats(
+                row.count, row.min, row.max, quantiles(row), histograms[row.category_id], outliers[row.category_id]
+            )
+            for row in by_category
+        },
+    }
+
+
+def _distribution_with_numpy(db: Session, amount, filters: List, bins: int) -> Optional[dict]:
+    rows = db.query(Expense.category_id, amount).filter(*filters).all()
+    if not rows:
+        return None
+    amounts = np.fromiter((float(row[1]) for row in rows), dtype=np.float64, count=len(rows))
+    category_ids = list({row[0] for row in rows})
+    category_index = {category_id: index for index, category_id in enumerate(category_ids)}
+    codes = np.fromiter((category_index[row[0]] for row in rows), dtype=np.int64, count=len(rows))
+
+    low, high = float(amounts.min()), float(amounts.max())
+    if high > low:
+        buckets = np.minimum(np.floor((amounts - low) / (high - low) * bins).astype(np.int64), bins - 1)
+    else:
+        buckets = np.zeros(len(amounts), dtype=np.int64)
+    histograms = np.bincount(codes * bins + buckets, minlength=len(category_ids) * bins).reshape(-1, bins)
+
+    def group_stats(values: np.ndarray, histogram) -> dict:
+        quantiles = np.percentile(values, [q * 100 for q in PERCENTILES])
+        q1, q3 = quantiles[PERCENTILES.index(0.25)], quantiles[PERCENTILES.index(0.75)]
+        spread = OUTLIER_IQR_FACTOR * (q3 - q1)
+        outlier_count = np.count_nonzero((values < q1 - spread) | (values > q3 + spread))
+        return _group_stats(len(values), values.min(), values.max(), quantiles, histogram, outlier_count)
+
+    return {
+        "bin_edges": _bin_edges(low, high, bins),
+        "overall": group_stats(amounts, histograms.sum(axis=0)),
+        "categories": {
+            category_id: group_stats(amounts[codes == index], histograms[index])
+            for index, category_id in enumerate(category_ids)
+        },
+    }
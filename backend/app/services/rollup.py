@@ -0,0 +1,182 @@
+"""
+Monthly expense rollup maintenance and read helpers.
+
+Writers apply each expense's contribution to expense_monthly_rollup in the same
+transaction as the expense itself. Readers use the rollup instead of scanning
+expenses when a date range covers whole months.
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+import uuid
+
+from sqlalchemy import case, extract, func, insert, update
+from sqlalchemy.orm import Session
+
+from app.models.expense import Expense
+from app.models.expense_rollup import ExpenseMonthlyRollup
+from app.services.currency import conversion_case
+
+
+def apply_expense_to_rollup(db: Session, expense: Expense, sign: int = 1):
+    """
+    Add (sign=1) or remove (sign=-1) an expense's contribution to its month's rollup.
+    Does not commit; call it before the commit that writes the expense.
+    """
+    batch = RollupBatch()
+    batch.add(expense, sign)
+    batch.apply(db)
+
+
+class RollupBatch:
+    """
+    Contributions of many expenses, summed per rollup group so each group is
+    written once (bulk writes). add() reads the expense immediately, so an
+    expense's old contribution can be removed before it is modified.
+    """
+
+    def __init__(self):
+        # (year, month, currency, category_id) -> [total, count, total_idr, unrated_total]
+        self._groups: Dict[Tuple, list] = {}
+
+    def add(self, expense: Expense, sign: int = 1):
+        """Add (sign=1) or remove (sign=-1) an expense's contribution"""
+        amount = Decimal(str(expense.amount)) * sign
+        if expense.amount_idr is not None:
+            total_idr, unrated_total = Decimal(str(expense.amount_idr)) * sign, Decimal("0")
+        else:
+            total_idr, unrated_total = Decimal("0"), amount
+        key = (expense.date.year, expense.date.month, expense.currency, expense.category_id)
+        group = self._groups.setdefault(key, [Decimal("0"), 0, Decimal("0"), Decimal("0")])
+        group[0] += amount
+        group[1] += sign
+        group[2] += total_idr
+        group[3] += unrated_total
+
+    def apply(self, db: Session):
+        """Write the summed contributions. Does not commit."""
+        R = ExpenseMonthlyRollup
+        for (year, month, currency, category_id), (total, count, total_idr, unrated_total) in self._groups.items():
+            if not (total or count or total_idr or unrated_total):
+                # Contributions cancelled out, e.g. an update that only changed the description
+                continue
+            group = [
+                R.year == year,
+                R.month == month,
+                R.currency == currency,
+                R.category_id.is_(None) if category_id is None else R.category_id == category_id,
+            ]
+            # Update a single row of the group: duplicates from concurrent inserts are summed by readers
+            row_id = db.query(R.id).filter(*group).limit(1).scalar()
+            updated = 0
+            if row_id is not None:
+                updated = db.execute(
+                    update(R).where(R.id == row_id).values(
+                        total=R.total + total,
+                        count=R.count + count,
+                        total_idr=R.total_idr + total_idr,
+                        unrated_total=R.unrated_total + unrated_total
+                    )
+                ).rowcount
+            # The row may have been deleted since it was selected (e.g. by a concurrent
+            # rebuild); the contribution then starts a new row of the group
+            if not updated:
+                db.execute(
+                    insert(R).values(
+                        id=uuid.uuid4(),
+                        year=year,
+                        month=month,
+                        category_id=category_id,
+                        currency=currency,
+                        total=total,
+                        count=count,
+                        total_idr=total_idr,
+                        unrated_total=unrated_total
+                    )
+                )
+        self._groups.clear()
+
+
+def rebuild_monthly_rollup(db: Session, start_date: Optional[date] = None, end_date: Optional[date] = None) -> int:
+    """
+    Recompute rollup rows from expenses for every month touching [start_date, end_date]
+    (all months if unset). Does not commit. Returns the number of rollup rows written.
+    """
+    R = ExpenseMonthlyRollup
+    start = date(start_date.year, start_date.month, 1) if start_date else None
+    end = _month_end(end_date) if end_date else None
+
+    db.query(R).filter(*month_range_filters(start, end)).delete(synchronize_session=False)
+
+    year = extract('year', Expense.date)
+    month = extract('month', Expense.date)
+    query = db.query(
+        year.label('year'),
+        month.label('month'),
+        Expense.category_id,
+        Expense.currency,
+        func.sum(Expense.amount).label('total'),
+        func.count(Expense.id).label('count'),
+        func.coalesce(func.sum(Expense.amount_idr), 0).label('total_idr'),
+        func.sum(case((Expense.amount_idr.is_(None), Expense.amount), else_=0)).label('unrated_total')
+    )
+    if start:
+        query = query.filter(Expense.date >= start)
+    if end:
+        query = query.filter(Expense.date <= end)
+    rows = [
+        {
+            "id": uuid.uuid4(),
+            "year": int(row.year),
+            "month": int(row.month),
+            "category_id": row.category_id,
+            "currency": row.currency,
+            "total": row.total,
+            "count": row.count,
+            "total_idr": row.total_idr,
+            "unrated_total": row.unrated_total,
+        }
+        for row in query.group_by(year, month, Expense.category_id, Expense.currency)
+    ]
+    if rows:
+        db.execute(insert(R), rows)
+    return len(rows)
+
+
+def _month_end(d: date) -> date:
+    next_month = date(d.year + 1, 1, 1) if d.month == 12 else date(d.year, d.month + 1, 1)
+    return next_month - timedelta(days=1)
+
+
+def is_month_aligned(start_date: Optional[date], end_date: Optional[date]) -> bool:
+    """Whether a range (open ends allowed) covers whole months, so it can be served from the rollup"""
+    if start_date and start_date.day != 1:
+        return False
+    if end_date and _month_end(end_date) != end_date:
+        return False
+    return True
+
+
+def month_range_filters(start_date: Optional[date], end_date: Optional[date]) -> List:
+    """Rollup filters for the months from start_date's month through end_date's month"""
+    month_index = ExpenseMonthlyRollup.year * 12 + ExpenseMonthlyRollup.month
+    filters = []
+    if start_date:
+        filters.append(month_index >= start_date.year * 12 + start_date.month)
+    if end_date:
+        filters.append(month_index <= end_date.year * 12 + end_date.month)
+    return filters
+
+
+def unrated_rollup_currencies(db: Session, filters: List) -> List[str]:
+    """Currencies with expenses in range that have no amount_idr yet"""
+    R = ExpenseMonthlyRollup
+    return [
+        row[0] for row in db.query(R.currency).filter(*filters, R.unrated_total != 0).distinct().all()
+    ]
+
+
+def rollup_amount_idr(fallback_rates: Dict[str, Decimal]):
+    """IDR total of a rollup row: materialized amounts plus unrated amounts converted at fallback_rates"""
+    R = ExpenseMonthlyRollup
+    return R.total_idr + conversion_case(R.unrated_total, R.currency, fallback_rates)
@@ -0,0 +1,93 @@
+"""
+Indexed description search for expenses.
+
+PostgreSQL matches a prefix tsquery against to_tsvector('simple', description)
+(GIN expression index) or the raw term as a substring (pg_trgm GIN index), and
+ranks with ts_rank_cd. SQLite matches an FTS5 trigram table kept in sync by
+triggers and ranks with bm25. Both indexes come from migration 016; without
+them search falls back to ILIKE, which matches the same substrings unranked.
+"""
+from typing import Optional, Tuple
+import re
+
+from sqlalchemy import column, func, literal_column, select, table, text
+from sqlalchemy.orm import Query, Session
+
+from app.models.expense import Expense
+
+# Text search configuration of the GIN expression index. 'simple' neither stems
+# nor drops stop words, so it works for descriptions in any language.
+TEXT_SEARCH_CONFIG = "simple"
+
+# SQLite FTS5 table created by migration 016
+FTS_TABLE = "expenses_fts"
+
+# FTS5 trigram tokens are three characters; shorter words cannot use the index
+TRIGRAM_LENGTH = 3
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+_fts = table(FTS_TABLE, column("expense_id"), column("description"))
+
+# Whether the FTS5 table exists, per engine
+_fts_available = {}
+
+
+def apply_description_search(db: Session, query: Query, term: str) -> Tuple[Query, Optional[object]]:
+    """
+    Restrict an Expense query to descriptions matching term. Returns the query and
+    a relevance expression to order by (higher is better), or None when unranked.
+    """
+    dialect = db.bind.dialect.name
+    if dialect == "postgresql":
+        return _postgres_search(query, term)
+    if dialect == "sqlite" and _has_fts_table(db):
+        return _sqlite_search(query, term)
+    return query.filter(Expense.description.ilike(f"%{term}%")), None
+
+
+def description_tsvector():
+    """The indexed expression; queries must repeat it exactly for the planner to use the GIN index"""
+    return func.to_tsvector(literal_column(f"'{TEXT_SEARCH_CONFIG}'"), Expense.description)
+
+
+def _postgres_search(query: Query, term: str):
+    substring = Expense.description.ilike(f"%{term}%")
+    words = _WORD.findall(term.lower())
+    if not words:
+        return query.filter(substring), None
+    # Every word as a prefix, so partially typed words still match whole ones
+    tsquery = func.to_tsquery(
+        literal_column(f"'{TEXT_SEARCH_CONFIG}'"), " & ".join(f"{word}:*" for word in words)
+    )
+    tsvector = description_tsvector()
+    return query.filter(tsvector.op("@@")(tsquery) | substring), func.ts_rank_cd(tsvector, tsquery)
+
+
+def _sqlite_search(query: Query, term: str):
+    words = _WORD.findall(term)
+    indexed = [word for word in words if len(word) >= TRIGRAM_LENGTH]
+    if not indexed:
+        return query.filter(Expense.description.ilike(f"%{term}%")), None
+    # Each word as a quoted trigram phrase (a case-insensitive substring), all required.
+    # The FTS lookup runs once and is joined, rather than re-run per row for its rank.
+    match = " ".join(f'"{word}"' for word in indexed)
+    ranked = select(
+        _fts.c.expense_id,
+        # bm25 is lower for better matches
+        (-func.bm25(literal_column(FTS_TABLE))).label("rank")
+    ).where(literal_column(FTS_TABLE).op("MATCH")(match)).subquery()
+    query = query.join(ranked, Expense.id == ranked.c.expense_id)
+    for word in words:
+        if len(word) < TRIGRAM_LENGTH:
+            query = query.filter(Expense.description.ilike(f"%{word}%"))
+    return query, ranked.c.rank
+
+
+def _has_fts_table(db: Session) -> bool:
+    engine = db.get_bind()
+    if engine not in _fts_available:
+        _fts_available[engine] = db.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": FTS_TABLE}
+        ).first() is not None
+    return _fts_available[engine]
@@ -0,0 +1,147 @@
+"""
+Background warm-up of popular cached requests.
+
+A CacheWarmer counts how often each request (a JSON-serializable spec such as a
+dashboard date range) is made. At startup and after cache invalidations it
+recomputes the most popular ones in the background, so users rarely hit a cold
+cache. Invalidations are debounced: a burst of writes triggers one pass.
+Popularity is saved to a small JSON file so a restart warms the same requests.
+"""
+from collections import Counter
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+import asyncio
+import json
+import logging
+import os
+import threading
+
+from app.services.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+class CacheWarmer:
+    """
+    Records request specs and re-runs warm(spec) for the top_n most requested
+    ones debounce_seconds after the last cache invalidation.
+    warm must populate the cache itself (e.g. via cache.get_or_compute), so specs
+    that are still cached cost nothing.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        warm: Callable[[Tuple], Awaitable[Any]],
+        top_n: int = 10,
+        debounce_seconds: float = 2.0,
+        state_path: Optional[str] = None,
+        max_tracked: int = 500
+    ):
+        self.name = name
+        self.top_n = top_n
+        self.debounce_seconds = debounce_seconds
+        self.state_path = state_path
+        self.max_tracked = max_tracked
+        self._warm = warm
+        self._counts: Counter = Counter()
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._task: Optional["asyncio.Task"] = None
+        # Set when an invalidation arrives during a pass, so the pass runs once more
+        self._rerun = False
+
+    def record(self, spec: Tuple):
+        """Count one request for spec"""
+        with self._lock:
+            self._counts[spec] += 1
+            if len(self._counts) > self.max_tracked:
+                # Forget the long tail, keeping the counts of the popular specs
+                self._counts = Counter(dict(self._counts.most_common(self.max_tracked // 2)))
+
+    def popular(self) -> List[Tuple]:
+        """The top_n most requested specs, most popular first"""
+        with self._lock:
+            return [spec for spec, _ in self._counts.most_common(self.top_n)]
+
+    def start(self):
+        """Load saved popularity, listen for invalidations and schedule a startup pass"""
+        self._loop = asyncio.get_running_loop()
+        self._load_state()
+        cache.add_invalidation_listener(self.schedule)
+        self.schedule()
+
+    async def stop(self):
+        """Stop listening and cancel any pending or running pass"""
+        cache.remove_invalidation_listener(self.schedule)
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._save_state()
+        self._loop = None
+
+    def schedule(self):
+        """Request a warm-up pass (debounced). Safe to call from any thread."""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(self._restart_timer)
+
+    def _restart_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = self._loop.call_later(self.debounce_seconds, self._start_pass)
+
+    def _start_pass(self):
+        self._timer = None
+        if self._task is not None and not self._task.done():
+            self._rerun = True
+            return
+        self._task = self._loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            self._rerun = False
+            specs = self.popular()
+            warmed = 0
+            for spec in specs:
+                try:
+                    await self._warm(spec)
+                    warmed += 1
+                except Exception as e:
+                    logger.warning(f"Warming {self.name} {spec} failed: {e}")
+            if specs:
+                logger.info(f"Warmed {warmed}/{len(specs)} popular {self.name} requests")
+            await asyncio.to_thread(self._save_state)
+            if not self._rerun:
+                return
+
+    def _load_state(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path) as f:
+                saved = json.load(f)
+            with self._lock:
+                for spec, count in saved:
+                    self._counts[tuple(spec)] += count
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning(f"Could not load {self.name} warm-up state from {self.state_path}: {e}")
+
+    def _save_state(self):
+        if not self.state_path:
+            return
+        with self._lock:
+            saved = [[list(spec), count] for spec, count in self._counts.most_common(self.max_tracked)]
+        try:
+            with open(self.state_path, "w") as f:
+                json.dump(saved, f)
+        except OSError as e:
+            logger.warning(f"Could not save {self.name} warm-up state to {self.state_path}: {e}")
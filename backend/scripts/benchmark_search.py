@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Benchmark expense description search against the plain ILIKE scan it replaced.
+
+For each term, prints how many expenses match, the median query time of both
+approaches, and the query plan of the indexed search (EXPLAIN ANALYZE on
+PostgreSQL, EXPLAIN QUERY PLAN on SQLite) so you can check the GIN / FTS5
+indexes from migration 016 are used.
+
+Usage:
+    poetry run python scripts/benchmark_search.py                          # default terms
+    poetry run python scripts/benchmark_search.py --term coffee --term "grab food" --runs 20
+"""
+import sys
+import argparse
+import statistics
+import time
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import text
+
+from app.database import SessionLocal
+from app.models.expense import Expense
+from app.services.search import apply_description_search
+
+DEFAULT_TERMS = ["coffee", "lunch", "grab", "rent", "fo"]
+
+
+def _timed(query, runs: int):
+    """Median wall time in milliseconds and the result of the last run"""
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        ids = query.all()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), ids
+
+
+def _plan(db, query) -> str:
+    sql = str(query.statement.compile(bind=db.get_bind(), compile_kwargs={"literal_binds": True}))
+    if db.bind.dialect.name == "postgresql":
+        rows = db.execute(text(f"EXPLAIN (ANALYZE, BUFFERS) {sql}")).all()
+        return "\n".join(row[0] for row in rows)
+    rows = db.execute(text(f"EXPLAIN QUERY PLAN {sql}")).all()
+    return "\n".join(row[-1] for row in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark indexed expense search against ILIKE")
+    parser.add_argument("--term", action="append", dest="terms", help="Search term (repeatable)")
+    parser.add_argument("--runs", type=int, default=10, help="Timed runs per query (default: 10)")
+    parser.add_argument("--no-plan", action="store_true", help="Skip printing query plans")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        total = db.query(Expense.id).count()
+        print(f"Dialect: {db.bind.dialect.name}, expenses: {total}, runs per query: {args.runs}\n")
+        for term in args.terms or DEFAULT_TERMS:
+            baseline = db.query(Expense.id).filter(Expense.description.ilike(f"%{term}%"))
+            indexed, rank = apply_description_search(db, db.query(Expense.id), term)
+            if rank is not None:
+                indexed = indexed.order_by(rank.desc())
+
+            baseline_ms, baseline_ids = _timed(baseline, args.runs)
+            indexed_ms, indexed_ids = _timed(indexed, args.runs)
+            print(f"'{term}': ILIKE {len(baseline_ids)} rows in {baseline_ms:.2f} ms, "
+                  f"indexed {len(indexed_ids)} rows in {indexed_ms:.2f} ms")
+            if not args.no_plan:
+                print(_plan(db, indexed))
+            print()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
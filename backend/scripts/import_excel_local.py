@@ -13,6 +13,7 @@ Or with options:
 """
 import sys
 import argparse
+import asyncio
 import os
 import logging
 import re
@@ -32,6 +33,8 @@ from app.models.expense import Expense
 from app.models.category import Category
 from app.services.excel_import import ExcelImportService
 from app.schemas.expense import ExpenseCreate
+from app.services.currency import get_rate_matrix, rerate_expenses
+from app.services.rollup import apply_expense_to_rollup
 
 # Configure logging
 logging.basicConfig(
@@ -272,6 +275,7 @@ def process_batch(expenses_batch: List[Dict], all_categories: List[Category],
             # Create expense
             db_expense = Expense(**expense_create.model_dump())
             db.add(db_expense)
+            apply_expense_to_rollup(db, db_expense)
             imported_count += 1
             
         except Exception as e:
@@ -587,6 +591,16 @@ Examples:
         if len(parse_errors) > 5:
             logger.warning(f"  ... and {len(parse_errors) - 5} more")
     
+    # Materialize IDR amounts for the imported expenses in one statement
+    if imported_count > 0:
+        try:
+            rate_matrix = asyncio.run(get_rate_matrix())
+        except Exception as e:
+            logger.warning(f"Could not fetch exchange rates, IDR amounts use stored rates only: {str(e)}")
+            rate_matrix = None
+        filled = rerate_expenses(db, rate_matrix, only_missing=True)
+        logger.info(f"✓ Computed IDR amounts for {filled} expenses")
+    
     db.close()
     
     if imported_count > 0:
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Load exchange rates into the exchange_rates table.
+
+Usage:
+    poetry run python scripts/load_exchange_rates.py            # store today's rates from the API
+    poetry run python scripts/load_exchange_rates.py rates.json # backfill historical USD-based rates
+
+The JSON file maps dates to USD-based rates:
+    {"2025-01-31": {"IDR": 16250.5, "EUR": 0.96, ...}, ...}
+"""
+import sys
+import json
+import asyncio
+from pathlib import Path
+from datetime import date, datetime, time
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.database import SessionLocal
+from app.services.currency import RateMatrix, get_rate_matrix, store_rate_matrix
+
+
+def load_from_file(json_path: Path):
+    """Backfill historical rates from a JSON file"""
+    with open(json_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    db = SessionLocal()
+    try:
+        stored = 0
+        for date_str, rates in sorted(data.items()):
+            as_of = date.fromisoformat(date_str)
+            matrix = RateMatrix(rates, fetched_at=datetime.combine(as_of, time.min))
+            stored += store_rate_matrix(db, matrix, as_of)
+        print(f"✓ Stored {stored} rates for {len(data)} days")
+    finally:
+        db.close()
+
+
+def load_latest():
+    """Store today's rates from the upstream API"""
+    matrix = asyncio.run(get_rate_matrix())
+    db = SessionLocal()
+    try:
+        stored = store_rate_matrix(db, matrix)
+        print(f"✓ Stored {stored} rates for {matrix.fetched_at.date().isoformat()}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        load_from_file(Path(sys.argv[1]))
+    else:
+        load_latest()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Recompute the materialized amount_idr of expenses.
+
+Run after backfilling historical rates (scripts/load_exchange_rates.py) so
+existing expenses pick up the rate in effect on their dates.
+
+Usage:
+    poetry run python scripts/rerate_expenses.py                      # all expenses
+    poetry run python scripts/rerate_expenses.py --missing-only       # only rows without amount_idr
+    poetry run python scripts/rerate_expenses.py --start 2025-01-01 --end 2025-12-31
+"""
+import sys
+import argparse
+import asyncio
+from pathlib import Path
+from datetime import date
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.database import SessionLocal
+from app.services.currency import get_rate_matrix, rerate_expenses
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute IDR amounts of expenses")
+    parser.add_argument("--start", type=date.fromisoformat, help="First expense date to re-rate (YYYY-MM-DD)")
+    parser.add_argument("--end", type=date.fromisoformat, help="Last expense date to re-rate (YYYY-MM-DD)")
+    parser.add_argument("--missing-only", action="store_true", help="Only fill expenses without an IDR amount")
+    args = parser.parse_args()
+
+    # Current rates cover expenses dated before the first stored snapshot
+    try:
+        rate_matrix = asyncio.run(get_rate_matrix())
+    except Exception as e:
+        print(f"⚠️  Could not fetch exchange rates, using stored rates only: {e}")
+        rate_matrix = None
+
+    db = SessionLocal()
+    try:
+        updated = rerate_expenses(db, rate_matrix, args.start, args.end, only_missing=args.missing_only)
+        print(f"✓ Re-rated {updated} expenses")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -11,7 +11,7 @@ const EXPENSES_PER_PAGE = 100;
 
 const Expenses = () => {
   const [showFutureExpenses, setShowFutureExpenses] = useState(false);
-  const [userFilters, setUserFilters] = useState<Omit<ExpenseFiltersType, 'skip' | 'limit'>>({});
+  const [userFilters, setUserFilters] = useState<Omit<ExpenseFiltersType, 'skip' | 'limit' | 'cursor'>>({});
   const [showForm, setShowForm] = useState(false);
   const [editingExpense, setEditingExpense] = useState<string | null>(null);
   const queryClient = useQueryClient();
@@ -60,27 +60,21 @@ const Expenses = () => {
     isLoading,
   } = useInfiniteQuery({
     queryKey: ['expenses', baseFilters],
-    queryFn: ({ pageParam = 0 }) => {
-      return expensesApi.getAll({
+    queryFn: ({ pageParam }) => {
+      return expensesApi.getPage({
         ...baseFilters,
-        skip: pageParam,
+        cursor: pageParam,
         limit: EXPENSES_PER_PAGE,
       });
     },
-    getNextPageParam: (lastPage, allPages) => {
-      // If we got fewer expenses than requested, we've reached the end
-      if (lastPage.length < EXPENSES_PER_PAGE) {
-        return undefined;
-      }
-      // Otherwise, return the next skip value
-      return allPages.length * EXPENSES_PER_PAGE;
-    },
-    initialPageParam: 0,
+    // The server returns a cursor only when more expenses follow
+    getNextPageParam: (lastPage) => lastPage.next_cursor ?? undefined,
+    initialPageParam: undefined as string | undefined,
   });
 
   // Flatten all pages into a single array
   const expenses = useMemo(() => {
-    return data?.pages.flat() || [];
+    return data?.pages.flatMap((page) => page.expenses) || [];
   }, [data]);
 
   const deleteMutation = useMutation({
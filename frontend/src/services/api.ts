@@ -4,6 +4,9 @@ import type {
   ExpenseCreate,
   ExpenseUpdate,
   ExpenseFilters,
+  ExpensePage,
+  ExpenseBulkRequest,
+  ExpenseBulkResult,
   Category,
   CategoryCreate,
   Budget,
@@ -11,6 +14,8 @@ import type {
   SummaryReport,
   TrendData,
   CategoryBreakdown,
+  PeriodComparison,
+  SpendingDistribution,
   TopExpensesResponse,
   RentExpense,
   RentExpenseCreate,
@@ -89,6 +94,19 @@ export const expensesApi = {
     });
     return response.data;
   },
+  // Cursor-paginated listing: pass the returned next_cursor back as filters.cursor
+  getPage: async (filters?: ExpenseFilters): Promise<ExpensePage> => {
+    const response = await api.get<Expense[]>('/expenses', {
+      params: filters,
+      paramsSerializer: {
+        indexes: null
+      }
+    });
+    return {
+      expenses: response.data,
+      next_cursor: response.headers['x-next-cursor'] ?? null,
+    };
+  },
   getById: async (id: string): Promise<Expense> => {
     const response = await api.get<Expense>(`/expenses/${id}`);
     return response.data;
@@ -104,6 +122,10 @@ export const expensesApi = {
   delete: async (id: string): Promise<void> => {
     await api.delete(`/expenses/${id}`);
   },
+  bulk: async (data: ExpenseBulkRequest): Promise<ExpenseBulkResult> => {
+    const response = await api.post<ExpenseBulkResult>('/expenses/bulk', data);
+    return response.data;
+  },
 };
 
 // Categories
@@ -188,6 +210,29 @@ export const reportsApi = {
     });
     return response.data;
   },
+  comparePeriods: async (periodValue?: string, periodType?: string): Promise<PeriodComparison> => {
+    const params: any = {};
+    if (periodValue) params.period_value = periodValue;
+    if (periodType) params.period_type = periodType;
+    const response = await api.get<PeriodComparison>('/reports/compare', {
+      params,
+    });
+    return response.data;
+  },
+  getDistribution: async (periodType?: string, periodValue?: string, categoryIds?: string[], bins?: number): Promise<SpendingDistribution> => {
+    const params: any = {};
+    if (periodType) params.period_type = periodType;
+    if (periodValue) params.period_value = periodValue;
+    if (categoryIds && categoryIds.length > 0) params.category_ids = categoryIds;
+    if (bins) params.bins = bins;
+    const response = await api.get<SpendingDistribution>('/reports/distribution', {
+      params,
+      paramsSerializer: {
+        indexes: null // Serialize arrays as repeated parameters (key=val1&key=val2) instead of brackets
+      }
+    });
+    return response.data;
+  },
   getTopExpenses: async (periodType?: string, periodValue?: string, categoryId?: string, categoryIds?: string[], skip?: number, limit?: number): Promise<TopExpensesResponse> => {
     const params: any = { period_type: periodType || 'monthly', limit: limit || 50 };
     if (periodValue) {
@@ -402,4 +447,26 @@ export const historyApi = {
   },
 };
 
+// Currency
+export interface CurrencyConversionItem {
+  amount: number;
+  from_currency: string;
+  to_currency?: string;
+}
+
+export interface CurrencyConversionResult {
+  original_amount: number;
+  original_currency: string;
+  converted_amount: number;
+  converted_currency: string;
+  error: string | null;
+}
+
+export const currencyApi = {
+  convertBatch: async (items: CurrencyConversionItem[]): Promise<CurrencyConversionResult[]> => {
+    const response = await api.post<{ results: CurrencyConversionResult[] }>('/currency/convert-batch', { items });
+    return response.data.results;
+  },
+};
+
 export default api;
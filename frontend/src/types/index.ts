@@ -62,6 +62,19 @@ export interface ExpenseUpdate {
   is_recurring?: boolean;
 }
 
+// POST /expenses/bulk: all operations apply in one transaction (at most 1000 in total)
+export interface ExpenseBulkRequest {
+  create?: ExpenseCreate[];
+  update?: (ExpenseUpdate & { id: string })[];
+  delete?: string[];
+}
+
+export interface ExpenseBulkResult {
+  created: Expense[];
+  updated: Expense[];
+  deleted: string[];
+}
+
 export interface CategoryCreate {
   name: string;
   icon?: string | null;
@@ -86,8 +99,15 @@ export interface ExpenseFilters {
   min_amount?: number;
   max_amount?: number;
   search?: string;
+  sort?: 'date' | 'relevance'; // relevance requires search and pages with skip only
   skip?: number;
   limit?: number;
+  cursor?: string; // Opaque cursor from a previous page; takes precedence over skip
+}
+
+export interface ExpensePage {
+  expenses: Expense[];
+  next_cursor: string | null; // null on the last page
 }
 
 export interface SummaryReport {
@@ -121,6 +141,63 @@ export interface CategoryBreakdown {
   }>;
 }
 
+export interface PeriodTotals {
+  total: number;
+  count: number;
+}
+
+export interface PeriodChange {
+  amount: number;
+  percent: number | null;
+}
+
+export interface PeriodComparison {
+  period_type: string;
+  currency: string;
+  periods: Record<'current' | 'previous' | 'year_over_year', {
+    period_value: string;
+    start_date: string;
+    end_date: string;
+  }>;
+  totals: {
+    current: PeriodTotals;
+    previous: PeriodTotals;
+    year_over_year: PeriodTotals;
+    change_vs_previous: PeriodChange;
+    change_vs_year_over_year: PeriodChange;
+  };
+  categories: Array<{
+    category_id: string;
+    category_name: string;
+    current: PeriodTotals;
+    previous: PeriodTotals;
+    year_over_year: PeriodTotals;
+    change_vs_previous: PeriodChange;
+    change_vs_year_over_year: PeriodChange;
+  }>;
+}
+
+export interface DistributionStats {
+  count: number;
+  min: number;
+  max: number;
+  percentiles: Record<'p25' | 'p50' | 'p75' | 'p90' | 'p99', number>;
+  outlier_count: number;
+  histogram: number[];
+}
+
+export interface SpendingDistribution {
+  start_date: string;
+  end_date: string;
+  currency: string;
+  bin_edges: number[];
+  overall: DistributionStats | null;
+  categories: Array<DistributionStats & {
+    category_id: string;
+    category_name: string;
+  }>;
+}
+
 export interface TopExpensesResponse {
   period_type: string;
   period_value?: string | null;